@@ -1,41 +1,28 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from functools import wraps
 from flask import current_app, session
 from werkzeug.security import check_password_hash
-import bleach
+from sanitize import strip_tags
 from models import db, Category, Article, SearchLog
+from stats import dashboard_stats
+from signals import article_changed, category_changed
+from pagination import paginate_keyset
+from images import image_pipeline, InvalidImage
+from metrics import metrics
+from bulk import ArticleImporter, export_articles, read_upload
+from queries import categories_with_article_counts, category_has_articles
 from datetime import datetime
-import os
-from werkzeug.utils import secure_filename
-from sqlalchemy import func
-import bleach.css_sanitizer
-
-# Configure bleach to allow specific HTML tags and attributes
-ALLOWED_TAGS = [
-    'p', 'br', 'strong', 'em', 'u', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-    'ul', 'ol', 'li', 'blockquote', 'code', 'pre', 'hr', 'table', 'thead',
-    'tbody', 'tr', 'th', 'td', 'a', 'img', 'div', 'span'
-]
-
-ALLOWED_ATTRIBUTES = {
-    '*': ['class', 'style'],
-    'a': ['href', 'title', 'target'],
-    'img': ['src', 'alt', 'title', 'width', 'height', 'class']
-}
-
-ALLOWED_STYLES = [
-    'text-align', 'margin', 'padding', 'width', 'height',
-    'font-weight', 'font-style', 'text-decoration',
-    'color', 'background-color'
-]
+import hmac
+import json
+import io
+import csv
+import zipfile
+from sqlalchemy import func, case
+from sqlalchemy.orm import joinedload
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-UPLOAD_FOLDER = 'static/uploads'
 
-# Create CSS sanitizer
-css_sanitizer = bleach.css_sanitizer.CSSSanitizer(
-    allowed_css_properties=ALLOWED_STYLES
-)
+IMPORT_EXTENSIONS = ('.jsonl', '.ndjson', '.zip')
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -48,84 +35,18 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def clean_content(content):
-    """Clean and sanitize HTML content while preserving safe styles"""
-    allowed_tags = [
-        'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'em', 'u', 'ol', 'ul', 'li', 
-        'br', 'hr', 'a', 'img', 'blockquote', 'code', 'pre', 'div', 'span', 'table', 
-        'thead', 'tbody', 'tr', 'th', 'td'
-    ]
-    
-    allowed_attributes = {
-        '*': ['class', 'style', 'id'],
-        'a': ['href', 'title', 'target'],
-        'img': ['src', 'alt', 'title', 'width', 'height'],
-        'td': ['colspan', 'rowspan'],
-        'th': ['colspan', 'rowspan', 'scope']
-    }
-    
-    allowed_protocols = ['http', 'https', 'mailto']
-    
-    # First pass: clean the HTML
-    cleaned = bleach.clean(
-        content,
-        tags=allowed_tags,
-        attributes=allowed_attributes,
-        protocols=allowed_protocols,
-        strip=True,
-        strip_comments=True
-    )
-    
-    # Second pass: clean styles using bleach-allowlist
-    final_cleaned = bleach.clean(
-        cleaned,
-        tags=allowed_tags,
-        attributes=allowed_attributes,
-        protocols=allowed_protocols,
-        css_sanitizer=css_sanitizer,
-        strip=True,
-        strip_comments=True
-    )
-    
-    return final_cleaned
-
 admin = Blueprint('admin', __name__, url_prefix='/admin')
 
 @admin.route('/')
 @admin_required
 def index():
-    # Get all data
-    categories = Category.query.all()
-    articles = Article.query.all()
-    total_views = sum(article.views for article in articles)
-    total_searches = db.session.query(db.func.count(SearchLog.id)).scalar() or 0
-    recent_articles = Article.query.order_by(Article.created_at.desc()).limit(5).all()
-    popular_searches = SearchLog.get_popular_searches(10)
-    
-    # Get search metrics for the pie chart
-    searches_with_results = db.session.query(func.count(SearchLog.id)).filter(SearchLog.results_count > 0).scalar() or 0
-    searches_no_results = total_searches - searches_with_results
-    
-    # Calculate statistics
-    stats = {
-        'total_articles': len(articles),
-        'total_views': total_views,
-        'total_categories': len(categories),
-        'average_rating': sum(article.get_rating_percentage() for article in articles) / len(articles) if articles else 0,
-        'search_metrics': {
-            'with_results': searches_with_results,
-            'no_results': searches_no_results
-        }
-    }
-    
+    stats = dashboard_stats.get()
     return render_template('admin/index.html', 
                          stats=stats,
-                         categories=categories,
-                         articles=articles,
-                         total_views=total_views,
-                         total_searches=total_searches,
-                         recent_articles=recent_articles,
-                         popular_searches=popular_searches)
+                         total_views=stats['total_views'],
+                         total_searches=stats['total_searches'],
+                         recent_articles=stats['recent_articles'],
+                         popular_searches=stats['popular_searches'])
 
 @admin.route('/login', methods=['GET', 'POST'])
 def login():
@@ -149,7 +70,7 @@ def logout():
 @admin.route('/categories')
 @admin_required
 def categories():
-    categories = Category.query.order_by(Category.order).all()
+    categories = categories_with_article_counts()
     return render_template('admin/categories.html', categories=categories)
 
 @admin.route('/categories/add', methods=['POST'])
@@ -171,8 +92,8 @@ def add_category():
         return redirect(url_for('admin.categories'))
     
     # Sanitize input
-    name = bleach.clean(name, tags=[], strip=True)
-    description = bleach.clean(description, tags=[], strip=True)
+    name = strip_tags(name)
+    description = strip_tags(description)
     
     # Get the highest order value
     max_order = db.session.query(db.func.max(Category.order)).scalar() or 0
@@ -182,6 +103,7 @@ def add_category():
     
     try:
         db.session.commit()
+        category_changed.send(current_app._get_current_object(), category_id=category.id)
         flash('Category added successfully', 'success')
     except:
         db.session.rollback()
@@ -208,8 +130,8 @@ def edit_category(id):
         return redirect(url_for('admin.categories'))
     
     # Sanitize input
-    name = bleach.clean(name, tags=[], strip=True)
-    description = bleach.clean(description, tags=[], strip=True)
+    name = strip_tags(name)
+    description = strip_tags(description)
     
     category = Category.query.get_or_404(id)
     category.name = name
@@ -217,6 +139,7 @@ def edit_category(id):
     
     try:
         db.session.commit()
+        category_changed.send(current_app._get_current_object(), category_id=id)
         flash('Category updated successfully', 'success')
     except:
         db.session.rollback()
@@ -229,13 +152,14 @@ def edit_category(id):
 def delete_category(id):
     category = Category.query.get_or_404(id)
     
-    if category.articles:
+    if category_has_articles(id):
         flash('Cannot delete category that has articles', 'danger')
         return redirect(url_for('admin.categories'))
     
     try:
         db.session.delete(category)
         db.session.commit()
+        category_changed.send(current_app._get_current_object(), category_id=id)
         flash('Category deleted successfully', 'success')
     except:
         db.session.rollback()
@@ -246,7 +170,8 @@ def delete_category(id):
 @admin.route('/articles')
 @admin_required
 def articles():
-    articles = Article.query.order_by(Article.created_at.desc()).all()
+    articles = Article.query.options(joinedload(Article.category))\
+        .order_by(Article.created_at.desc()).all()
     categories = Category.query.order_by(Category.name).all()
     return render_template('admin/articles.html', articles=articles, categories=categories)
 
@@ -266,10 +191,9 @@ def add_article():
         flash('Title must be less than 200 characters', 'danger')
         return redirect(url_for('admin.articles'))
     
-    # Sanitize input
-    title = bleach.clean(title, tags=[], strip=True)
-    content = bleach.clean(content, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, css_sanitizer=css_sanitizer, strip=True)
-    keywords = bleach.clean(keywords, tags=[], strip=True)
+    # Sanitize input. Content is sanitized when it is assigned to the article.
+    title = strip_tags(title)
+    keywords = strip_tags(keywords)
     
     article = Article(
         title=title,
@@ -285,6 +209,8 @@ def add_article():
     
     try:
         db.session.commit()
+        article_changed.send(current_app._get_current_object(), article_id=article.id,
+                             category_ids={article.category_id})
         flash('Article added successfully', 'success')
     except:
         db.session.rollback()
@@ -308,12 +234,12 @@ def edit_article(id):
         flash('Title must be less than 200 characters', 'danger')
         return redirect(url_for('admin.articles'))
     
-    # Sanitize input
-    title = bleach.clean(title, tags=[], strip=True)
-    content = bleach.clean(content, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, css_sanitizer=css_sanitizer, strip=True)
-    keywords = bleach.clean(keywords, tags=[], strip=True)
+    # Sanitize input. Content is sanitized when it is assigned to the article.
+    title = strip_tags(title)
+    keywords = strip_tags(keywords)
     
     article = Article.query.get_or_404(id)
+    previous_category_id = article.category_id
     article.title = title
     article.content = content
     article.category_id = category_id
@@ -325,6 +251,8 @@ def edit_article(id):
     
     try:
         db.session.commit()
+        article_changed.send(current_app._get_current_object(), article_id=id,
+                             category_ids={previous_category_id, article.category_id})
         flash('Article updated successfully', 'success')
     except:
         db.session.rollback()
@@ -336,10 +264,13 @@ def edit_article(id):
 @admin_required
 def delete_article(id):
     article = Article.query.get_or_404(id)
+    category_id = article.category_id
     
     try:
         db.session.delete(article)
         db.session.commit()
+        article_changed.send(current_app._get_current_object(), article_id=id,
+                             category_ids={category_id})
         flash('Article deleted successfully', 'success')
     except:
         db.session.rollback()
@@ -359,11 +290,45 @@ def reorder_categories():
                 category.order = index
         
         db.session.commit()
+        category_changed.send(current_app._get_current_object(), category_id=None)
         return jsonify({'message': 'Categories reordered successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@admin.route('/articles/import', methods=['POST'])
+@admin_required
+def bulk_import():
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'error': 'No file provided'}), 400
+    if not file.filename.lower().endswith(IMPORT_EXTENSIONS):
+        return jsonify({'error': 'Upload a .jsonl file or a .zip of HTML files'}), 400
+
+    importer = ArticleImporter(batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                               workers=current_app.config['IMPORT_WORKERS'])
+    records = read_upload(file.stream, file.filename, request.form.get('category') or None)
+
+    def generate():
+        # One JSON line per committed batch, then the summary
+        try:
+            for progress in importer.run(records):
+                yield json.dumps(progress) + '\n'
+        except zipfile.BadZipFile:
+            yield json.dumps({'error': 'Not a valid zip file', 'done': True}) + '\n'
+        except Exception:
+            current_app.logger.exception('Article import failed')
+            yield json.dumps({'error': 'Import failed, batches already reported were saved', 'done': True}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@admin.route('/articles/export.jsonl')
+@admin_required
+def bulk_export():
+    return Response(stream_with_context(export_articles()), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename=articles.jsonl'
+    })
+
 @admin.route('/upload', methods=['POST'])
 @admin_required
 def upload_image():
@@ -375,29 +340,33 @@ def upload_image():
         return jsonify({'error': 'No file selected'}), 400
     
     if file and allowed_file(file.filename):
-        # Secure the filename and create upload directory if it doesn't exist
-        filename = secure_filename(file.filename)
-        upload_path = os.path.join(current_app.root_path, UPLOAD_FOLDER)
-        os.makedirs(upload_path, exist_ok=True)
-        
-        # Save the file
-        file_path = os.path.join(upload_path, filename)
-        file.save(file_path)
-        
-        # Return the URL for TinyMCE
-        url = url_for('static', filename=f'uploads/{filename}')
-        return jsonify({
-            'location': url
-        })
+        # Stored by content hash; resized WebP variants are made by a background job
+        try:
+            image = image_pipeline.store(file.stream)
+        except InvalidImage as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(image)
     
     return jsonify({'error': 'Invalid file type'}), 400
 
+@admin.route('/metrics')
+def metrics_endpoint():
+    # Scrapers can't log in, so they may present METRICS_TOKEN instead
+    token = metrics.token
+    authorization = request.headers.get('Authorization', '')
+    authorized = session.get('admin_logged_in') or (
+        token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    )
+    if not authorized:
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @admin.route('/search-report')
 @admin_required
 def search_report():
-    total_searches = db.session.query(db.func.count(SearchLog.id)).scalar() or 0
+    total_searches = db.session.query(db.func.sum(SearchLog.search_count)).scalar() or 0
     avg_results = db.session.query(db.func.avg(SearchLog.results_count)).scalar() or 0
-    no_results_count = db.session.query(db.func.count(SearchLog.id))\
+    no_results_count = db.session.query(db.func.sum(SearchLog.search_count))\
         .filter(SearchLog.results_count == 0).scalar() or 0
     no_results_rate = (no_results_count / total_searches * 100) if total_searches > 0 else 0
     
@@ -410,38 +379,135 @@ def search_report():
                          no_results_rate=no_results_rate,
                          searches=searches)
 
-@admin.route('/api/search-logs')
-@admin_required
-def get_search_logs():
-    searches = SearchLog.query.order_by(SearchLog.created_at.desc()).all()
-    return jsonify([{
+SEARCH_LOG_SORT_COLUMNS = {
+    'created_at': SearchLog.created_at,
+    'search_count': SearchLog.search_count,
+    'results_count': SearchLog.results_count,
+    'term': SearchLog.normalized_term
+}
+SEARCH_LOG_PAGE_SIZE = 50
+SEARCH_LOG_MAX_PAGE_SIZE = 500
+
+def parse_datetime_arg(name):
+    """Parse an ISO date or datetime query argument, raising ValueError if invalid"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+def filtered_search_logs():
+    """SearchLog query with the report filters from the request applied"""
+    query = SearchLog.query
+
+    since = parse_datetime_arg('since')
+    until = parse_datetime_arg('until')
+    if since:
+        query = query.filter(SearchLog.created_at >= since)
+    if until:
+        query = query.filter(SearchLog.created_at < until)
+
+    if request.args.get('no_results', 'false').lower() == 'true':
+        query = query.filter(SearchLog.results_count == 0)
+
+    term = request.args.get('q', '').strip().lower()[:100]
+    if term:
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(SearchLog.normalized_term.like(f'%{escaped}%', escape='\\'))
+
+    return query
+
+def search_log_to_dict(search):
+    return {
         'term': search.term,
+        'search_count': search.search_count,
         'results_count': search.results_count,
         'created_at': search.created_at.isoformat(),
         'ip_address': search.ip_address
-    } for search in searches])
+    }
+
+@admin.route('/api/search-logs')
+@admin_required
+def get_search_logs():
+    sort = request.args.get('sort', 'created_at')
+    if sort not in SEARCH_LOG_SORT_COLUMNS:
+        return jsonify({'error': 'Invalid sort column'}), 400
+    descending = request.args.get('order', 'desc').lower() != 'asc'
+
+    try:
+        limit = int(request.args.get('limit', SEARCH_LOG_PAGE_SIZE))
+        query = filtered_search_logs()
+    except ValueError:
+        return jsonify({'error': 'Invalid filter value'}), 400
+    limit = max(1, min(limit, SEARCH_LOG_MAX_PAGE_SIZE))
+
+    searches, next_cursor = paginate_keyset(
+        query,
+        [SEARCH_LOG_SORT_COLUMNS[sort], SearchLog.id],
+        cursor=request.args.get('cursor'),
+        limit=limit,
+        descending=descending
+    )
+    response = {
+        'items': [search_log_to_dict(search) for search in searches],
+        'next_cursor': next_cursor
+    }
+
+    # Totals for the filtered range are only needed once, with the first page
+    if not request.args.get('cursor'):
+        total_searches, avg_results, no_results = query.with_entities(
+            func.coalesce(func.sum(SearchLog.search_count), 0),
+            func.coalesce(func.avg(SearchLog.results_count), 0),
+            func.coalesce(func.sum(case((SearchLog.results_count == 0, SearchLog.search_count), else_=0)), 0)
+        ).one()
+        response['summary'] = {
+            'total_searches': int(total_searches),
+            'avg_results': float(avg_results),
+            'no_results_rate': (no_results / total_searches * 100) if total_searches else 0
+        }
+
+    return jsonify(response)
+
+@admin.route('/api/search-logs/export.csv')
+@admin_required
+def export_search_logs():
+    try:
+        query = filtered_search_logs()
+    except ValueError:
+        return jsonify({'error': 'Invalid filter value'}), 400
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Search Term', 'Searches', 'Results', 'Last Searched', 'IP Address'])
+        # Rows are fetched and written in chunks so memory use stays flat
+        for search in query.order_by(SearchLog.created_at.desc(), SearchLog.id.desc()).yield_per(1000):
+            writer.writerow([search.term, search.search_count, search.results_count,
+                             search.created_at.isoformat(), search.ip_address or ''])
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype='text/csv', headers={
+        'Content-Disposition': 'attachment; filename=search_report.csv'
+    })
 
 @admin.route('/dashboard-data')
 @admin_required
 def dashboard_data():
-    # Get search metrics for the pie chart
-    total_searches = db.session.query(func.count(SearchLog.id)).scalar() or 0
-    searches_with_results = db.session.query(func.count(SearchLog.id)).filter(SearchLog.results_count > 0).scalar() or 0
-    searches_no_results = total_searches - searches_with_results
-    
+    stats = dashboard_stats.get()
     return jsonify({
-        'search_metrics': {
-            'with_results': searches_with_results,
-            'no_results': searches_no_results
-        }
+        'categories_count': stats['total_categories'],
+        'articles_count': stats['total_articles'],
+        'total_views': stats['total_views'],
+        'total_searches': stats['total_searches'],
+        'average_rating': stats['average_rating'],
+        'search_metrics': stats['search_metrics'],
+        'recent_articles': [dict(article,
+                                 created_at=article['created_at'].isoformat(),
+                                 updated_at=article['updated_at'].isoformat())
+                            for article in stats['recent_articles']],
+        'popular_searches': [dict(search, last_searched=search['last_searched'].isoformat())
+                             for search in stats['popular_searches']]
     })
-
-# Log changes
-with open('changes.log', 'a') as f:
-    f.write('\n[{}] Added rich text article support\n'.format(
-        datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    ))
-    f.write('- Added TinyMCE rich text editor\n')
-    f.write('- Added article management (CRUD operations)\n')
-    f.write('- Added proper HTML sanitization for articles\n')
-    f.write('- Added responsive article management interface\n')
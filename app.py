@@ -1,130 +1,190 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, abort
+from markupsafe import Markup
 from werkzeug.security import generate_password_hash
+import logging
 import os
-import bleach
 from extensions import db
-from models import Category, Article, SearchLog
-from datetime import datetime
+from database import configure_database, database_url_from_env, init_engines, init_read_replica
+from models import Category, Article
+from search_index import search_results, results_for_ids, parse_fields
+from suggestions import suggestion_index
+from related import related_index
+from jobs import job_queue
+from images import image_pipeline
+from instrumentation import instrumentation
+from metrics import metrics
+from signals import article_changed
+from counters import view_counter, vote_counter
+from search_logging import search_log_queue
+from stats import dashboard_stats
+from queries import (categories_with_article_counts, category_articles, recent_articles,
+                     articles_by_keyword, keyword_facets, related_articles, article_view_count)
+from page_cache import page_cache
+from http_caching import (conditional, content_validators, article_validators,
+                          not_modified, not_modified_response, apply_validators)
 from flask_migrate import Migrate
-from sqlalchemy import func, or_
+from sanitize import POLICY_VERSION, strip_tags, escape_text, set_escape_cache_size
+from commands import register_commands
 
-def create_app():
+logger = logging.getLogger(__name__)
+
+# Stands in for the view count in cached article pages, see render_article_page()
+VIEW_COUNT_PLACEHOLDER = Markup('<!--view-count-->')
+
+def create_app(config=None):
     app = Flask(__name__)
 
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')  # Change in production
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///kb.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url_from_env()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['TEMPLATES_AUTO_RELOAD'] = True
+    app.config['CATEGORY_PAGE_SIZE'] = 50  # Articles per page on category pages
+    app.config['IMPORT_BATCH_SIZE'] = 500  # Articles per transaction in bulk imports
+    app.config['IMPORT_WORKERS'] = None  # Processes sanitizing imports; None for up to 4
+    app.config['ESCAPE_TEXT_CACHE_SIZE'] = 4096  # Escaped titles and names kept in memory
 
     # Set up admin credentials (in production, these should come from environment variables)
     app.config['ADMIN_USERNAME'] = 'admin'
     app.config['ADMIN_PASSWORD_HASH'] = generate_password_hash('admin123')
 
+    # Apply overrides (e.g. from tests) before extensions read the configuration
+    if config:
+        app.config.update(config)
+
     # Initialize extensions
+    configure_database(app)
     db.init_app(app)
-    migrate = Migrate(app, db)  # Initialize Flask-Migrate
+    init_engines(app)
+    init_read_replica(app)
+    instrumentation.init_app(app)
+    metrics.init_app(app)
+    # Found from any working directory, e.g. when init_database() stamps a new database
+    migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+    view_counter.init_app(app)
+    app.config.setdefault('VOTE_BUFFER_FLUSH_INTERVAL', 0)  # Write votes through unless configured
+    vote_counter.init_app(app)
+    search_log_queue.init_app(app)
+    dashboard_stats.init_app(app)
+    page_cache.init_app(app)
+    suggestion_index.init_app(app)
+    related_index.init_app(app)
+    job_queue.init_app(app)
+    image_pipeline.init_app(app)
+    set_escape_cache_size(app.config['ESCAPE_TEXT_CACHE_SIZE'])
+    register_commands(app)
 
     # Import and register blueprints
     from admin import admin
     app.register_blueprint(admin)
 
-    # Create database tables
-    with app.app_context():
-        db.create_all()  # Only create tables if they don't exist
-        
-        # Add sample data if database is empty
-        if Category.query.count() == 0:
-            categories = [
-                Category(name='General'),
-                Category(name='Technology'),
-                Category(name='Business')
-            ]
-            db.session.add_all(categories)
-            db.session.commit()
-            
-            articles = [
-                Article(
-                    title='Welcome to Knowledge Base',
-                    content='Welcome to our knowledge base system. Here you will find helpful articles and guides.',
-                    keywords='help,guide,introduction,getting started',
-                    category_id=1
-                ),
-                Article(
-                    title='Getting Started with Technology',
-                    content='Learn about the latest technology trends and how to stay up to date.',
-                    keywords='tech,trends,innovation,learning',
-                    category_id=2
-                ),
-                Article(
-                    title='Business Best Practices',
-                    content='Discover the best practices for running a successful business.',
-                    keywords='business,management,success,strategy',
-                    category_id=3
-                )
-            ]
-            db.session.add_all(articles)
-            db.session.commit()
-
     # Define routes
     @app.route('/')
+    @conditional(lambda: content_validators())
+    @page_cache.cached(tags=lambda: ['articles', 'categories'])
     def index():
         # Get categories ordered by the order field
         categories = Category.query.order_by(Category.order).all()
-        recent_articles = Article.query.order_by(Article.created_at.desc()).limit(5).all()
-        return render_template('index.html', categories=categories, recent_articles=recent_articles)
+        return render_template('index.html', categories=categories, recent_articles=recent_articles(5))
 
     @app.route('/category/<int:category_id>')
+    @conditional(lambda category_id: content_validators())
+    @page_cache.cached(tags=lambda category_id: [f'category:{category_id}', 'categories', 'category-counts'],
+                       query_args=('page', 'cursor'))
     def category(category_id):
         category = Category.query.get_or_404(category_id)
-        return render_template('category.html', category=category)
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = app.config['CATEGORY_PAGE_SIZE']
+
+        articles, next_cursor = category_articles(
+            category_id, page=page, per_page=per_page, cursor=request.args.get('cursor')
+        )
+        categories = categories_with_article_counts()
+        article_count = next((cat.article_count for cat in categories if cat.id == category_id), 0)
+
+        return render_template('category.html',
+                               category=category,
+                               articles=articles,
+                               categories=categories,
+                               page=page,
+                               total_pages=max(1, -(-article_count // per_page)),
+                               next_cursor=next_cursor)
 
     @app.route('/article/<int:article_id>')
     def article(article_id):
-        article = Article.query.get_or_404(article_id)
-        article.increment_views()
-        return render_template('article.html', article=article)
+        validators = article_validators(article_id)
+        if validators is None:
+            abort(404)
+
+        # Every request is counted, including revalidations answered with a 304
+        view_counter.increment(article_id, 'views')
+        if not_modified(validators):
+            return not_modified_response(validators)
+
+        html = render_article_page(article_id)
+        html = html.replace(VIEW_COUNT_PLACEHOLDER, str(article_view_count(article_id)), 1)
+        return apply_validators(app.make_response(html), validators)
+
+    def render_article_page(article_id):
+        def render():
+            article = Article.query.get_or_404(article_id)
+            return render_template('article.html', article=article, related=related_articles(article_id),
+                                   view_count=VIEW_COUNT_PLACEHOLDER)
+
+        # The view count changes on every request, so it is left out of the cached
+        # page and filled in afterwards. Pages rendered under an older sanitization
+        # policy are not reused.
+        return page_cache.fragment(f'article:{article_id}:{POLICY_VERSION}',
+                                   [f'article:{article_id}', 'categories'], render)
+
+    @job_queue.task('warm-article-page')
+    def warm_article_page(article_id):
+        with app.test_request_context(f'/article/{article_id}'):
+            if db.session.get(Article, article_id) is not None:
+                render_article_page(article_id)
+
+    def queue_article_page_warming(sender, article_id=None, **kwargs):
+        # Re-render edited articles in the background so the next reader gets a cache hit
+        if page_cache.backend is not None and article_id is not None:
+            job_queue.submit('warm-article-page', article_id)
+
+    article_changed.connect(queue_article_page_warming, sender=app, weak=False)
 
     @app.route('/article/<int:article_id>/rate', methods=['POST'])
     def rate_article(article_id):
-        print(f"Received rating request for article {article_id}")
         article = Article.query.get_or_404(article_id)
         data = request.get_json()
-        print(f"Request data: {data}")
         
         if not isinstance(data, dict) or 'vote' not in data:
-            print("Invalid request: missing vote data")
+            logger.info('Rejected vote article_id=%s reason=missing_vote', article_id)
             return jsonify({'error': 'Invalid request'}), 400
             
         vote = data['vote']
         if vote not in ['up', 'down']:
-            print(f"Invalid vote type: {vote}")
+            logger.info('Rejected vote article_id=%s reason=invalid_vote vote=%r', article_id, vote)
             return jsonify({'error': 'Invalid vote type'}), 400
             
-        if vote == 'up':
-            article.upvotes = (article.upvotes or 0) + 1
-            print(f"Incrementing upvotes to {article.upvotes}")
-        else:
-            article.downvotes = (article.downvotes or 0) + 1
-            print(f"Incrementing downvotes to {article.downvotes}")
-            
         try:
-            db.session.commit()
-            print("Successfully saved vote to database")
-        except Exception as e:
-            print(f"Error saving vote: {str(e)}")
-            db.session.rollback()
+            article.add_vote(vote)
+        except Exception:
+            logger.exception('Failed to record vote article_id=%s vote=%s', article_id, vote)
             return jsonify({'error': 'Database error'}), 500
+        logger.debug('Recorded vote article_id=%s vote=%s', article_id, vote)
+
+        # Reload the counts so votes from concurrent requests are included
+        db.session.refresh(article)
+        page_cache.invalidate(f'article:{article_id}')
         
         response_data = {
-            'upvotes': article.upvotes,
-            'downvotes': article.downvotes,
+            'upvotes': article.upvote_count,
+            'downvotes': article.downvote_count,
             'rating_percentage': article.get_rating_percentage()
         }
-        print(f"Sending response: {response_data}")
         return jsonify(response_data)
 
     @app.route('/search')
+    # Logged searches always run so they are recorded
+    @conditional(lambda: None if request.args.get('log', 'false').lower() == 'true' else content_validators())
     def search():
         query = request.args.get('q', '')
         should_log = request.args.get('log', 'false').lower() == 'true'
@@ -133,51 +193,83 @@ def create_app():
             return jsonify([])
         
         # Sanitize input
-        sanitized_query = bleach.clean(query, tags=[], strip=True)
+        sanitized_query = strip_tags(query)
         
-        # Search in title, content, and keywords
-        articles = Article.query.filter(
-            or_(
-                Article.title.ilike(f'%{sanitized_query}%'),
-                Article.content.ilike(f'%{sanitized_query}%'),
-                Article.keywords.ilike(f'%{sanitized_query}%')
-            )
-        ).limit(10).all()
+        # Search in title, body text, and keywords, ranked by relevance. Only the
+        # requested fields are loaded, never the article body.
+        fields = parse_fields(request.args.get('fields'))
+        results = search_results(sanitized_query, fields, limit=10)
+        if not results:
+            # Near misses such as typos are matched against the in-memory index
+            matches = suggestion_index.fuzzy(sanitized_query, limit=10)
+            results = results_for_ids([article_id for article_id, _ in matches], fields)
         
-        # Only log completed searches (when form is submitted)
+        # Only log completed searches (when form is submitted). Entries are
+        # aggregated per term and written in the background.
         if should_log:
-            # Check if this search term exists (case-insensitive)
-            existing_search = SearchLog.query.filter(
-                func.lower(SearchLog.term) == func.lower(sanitized_query)
-            ).first()
-            
-            try:
-                if existing_search:
-                    # Update existing search log - increment count and update timestamp
-                    existing_search.results_count += 1  # Increment the count
-                    existing_search.created_at = datetime.utcnow()  # Update timestamp
-                else:
-                    # Create new search log with count = 1
-                    search_log = SearchLog(
-                        term=sanitized_query[:100],  # Ensure max length
-                        results_count=1,  # Start with count = 1
-                        ip_address=request.remote_addr
-                    )
-                    db.session.add(search_log)
-                
-                db.session.commit()
-                print(f"Logged search for '{sanitized_query}' with count: {existing_search.results_count if existing_search else 1}")
-            except Exception as e:
-                print(f"Error logging search: {str(e)}")
-                db.session.rollback()
+            search_log_queue.log(sanitized_query, len(results), request.remote_addr)
+        metrics.searches.inc('true' if should_log else 'false', 'some' if results else 'none')
         
-        return jsonify([article.to_dict() for article in articles])
+        return jsonify(results)
+
+    @app.route('/keywords')
+    @conditional(lambda: content_validators())
+    @page_cache.cached(tags=lambda: ['articles'], query_args=('category_id', 'limit'))
+    def keywords():
+        # Keyword facets, optionally narrowed to one category
+        category_id = request.args.get('category_id', type=int)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        return jsonify([
+            {'name': name, 'count': count}
+            for name, count in keyword_facets(category_id=category_id, limit=limit)
+        ])
+
+    @app.route('/keywords/<path:name>')
+    @conditional(lambda name: content_validators())
+    @page_cache.cached(tags=lambda name: ['articles', 'categories'], query_args=('cursor',))
+    def keyword_articles(name):
+        articles, next_cursor = articles_by_keyword(
+            name,
+            limit=app.config['CATEGORY_PAGE_SIZE'],
+            cursor=request.args.get('cursor')
+        )
+        return jsonify({
+            'items': [{
+                'id': article.id,
+                'title': escape_text(article.title),
+                'category_name': escape_text(article.category.name),
+                'updated_at': article.updated_at.isoformat() if article.updated_at else None
+            } for article in articles],
+            'next_cursor': next_cursor
+        })
+
+    @app.route('/search/suggest')
+    def suggest():
+        query = request.args.get('q', '')
+        if not query or len(query) > 100:
+            return jsonify([])
+
+        # Served from memory without a database query. Titles are plain text and
+        # are inserted into the page as text, not HTML.
+        return jsonify([
+            {'id': article_id, 'title': title}
+            for article_id, title in suggestion_index.suggest(query, limit=8)
+        ])
 
     return app
 
-app = create_app()
+def __getattr__(name):
+    # `from app import app` keeps working, but the app is only created when it is
+    # first asked for, so importing this module has no side effects
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
 if __name__ == '__main__':
+    app = create_app()
     app.run(debug=True, extra_files=[
         os.path.join(app.root_path, 'templates', '**', '*.html'),
         os.path.join(app.root_path, 'static', 'css', '*.css'),
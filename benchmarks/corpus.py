@@ -0,0 +1,96 @@
+import random
+from datetime import datetime, timedelta
+from extensions import db
+from models import Category, Article, SearchLog
+
+SYLLABLES = [
+    'ba', 'co', 'de', 'fi', 'ga', 'lo', 'mi', 'ne', 'po', 'ra', 'si', 'tu',
+    'ver', 'tor', 'lan', 'mex', 'dra', 'sto', 'pli', 'gen', 'nax', 'qui', 'zen', 'ket'
+]
+
+
+def vocabulary(rng, size):
+    """``size`` distinct made-up words, so searches hit a known set of terms"""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _sentence(rng, words, length):
+    sentence = ' '.join(rng.choice(words) for _ in range(length))
+    return sentence[0].upper() + sentence[1:] + '.'
+
+
+def _content(rng, words, word_count):
+    paragraphs = []
+    while word_count > 0:
+        length = min(word_count, rng.randint(40, 120))
+        sentences = []
+        remaining = length
+        while remaining > 0:
+            sentence_length = min(remaining, rng.randint(6, 18))
+            sentences.append(_sentence(rng, words, sentence_length))
+            remaining -= sentence_length
+        text = ' '.join(sentences)
+        if rng.random() < 0.3:
+            word = rng.choice(words)
+            text = text.replace(f' {word} ', f' <strong>{word}</strong> ', 1)
+        paragraphs.append(f'<p>{text}</p>')
+        word_count -= length
+    return '\n'.join(paragraphs)
+
+
+def seed_corpus(articles=1000, categories=20, search_logs=2000, words_per_article=300,
+                vocabulary_size=2000, seed=0, batch_size=200):
+    """Fill an empty database with generated categories, articles and search logs.
+
+    Everything goes through the models, so content is sanitized, keywords are
+    normalized and the full-text index is filled just like for real edits.
+    The same ``seed`` always produces the same corpus. Returns the vocabulary
+    the text was written with.
+    """
+    rng = random.Random(seed)
+    words = vocabulary(rng, vocabulary_size)
+    now = datetime.utcnow()
+
+    category_rows = [
+        Category(name=f'{_sentence(rng, words, 2)[:-1]} {i}', description=_sentence(rng, words, 12), order=i)
+        for i in range(categories)
+    ]
+    db.session.add_all(category_rows)
+    db.session.commit()
+    category_ids = [category.id for category in category_rows]
+
+    for start in range(0, articles, batch_size):
+        for _ in range(start, min(start + batch_size, articles)):
+            created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            db.session.add(Article(
+                title=_sentence(rng, words, rng.randint(3, 8))[:-1],
+                content=_content(rng, words, words_per_article),
+                keywords=','.join(rng.sample(words, rng.randint(2, 6))),
+                category_id=rng.choice(category_ids),
+                created_at=created_at,
+                updated_at=created_at,
+                views=rng.randint(0, 5000),
+                upvotes=rng.randint(0, 200),
+                downvotes=rng.randint(0, 50)
+            ))
+        db.session.commit()
+
+    terms = set()
+    while len(terms) < search_logs:
+        terms.add(' '.join(rng.sample(words, rng.randint(1, 3))))
+    for start, term in enumerate(sorted(terms)):
+        db.session.add(SearchLog(
+            term=term,
+            normalized_term=SearchLog.normalize_term(term),
+            search_count=rng.randint(1, 500),
+            results_count=rng.randint(0, 50),
+            created_at=now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+            ip_address=f'10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+        ))
+        if start % batch_size == batch_size - 1:
+            db.session.commit()
+    db.session.commit()
+    return words
@@ -0,0 +1,307 @@
+"""Latency benchmarks for the public and admin routes.
+
+Seeds a generated corpus into a temporary SQLite database, drives each
+scenario through the Flask test client from a pool of threads and writes
+latency percentiles, queries per request and memory use to a JSON file::
+
+    python -m benchmarks.run --articles 2000 --concurrency 1,8 --output bench.json
+    python -m benchmarks.run --baseline bench.json  # Exit 1 if anything got slower
+
+Run it from the repository root. Only queries issued on the request thread
+are counted, so writes flushed later by the background counters and job
+queue are not included.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, select
+
+from app import create_app
+from commands import init_database
+from related import related_index
+from extensions import db
+from models import Category, Article
+from benchmarks.corpus import seed_corpus
+
+SCENARIOS = ['index', 'category', 'article', 'search', 'rate_article', 'admin.index', 'get_search_logs']
+
+
+class Scenario:
+    """Picks the next request of one route, e.g. a random article"""
+
+    def __init__(self, name, method, url, admin=False, json_body=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.admin = admin
+        self.json_body = json_body
+
+    def request(self, client, rng):
+        url = self.url(rng) if callable(self.url) else self.url
+        return client.open(url, method=self.method, json=self.json_body)
+
+
+def build_scenarios(category_ids, article_ids, words):
+    return {
+        'index': Scenario('index', 'GET', '/'),
+        'category': Scenario('category', 'GET', lambda rng: f'/category/{rng.choice(category_ids)}'),
+        'article': Scenario('article', 'GET', lambda rng: f'/article/{rng.choice(article_ids)}'),
+        'search': Scenario('search', 'GET', lambda rng: f'/search?q={rng.choice(words)}'),
+        'rate_article': Scenario('rate_article', 'POST', lambda rng: f'/article/{rng.choice(article_ids)}/rate',
+                                 json_body={'vote': 'up'}),
+        'admin.index': Scenario('admin.index', 'GET', '/admin/', admin=True),
+        'get_search_logs': Scenario('get_search_logs', 'GET',
+                                    lambda rng: f'/admin/api/search-logs?sort={rng.choice(["created_at", "search_count"])}',
+                                    admin=True)
+    }
+
+
+class QueryCounter:
+    """Counts the statements each thread sends to the database"""
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _client(app, admin):
+    client = app.test_client()
+    if admin:
+        with client.session_transaction() as session:
+            session['admin_logged_in'] = True
+    return client
+
+
+def run_scenario(app, scenario, counter, concurrency, requests, seed):
+    """Send ``requests`` requests from ``concurrency`` threads and summarize them"""
+    latencies = []
+    queries = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(index, count):
+        nonlocal errors
+        rng = random.Random(f'{seed}-{scenario.name}-{index}')
+        client = _client(app, scenario.admin)
+        for _ in range(count):
+            counter.reset()
+            started = time.perf_counter()
+            response = scenario.request(client, rng)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                queries.append(counter.count)
+                if response.status_code >= 400:
+                    errors += 1
+
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, i, share) for i, share in enumerate(shares) if share]:
+            future.result()
+    wall_time = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall_time, 1) if wall_time else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+            'max': max(queries, default=0)
+        },
+        'rss_mb': round(rss_bytes() / (1024 * 1024), 1)
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix='kb-bench-')
+    try:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "bench.db")}',
+            'PAGE_CACHE_BACKEND': None if args.no_page_cache else 'memory',
+            'PAGE_CACHE_DIR': os.path.join(directory, 'page_cache'),
+            'IMAGE_UPLOAD_FOLDER': os.path.join(directory, 'uploads')
+        })
+        init_database(app)
+        with app.app_context():
+            started = time.perf_counter()
+            words = seed_corpus(articles=args.articles, categories=args.categories, search_logs=args.search_logs,
+                                words_per_article=args.words, seed=args.seed)
+            related_index.rebuild()  # The corpus is added without sending article_changed
+            seed_time = time.perf_counter() - started
+            category_ids = db.session.scalars(select(Category.id)).all()
+            article_ids = db.session.scalars(select(Article.id)).all()
+            counter = QueryCounter(db.engine)
+
+        scenarios = build_scenarios(category_ids, article_ids, words)
+        results = {}
+        for name in args.scenarios:
+            results[name] = {}
+            if args.warmup:
+                run_scenario(app, scenarios[name], counter, 1, args.warmup, args.seed)
+            for concurrency in args.concurrency:
+                results[name][str(concurrency)] = run_scenario(
+                    app, scenarios[name], counter, concurrency, args.requests, args.seed
+                )
+            print(f'{name}: done', file=sys.stderr)
+
+        return {
+            'meta': {
+                'git_commit': _git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'corpus': {
+                    'articles': args.articles,
+                    'categories': args.categories,
+                    'search_logs': args.search_logs,
+                    'words_per_article': args.words,
+                    'seed': args.seed
+                },
+                'requests': args.requests,
+                'warmup': args.warmup,
+                'page_cache': not args.no_page_cache,
+                'seed_seconds': round(seed_time, 2),
+                'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+            },
+            'results': results
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(baseline, current, threshold):
+    """Lines describing regressions against ``baseline``: p95 latency up by more
+    than ``threshold`` times, more queries per request, or new errors"""
+    regressions = []
+    for name, levels in current['results'].items():
+        for concurrency, result in levels.items():
+            before = baseline.get('results', {}).get(name, {}).get(concurrency)
+            if before is None:
+                continue
+            label = f'{name} (concurrency {concurrency})'
+            p95, old_p95 = result['latency_ms']['p95'], before['latency_ms']['p95']
+            if old_p95 and p95 > old_p95 * threshold:
+                regressions.append(f'{label}: p95 {old_p95:.2f} ms -> {p95:.2f} ms')
+            queries, old_queries = result['queries_per_request']['mean'], before['queries_per_request']['mean']
+            if queries > old_queries:
+                regressions.append(f'{label}: queries per request {old_queries} -> {queries}')
+            if result['errors'] > before['errors']:
+                regressions.append(f'{label}: errors {before["errors"]} -> {result["errors"]}')
+    return regressions
+
+
+def print_summary(report, file=sys.stderr):
+    print(f'{"scenario":<18}{"conc":>5}{"rps":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"errors":>8}',
+          file=file)
+    for name, levels in report['results'].items():
+        for concurrency, result in levels.items():
+            latency = result['latency_ms']
+            print(f'{name:<18}{concurrency:>5}{result["throughput_rps"]:>9.1f}{latency["p50"]:>9.2f}'
+                  f'{latency["p95"]:>9.2f}{latency["p99"]:>9.2f}{result["queries_per_request"]["mean"]:>9.2f}'
+                  f'{result["errors"]:>8}', file=file)
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the knowledge base routes.')
+    parser.add_argument('--articles', type=int, default=1000, help='Articles in the generated corpus')
+    parser.add_argument('--categories', type=int, default=20, help='Categories in the generated corpus')
+    parser.add_argument('--search-logs', type=int, default=2000, help='Distinct search terms already logged')
+    parser.add_argument('--words', type=int, default=300, help='Words per article')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the corpus and the request mix')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests before each scenario')
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 4], help='Comma-separated thread counts')
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=SCENARIOS,
+                        help=f'Comma-separated subset of {",".join(SCENARIOS)}')
+    parser.add_argument('--no-page-cache', action='store_true', help='Measure with the page cache disabled')
+    parser.add_argument('--output', default='benchmark-results.json', help='Where to write the JSON report')
+    parser.add_argument('--baseline', help='Earlier report to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Largest allowed p95 ratio to the baseline before failing')
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print_summary(report)
+    print(f'Wrote {args.output}', file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for line in regressions:
+            print(f'Regression: {line}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
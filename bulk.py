@@ -0,0 +1,342 @@
+import io
+import json
+import multiprocessing
+import os
+import posixpath
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import insert, select
+from extensions import db
+from models import Article, Category, Keyword, article_keyword, html_to_text, truncate_text
+from sanitize import POLICY_VERSION, sanitize_html, strip_tags
+from signals import article_changed, category_changed
+
+# Errors kept in the import summary; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Batches smaller than this are sanitized in-process; starting workers costs more
+MIN_POOL_BATCH = 50
+
+HTML_EXTENSIONS = ('.html', '.htm')
+
+# Imports also run inside threaded web workers, where forking could copy a lock
+# held by another thread; workers are started from a clean process instead
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+_H1_RE = re.compile(r'<h1[^>]*>(.*?)</h1>', re.IGNORECASE | re.DOTALL)
+_BODY_RE = re.compile(r'<body[^>]*>(.*?)</body>', re.IGNORECASE | re.DOTALL)
+_KEYWORDS_RE = re.compile(r'<meta\s+name=["\']keywords["\']\s+content=["\']([^"\']*)["\']', re.IGNORECASE)
+
+
+class InvalidRecord(ValueError):
+    """An imported article that can't be saved"""
+
+
+def read_jsonl(stream):
+    """(line number, record) pairs from a JSON Lines file; bad lines give an InvalidRecord"""
+    for line_number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8', errors='replace'), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, InvalidRecord(f'Invalid JSON: {e.msg}')
+            continue
+        yield line_number, record if isinstance(record, dict) else InvalidRecord('Expected a JSON object')
+
+
+def read_zip(file, default_category=None):
+    """(file name, record) pairs for the HTML files in a zip archive.
+
+    The title comes from ``<title>`` or the first ``<h1>`` (falling back to the
+    file name), keywords from ``<meta name="keywords">`` and the category from
+    the top-level directory, or ``default_category`` for files at the root.
+    """
+    with zipfile.ZipFile(file) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(HTML_EXTENSIONS):
+                continue
+            html = archive.read(info).decode('utf-8', errors='replace')
+            title = _TITLE_RE.search(html) or _H1_RE.search(html)
+            body = _BODY_RE.search(html)
+            keywords = _KEYWORDS_RE.search(html)
+            directory = posixpath.dirname(info.filename)
+            yield info.filename, {
+                'title': html_to_text(title.group(1)) if title else
+                         posixpath.splitext(posixpath.basename(info.filename))[0],
+                'content': body.group(1) if body else html,
+                'keywords': keywords.group(1) if keywords else '',
+                'category': directory.split('/')[0] if directory else default_category,
+                'updated_at': datetime(*info.date_time).isoformat()
+            }
+
+
+def read_upload(file, filename, default_category=None):
+    """Records from an uploaded ``.zip`` of HTML files or JSON Lines file"""
+    if filename.lower().endswith('.zip'):
+        return read_zip(file, default_category)
+    return read_jsonl(file)
+
+
+def _prepare(item):
+    """Sanitized title, keywords and content with the derived text columns.
+
+    Runs in the worker processes, so it only takes and returns plain values.
+    """
+    title, keywords, content = item
+    content = sanitize_html(content)
+    plain_text = html_to_text(content)
+    # One spelling per keyword, the first one given
+    unique = {}
+    for keyword in keywords:
+        keyword = strip_tags(keyword).strip()
+        if keyword:
+            unique.setdefault(Keyword.normalize(keyword), keyword)
+    keywords = list(unique.values())
+    return strip_tags(title).strip(), keywords, content, plain_text, truncate_text(plain_text, Article.PREVIEW_LENGTH)
+
+
+def _keyword_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return value.split(',')
+    if isinstance(value, list) and all(isinstance(keyword, str) for keyword in value):
+        return value
+    raise InvalidRecord('keywords must be a string or a list of strings')
+
+
+def _timestamp(record, field, default):
+    value = record.get(field)
+    if value in (None, ''):
+        return default
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f'{field} is not an ISO 8601 timestamp')
+    # Stored as naive UTC, like the defaults
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _count(record, field):
+    value = record.get(field, 0)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise InvalidRecord(f'{field} must be a non-negative integer')
+    return value
+
+
+class ArticleImporter:
+    """Adds articles in bulk, a batch per transaction.
+
+    Each batch is sanitized by a pool of ``workers`` processes (bleach is pure
+    Python, so threads wouldn't help), started with ``POOL_START_METHOD``, and written with multi-row INSERTs for
+    the articles, new keywords and keyword links. Records that fail validation
+    are skipped and reported; the rest of the batch is still imported.
+    Categories are matched by name and created when ``create_categories`` is
+    set.
+    """
+
+    def __init__(self, batch_size=500, workers=None, create_categories=True):
+        self.batch_size = batch_size
+        self.workers = min(4, os.cpu_count() or 1) if workers is None else workers
+        self.create_categories = create_categories
+        self._categories = None
+
+    def run(self, records):
+        """Import ``(position, record)`` pairs, yielding progress after every batch.
+
+        The last progress dict has ``done`` set and lists the first errors as
+        ``{'position': ..., 'error': ...}``.
+        """
+        progress = {'processed': 0, 'imported': 0, 'failed': 0, 'errors': [], 'done': False}
+        self._categories = dict(db.session.execute(
+            select(Category.name, Category.id).order_by(Category.id.desc())
+        ).all())
+        pool = None
+        if self.workers > 1:
+            pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+        try:
+            batch = []
+            for item in records:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch, pool, progress)
+                    batch = []
+                    yield {key: value for key, value in progress.items() if key != 'errors'}
+            if batch:
+                self._import_batch(batch, pool, progress)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        progress['done'] = True
+        yield progress
+
+    def _import_batch(self, batch, pool, progress):
+        now = datetime.utcnow()
+        valid = []
+        for position, record in batch:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                valid.append((position, self._validate(record, now)))
+            except InvalidRecord as e:
+                self._fail(progress, position, str(e))
+        progress['processed'] += len(batch)
+
+        items = [(row.pop('title'), row.pop('keyword_names'), row.pop('content')) for _, row in valid]
+        if pool is not None and len(items) >= MIN_POOL_BATCH:
+            prepared = list(pool.map(_prepare, items, chunksize=max(1, len(items) // (self.workers * 4))))
+        else:
+            prepared = [_prepare(item) for item in items]
+
+        rows = []
+        keywords = []
+        for (position, row), (title, names, content, plain_text, preview) in zip(valid, prepared):
+            if not title or (not plain_text.strip() and '<img' not in content):
+                self._fail(progress, position, 'Title and content are required')
+                continue
+            row.update(title=title, content=content, plain_text=plain_text, preview=preview,
+                       keywords=','.join(names) or None, content_policy_version=POLICY_VERSION)
+            rows.append(row)
+            keywords.append(names)
+
+        categories = dict(self._categories)
+        try:
+            new_categories = self._create_categories(rows)
+            self._insert(rows, keywords)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._categories = categories
+            raise
+
+        progress['imported'] += len(rows)
+        app = current_app._get_current_object()
+        if new_categories:
+            category_changed.send(app, category_id=None)
+        if rows:
+            article_changed.send(app, article_id=None, category_ids={row['category_id'] for row in rows})
+
+    def _validate(self, record, now):
+        title = record.get('title')
+        content = record.get('content')
+        if not isinstance(title, str) or not title.strip() or not isinstance(content, str) or not content.strip():
+            raise InvalidRecord('Title and content are required')
+        if len(title) > 200:
+            raise InvalidRecord('Title must be less than 200 characters')
+
+        category = record.get('category')
+        if category is None and record.get('category_id') is not None:
+            category_id = record['category_id']
+            if category_id not in self._categories.values():
+                raise InvalidRecord(f'Unknown category id {category_id}')
+        elif isinstance(category, str) and category.strip():
+            category = strip_tags(category).strip()[:100]
+            if category not in self._categories and not self.create_categories:
+                raise InvalidRecord(f'Unknown category {category}')
+            category_id = self._categories.get(category, category)
+        else:
+            raise InvalidRecord('A category is required')
+
+        created_at = _timestamp(record, 'created_at', now)
+        return {
+            'title': title,
+            'content': content,
+            'keyword_names': _keyword_list(record.get('keywords')),
+            'category_id': category_id,  # Name of a category still to be created
+            'created_at': created_at,
+            'updated_at': _timestamp(record, 'updated_at', created_at),
+            'views': _count(record, 'views'),
+            'upvotes': _count(record, 'upvotes'),
+            'downvotes': _count(record, 'downvotes')
+        }
+
+    def _create_categories(self, rows):
+        names = sorted({row['category_id'] for row in rows if isinstance(row['category_id'], str)})
+        if names:
+            result = db.session.execute(
+                insert(Category.__table__).returning(Category.__table__.c.id, sort_by_parameter_order=True),
+                [{'name': name, 'order': 0, 'created_at': datetime.utcnow(), 'updated_at': datetime.utcnow()}
+                 for name in names]
+            )
+            self._categories.update(zip(names, result.scalars()))
+        for row in rows:
+            if isinstance(row['category_id'], str):
+                row['category_id'] = self._categories[row['category_id']]
+        return {self._categories[name] for name in names}
+
+    def _insert(self, rows, keywords):
+        if not rows:
+            return
+        table = Article.__table__
+        article_ids = db.session.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+
+        names = {Keyword.normalize(name) for names in keywords for name in names}
+        keyword_ids = dict(db.session.execute(
+            select(Keyword.name, Keyword.id).where(Keyword.name.in_(names))
+        ).all()) if names else {}
+        missing = sorted(names - keyword_ids.keys())
+        if missing:
+            result = db.session.execute(
+                insert(Keyword.__table__).returning(Keyword.__table__.c.id, sort_by_parameter_order=True),
+                [{'name': name} for name in missing]
+            )
+            keyword_ids.update(zip(missing, result.scalars()))
+
+        links = {(article_id, keyword_ids[Keyword.normalize(name)])
+                 for article_id, names in zip(article_ids, keywords) for name in names}
+        if links:
+            db.session.execute(insert(article_keyword),
+                               [{'article_id': article_id, 'keyword_id': keyword_id}
+                                for article_id, keyword_id in sorted(links)])
+
+    @staticmethod
+    def _fail(progress, position, error):
+        progress['failed'] += 1
+        if len(progress['errors']) < MAX_REPORTED_ERRORS:
+            progress['errors'].append({'position': position, 'error': error})
+
+
+def import_articles(records, **options):
+    """Import ``(position, record)`` pairs and return the final summary"""
+    for progress in ArticleImporter(**options).run(records):
+        pass
+    return progress
+
+
+def export_articles(batch_size=500):
+    """Every article as a JSON line that ``import_articles`` accepts, in id order"""
+    table = Article.__table__
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.title, table.c.content, table.c.keywords, Category.name.label('category'),
+                   table.c.created_at, table.c.updated_at, table.c.views, table.c.upvotes, table.c.downvotes)
+            .join(Category, Category.id == table.c.category_id)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        yield ''.join(json.dumps({
+            'id': row.id,
+            'title': row.title,
+            'category': row.category,
+            'keywords': [keyword for keyword in (row.keywords or '').split(',') if keyword],
+            'content': row.content,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+            'views': row.views or 0,
+            'upvotes': row.upvotes,
+            'downvotes': row.downvotes
+        }) + '\n' for row in rows)
+        last_id = rows[-1].id
@@ -0,0 +1,181 @@
+import click
+from sqlalchemy import bindparam, inspect, select
+from flask import current_app
+from flask_migrate import stamp
+from extensions import db
+from models import Category, Article, html_to_text, truncate_text
+from search_index import ensure_search_index
+from images import image_pipeline
+from related import related_index
+from bulk import ArticleImporter, export_articles, read_upload
+
+
+def init_database(app):
+    """Create the tables of an empty database and the full-text index.
+
+    A new database is created from the models and stamped with the latest
+    migration, so ``flask db upgrade`` finds nothing left to do. Databases that
+    already have tables are left to ``flask db upgrade``. Returns whether the
+    tables were created.
+    """
+    with app.app_context():
+        created = not inspect(db.engine).get_table_names()
+        if created:
+            db.create_all()
+            stamp()
+    ensure_search_index(app)
+    return created
+
+
+def seed_sample_data():
+    """Add sample categories and articles to an empty database.
+
+    Returns False without changing anything if there are categories already.
+    """
+    if db.session.query(Category.id).first() is not None:
+        return False
+
+    categories = [
+        Category(name='General'),
+        Category(name='Technology'),
+        Category(name='Business')
+    ]
+    db.session.add_all(categories)
+    db.session.commit()
+    
+    articles = [
+        Article(
+            title='Welcome to Knowledge Base',
+            content='Welcome to our knowledge base system. Here you will find helpful articles and guides.',
+            keywords='help,guide,introduction,getting started',
+            category_id=categories[0].id
+        ),
+        Article(
+            title='Getting Started with Technology',
+            content='Learn about the latest technology trends and how to stay up to date.',
+            keywords='tech,trends,innovation,learning',
+            category_id=categories[1].id
+        ),
+        Article(
+            title='Business Best Practices',
+            content='Discover the best practices for running a successful business.',
+            keywords='business,management,success,strategy',
+            category_id=categories[2].id
+        )
+    ]
+    db.session.add_all(articles)
+    db.session.commit()
+    return True
+
+
+def backfill_article_text(recompute=False, batch_size=500):
+    """Fill in ``plain_text`` and ``preview`` for articles stored without them.
+
+    With ``recompute`` every article is refreshed, e.g. after changing how the
+    text is derived. Rows are processed in primary key order, ``batch_size`` at a
+    time. Returns the number of articles updated.
+    """
+    article = Article.__table__
+    update = article.update()\
+        .where(article.c.id == bindparam('article_id'))\
+        .values(
+            plain_text=bindparam('plain_text'),
+            preview=bindparam('preview'),
+            # Derived columns aren't an edit, so leave the modification time alone
+            updated_at=article.c.updated_at
+        )
+
+    updated = 0
+    last_id = 0
+    while True:
+        query = select(article.c.id, article.c.content)\
+            .where(article.c.id > last_id)\
+            .order_by(article.c.id)\
+            .limit(batch_size)
+        if not recompute:
+            query = query.where(article.c.plain_text.is_(None))
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+
+        params = []
+        for article_id, content in rows:
+            plain_text = html_to_text(content)
+            params.append({
+                'article_id': article_id,
+                'plain_text': plain_text,
+                'preview': truncate_text(plain_text, Article.PREVIEW_LENGTH)
+            })
+        db.session.execute(update, params)
+        db.session.commit()
+
+        updated += len(rows)
+        last_id = rows[-1].id
+    return updated
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    @click.option('--seed', is_flag=True, help='Add sample data if the database is empty.')
+    def init_db_command(seed):
+        """Create the tables of a new database and the full-text index."""
+        if init_database(current_app._get_current_object()):
+            click.echo('Initialized the database')
+        else:
+            click.echo('Database already has tables, run `flask db upgrade` to update them')
+        if seed and seed_sample_data():
+            click.echo('Added sample data')
+
+    @app.cli.command('seed-db')
+    def seed_db_command():
+        """Add sample categories and articles to an empty database."""
+        if seed_sample_data():
+            click.echo('Added sample data')
+        else:
+            click.echo('Database already has categories, not adding sample data')
+
+    @app.cli.command('backfill-article-text')
+    @click.option('--all', 'recompute', is_flag=True, help='Recompute the text of every article.')
+    @click.option('--batch-size', default=500, show_default=True, help='Articles updated per transaction.')
+    def backfill_article_text_command(recompute, batch_size):
+        """Store plain text and previews for existing articles."""
+        updated = backfill_article_text(recompute=recompute, batch_size=batch_size)
+        click.echo(f'Updated {updated} articles')
+
+    @app.cli.command('process-images')
+    def process_images_command():
+        """Generate missing variants of uploaded images."""
+        processed = image_pipeline.process_all()
+        click.echo(f'Processed {processed} images')
+
+    @app.cli.command('rebuild-related-articles')
+    def rebuild_related_articles_command():
+        """Recompute the related articles of every article."""
+        changed = related_index.rebuild()
+        click.echo(f'Rebuilt related articles, {changed} lists changed')
+
+    @app.cli.command('import-articles')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--category', help='Category of HTML files at the root of a zip file.')
+    @click.option('--batch-size', default=500, show_default=True, help='Articles saved per transaction.')
+    @click.option('--workers', type=int, help='Processes sanitizing the content (default: up to 4).')
+    @click.option('--no-create-categories', is_flag=True, help='Skip articles whose category does not exist.')
+    def import_articles_command(path, category, batch_size, workers, no_create_categories):
+        """Import articles from a JSON Lines file or a zip of HTML files."""
+        importer = ArticleImporter(batch_size=batch_size, workers=workers,
+                                   create_categories=not no_create_categories)
+        with open(path, 'rb') as f:
+            for progress in importer.run(read_upload(f, path, category)):
+                click.echo(f'{progress["processed"]} processed, {progress["imported"]} imported, '
+                           f'{progress["failed"]} failed', err=True)
+        for error in progress['errors']:
+            click.echo(f'{error["position"]}: {error["error"]}', err=True)
+        if progress['failed'] > len(progress['errors']):
+            click.echo(f'... and {progress["failed"] - len(progress["errors"])} more errors', err=True)
+
+    @app.cli.command('export-articles')
+    @click.argument('output', type=click.File('w'), default='-')
+    def export_articles_command(output):
+        """Write every article as JSON Lines to OUTPUT (default: stdout)."""
+        for chunk in export_articles():
+            output.write(chunk)
@@ -0,0 +1,151 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from sqlalchemy import text
+from extensions import db
+from signals import counters_flushed
+from database import retry_if_locked
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """Accumulates integer increments for table rows and writes them in batches.
+
+    Increments are kept in memory and flushed as ``UPDATE <table> SET <column> =
+    <column> + n`` statements every ``<PREFIX>_FLUSH_INTERVAL`` seconds, or as soon
+    as ``<PREFIX>_MAX_PENDING`` increments are waiting. An interval of 0 writes
+    every increment straight through. Pending increments are drained at exit.
+    """
+
+    def __init__(self, table, columns, config_prefix):
+        self.table = table
+        self.columns = tuple(columns)
+        self.config_prefix = config_prefix
+        self.app = None
+        self.flush_interval = 5.0
+        self.max_pending = 500
+        self._pending = defaultdict(int)
+        self._inflight = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        app.config.setdefault(f'{self.config_prefix}_FLUSH_INTERVAL', 5.0)
+        app.config.setdefault(f'{self.config_prefix}_MAX_PENDING', 500)
+        self.flush_interval = float(app.config[f'{self.config_prefix}_FLUSH_INTERVAL'])
+        self.max_pending = int(app.config[f'{self.config_prefix}_MAX_PENDING'])
+        self.app = app
+        app.extensions[self.config_prefix.lower()] = self
+
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    def increment(self, row_id, column, amount=1):
+        if column not in self.columns:
+            raise ValueError(f'{column} is not a buffered column of {self.table}')
+
+        if self.flush_interval <= 0:
+            self._write({(row_id, column): amount})
+            return
+
+        with self._lock:
+            self._pending[(row_id, column)] += amount
+            self._pending_count += amount
+            should_flush = self._pending_count >= self.max_pending
+
+        self._ensure_worker()
+        if should_flush:
+            self._wakeup.set()
+
+    def pending(self, row_id, column):
+        """Increments for a row that have not been written to the database yet"""
+        key = (row_id, column)
+        with self._lock:
+            return self._pending.get(key, 0) + self._inflight.get(key, 0)
+
+    def pending_total(self, column):
+        with self._lock:
+            return sum(n for (_, col), n in self._pending.items() if col == column) + \
+                sum(n for (_, col), n in self._inflight.items() if col == column)
+
+    def flush(self):
+        """Write all pending increments in a single transaction"""
+        # Serialize flushes so an in-flight batch is never overwritten
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch = dict(self._pending)
+                self._inflight = batch
+                self._pending = defaultdict(int)
+                self._pending_count = 0
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error('Error flushing %s counters: %s', self.table, e)
+                # Put the increments back so they are retried on the next flush,
+                # in the same step as dropping them from _inflight so they aren't counted twice
+                with self._lock:
+                    self._inflight = {}
+                    for key, amount in batch.items():
+                        self._pending[key] += amount
+                        self._pending_count += amount
+            else:
+                # Sent outside the try: once committed, a failing receiver mustn't get the batch written twice
+                totals = defaultdict(int)
+                for (_, column), amount in batch.items():
+                    totals[column] += amount
+                counters_flushed.send(self.app, table=self.table, totals=dict(totals), rows=batch)
+
+    def _write(self, batch):
+        by_column = defaultdict(list)
+        for (row_id, column), amount in batch.items():
+            by_column[column].append({'id': row_id, 'amount': amount})
+
+        def write():
+            with db.engine.begin() as connection:
+                for column, params in by_column.items():
+                    connection.execute(text(
+                        f'UPDATE {self.table} SET {column} = COALESCE({column}, 0) + :amount '
+                        f'WHERE id = :id'
+                    ), params)
+            # Committed, so the increments are now part of the stored values
+            with self._lock:
+                self._inflight = {}
+
+        with self.app.app_context():
+            retry_if_locked(write, f'{self.config_prefix.lower()}_flush')
+
+    def _ensure_worker(self):
+        # Started lazily so that forked workers each get their own flusher thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f'{self.config_prefix.lower()}-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+# Article page views, flushed in the background instead of committing on every read
+view_counter = CounterBuffer('article', ('views',), 'VIEW_COUNTER')
+
+# Article votes. Written through atomically by default; set VOTE_BUFFER_FLUSH_INTERVAL
+# to coalesce bursts of votes into periodic bulk updates instead.
+vote_counter = CounterBuffer('article', ('upvotes', 'downvotes'), 'VOTE_BUFFER')
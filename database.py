@@ -0,0 +1,168 @@
+import os
+import time
+from flask import g, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from extensions import db, REPLICA_EXTENSION
+from metrics import metrics, is_locked_error
+
+DEFAULT_DATABASE_URL = 'sqlite:///kb.db'
+
+# Applied to every new SQLite connection. WAL lets readers carry on while a
+# write is in progress, and busy_timeout makes writers wait for the lock instead
+# of failing straight away with "database is locked".
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # Safe with WAL; only the last commits can be lost on power failure
+    'busy_timeout': 5000,  # Milliseconds
+    'mmap_size': 268435456,  # 256 MB
+    'cache_size': -20000,  # Negative values are KiB, so about 20 MB
+    'temp_store': 'MEMORY'
+}
+
+# Pragmas that write to the database file and can't be set on a read-only replica
+READ_WRITE_PRAGMAS = {'journal_mode'}
+
+# Public GET endpoints that may read from the replica
+DEFAULT_READ_REPLICA_ENDPOINTS = {
+    'index', 'category', 'article', 'search', 'suggest', 'keywords', 'keyword_articles'
+}
+
+# Set after a client writes something so its next requests read from the primary
+PRIMARY_COOKIE = 'kb_read_primary'
+
+
+def database_url_from_env():
+    """The database URL from ``DATABASE_URL``, defaulting to the local SQLite file"""
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # Some hosts still hand out the scheme SQLAlchemy dropped in 1.4
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def configure_database(app):
+    """Fill in engine options for the configured database URIs.
+
+    Must run before ``db.init_app()``. SQLite gets the pragmas in
+    ``SQLITE_PRAGMAS``; other engines get a connection pool sized by
+    ``DATABASE_POOL_SIZE``, ``DATABASE_MAX_OVERFLOW``, ``DATABASE_POOL_TIMEOUT``
+    and ``DATABASE_POOL_RECYCLE`` (each also read from the environment).
+
+    ``DATABASE_REPLICA_URL`` adds a read-only replica, for example a
+    replica server or a SQLite snapshot opened with
+    ``sqlite:///file:kb-replica.db?mode=ro&uri=true``.
+    """
+    app.config.setdefault('SQLITE_PRAGMAS', dict(DEFAULT_SQLITE_PRAGMAS))
+    app.config.setdefault('DATABASE_POOL_SIZE', _env_int('DATABASE_POOL_SIZE', 10))
+    app.config.setdefault('DATABASE_MAX_OVERFLOW', _env_int('DATABASE_MAX_OVERFLOW', 20))
+    app.config.setdefault('DATABASE_POOL_TIMEOUT', _env_int('DATABASE_POOL_TIMEOUT', 30))
+    app.config.setdefault('DATABASE_POOL_RECYCLE', _env_int('DATABASE_POOL_RECYCLE', 1800))
+    app.config.setdefault('DATABASE_REPLICA_URL', os.environ.get('DATABASE_REPLICA_URL'))
+    app.config.setdefault('READ_REPLICA_ENDPOINTS', set(DEFAULT_READ_REPLICA_ENDPOINTS))
+    app.config.setdefault('READ_REPLICA_STICKY_SECONDS', 10)
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if not _is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        for key, value in _pool_options(app).items():
+            options.setdefault(key, value)
+
+
+def _pool_options(app):
+    return {
+        'pool_size': app.config['DATABASE_POOL_SIZE'],
+        'max_overflow': app.config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DATABASE_POOL_RECYCLE'],
+        # Connections dropped by the server are replaced instead of failing a request
+        'pool_pre_ping': True
+    }
+
+
+def retry_if_locked(operation, name, retries=3, delay=0.05):
+    """Run ``operation()``, retrying with backoff if SQLite reports "database is locked".
+
+    busy_timeout already makes writers wait for the lock, but SQLite gives up
+    straight away when waiting could deadlock (a read transaction upgrading to
+    a write while another connection writes), so those are retried here. The
+    operation must be safe to repeat, i.e. roll back completely on failure.
+    """
+    attempt = 0
+    while True:
+        try:
+            return operation()
+        except OperationalError as e:
+            if not is_locked_error(e) or attempt >= retries:
+                raise
+            metrics.db_locked_retries.inc(name)
+            time.sleep(delay * 2 ** attempt)
+            attempt += 1
+
+
+def init_engines(app):
+    """Apply connection settings to the app's engines. Call after ``db.init_app()``."""
+    pragmas = app.config['SQLITE_PRAGMAS']
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and pragmas:
+                event.listen(engine, 'connect', _sqlite_pragma_listener(pragmas))
+
+
+def _sqlite_pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+def init_read_replica(app):
+    """Route reads of public GET endpoints to the replica, if one is configured.
+
+    Admin pages and anything not in ``READ_REPLICA_ENDPOINTS`` always use the
+    primary. After a successful write (any non-GET request) the client is sent
+    a short-lived cookie that keeps it on the primary for
+    ``READ_REPLICA_STICKY_SECONDS``, so it sees its own changes despite
+    replication lag.
+    """
+    url = app.config['DATABASE_REPLICA_URL']
+    if not url:
+        return
+
+    if _is_sqlite(url):
+        engine = create_engine(url)
+        pragmas = {k: v for k, v in app.config['SQLITE_PRAGMAS'].items() if k not in READ_WRITE_PRAGMAS}
+        if pragmas:
+            event.listen(engine, 'connect', _sqlite_pragma_listener(pragmas))
+    else:
+        engine = create_engine(url, **_pool_options(app))
+    # Kept out of SQLALCHEMY_BINDS: no models live on the replica, it only
+    # serves reads that RoutingSession redirects to it
+    app.extensions[REPLICA_EXTENSION] = engine
+
+    @app.before_request
+    def use_read_replica():
+        if request.method in ('GET', 'HEAD') \
+                and request.endpoint in app.config['READ_REPLICA_ENDPOINTS'] \
+                and PRIMARY_COOKIE not in request.cookies:
+            g.use_read_replica = True
+
+    @app.after_request
+    def stick_to_primary_after_write(response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=app.config['READ_REPLICA_STICKY_SECONDS'],
+                                httponly=True, samesite='Lax')
+        return response
@@ -1,3 +1,36 @@
+from flask import current_app, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 
-db = SQLAlchemy()
+# app.extensions key of the optional read-only replica engine (see database.init_read_replica)
+REPLICA_EXTENSION = 'read_replica'
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica when the current request allows it.
+
+    Requests opt in by setting ``g.use_read_replica`` (see
+    database.init_read_replica). Flushes, INSERT/UPDATE/DELETE statements and
+    everything after the first write in a session go to the primary, so a
+    request always sees its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing or self.info.get('wrote'):
+            return engine
+        if clause is not None and getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+            return engine
+
+        if has_app_context() and g.get('use_read_replica') and engine is self._db.engines.get(None):
+            return current_app.extensions.get(REPLICA_EXTENSION, engine)
+        return engine
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            self.info['wrote'] = True
+        super().flush(objects)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
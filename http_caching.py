@@ -0,0 +1,124 @@
+import hashlib
+from collections import namedtuple
+from functools import wraps
+from flask import current_app, request, make_response
+from werkzeug.http import is_resource_modified
+from sqlalchemy import func, select
+from counters import view_counter, vote_counter
+from extensions import db
+from models import Category, Article, RelatedArticle
+
+# Cache-Control per endpoint. 'no-cache' lets browsers and CDNs keep a copy but
+# revalidate it on every use, which is a cheap 304 when nothing has changed.
+DEFAULT_CACHE_CONTROL = {
+    'index': 'public, no-cache',
+    'category': 'public, no-cache',
+    'article': 'public, no-cache',
+    'search': 'public, no-cache',
+    'keywords': 'public, no-cache',
+    'keyword_articles': 'public, no-cache'
+}
+
+Validators = namedtuple('Validators', ['etag', 'last_modified'])
+
+
+def make_validators(*parts, last_modified=None):
+    """Build a weak ETag from the values a response depends on"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return Validators(digest, last_modified)
+
+
+def content_validators():
+    """Validators covering every article and category, from one aggregate query.
+
+    Edits bump ``updated_at`` and deletions change the counts, so any change to
+    listed content produces a new ETag.
+    """
+    articles_updated, article_count, categories_updated, category_count = db.session.execute(select(
+        select(func.max(Article.updated_at)).scalar_subquery(),
+        select(func.count(Article.id)).scalar_subquery(),
+        select(func.max(Category.updated_at)).scalar_subquery(),
+        select(func.count(Category.id)).scalar_subquery()
+    )).one()
+    last_modified = max(filter(None, [articles_updated, categories_updated]), default=None)
+    return make_validators(articles_updated, article_count, categories_updated, category_count,
+                           request.query_string, last_modified=last_modified)
+
+
+def article_validators(article_id):
+    """Validators for an article page, or None if the article doesn't exist.
+
+    The page shows its view and vote counts, so they are part of the ETag,
+    including increments still waiting in ``view_counter`` and ``vote_counter``.
+    Every view changes the ETag, so a reader reloading the page sees the new count.
+    The related articles listed on the page are covered by their ids and update times.
+    """
+    row = db.session.query(
+        Article.updated_at, Article.views, Article.upvotes, Article.downvotes, Category.updated_at
+    ).join(Category, Article.category_id == Category.id).filter(Article.id == article_id).first()
+    if row is None:
+        return None
+    article_updated, views, upvotes, downvotes, category_updated = row
+    views = (views or 0) + view_counter.pending(article_id, 'views')
+    upvotes = (upvotes or 0) + vote_counter.pending(article_id, 'upvotes')
+    downvotes = (downvotes or 0) + vote_counter.pending(article_id, 'downvotes')
+    related = db.session.execute(
+        select(RelatedArticle.related_id, Article.updated_at)
+        .join(Article, Article.id == RelatedArticle.related_id)
+        .where(RelatedArticle.article_id == article_id)
+        .order_by(RelatedArticle.rank)
+    ).all()
+    last_modified = max(filter(None, [article_updated, category_updated, *(updated for _, updated in related)]),
+                        default=None)
+    return make_validators(article_id, article_updated, views, upvotes, downvotes, category_updated,
+                           [tuple(row) for row in related], last_modified=last_modified)
+
+
+def cache_control_for(endpoint):
+    policies = dict(DEFAULT_CACHE_CONTROL, **current_app.config.get('CACHE_CONTROL_POLICIES', {}))
+    return policies.get(endpoint)
+
+
+def not_modified(validators):
+    """Whether the client's cached copy (If-None-Match / If-Modified-Since) is current"""
+    return not is_resource_modified(
+        request.environ,
+        etag=validators.etag,
+        last_modified=validators.last_modified
+    )
+
+
+def apply_validators(response, validators, endpoint=None):
+    response.set_etag(validators.etag, weak=True)
+    if validators.last_modified:
+        response.last_modified = validators.last_modified
+    policy = cache_control_for(endpoint or request.endpoint)
+    if policy:
+        response.headers['Cache-Control'] = policy
+    return response
+
+
+def not_modified_response(validators, endpoint=None):
+    return apply_validators(make_response('', 304), validators, endpoint)
+
+
+def conditional(validators):
+    """Answer conditional GETs for a view without running it when nothing changed.
+
+    ``validators`` is called with the view arguments and returns ``Validators``
+    for the current state, or None to handle the request unconditionally.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            current = validators(**kwargs) if request.method in ('GET', 'HEAD') else None
+            if current is None:
+                return view(**kwargs)
+            if not_modified(current):
+                return not_modified_response(current)
+            response = make_response(view(**kwargs))
+            if response.status_code == 200:
+                apply_validators(response, current)
+            return response
+        return wrapper
+    return decorator
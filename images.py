@@ -0,0 +1,196 @@
+import hashlib
+import io
+import os
+import threading
+from PIL import Image, ImageOps
+from jobs import job_queue
+from metrics import metrics
+
+# Pillow format -> file extension of the stored original
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+_EXIF_ORIENTATION = 0x0112
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image in one of ``IMAGE_FORMATS``"""
+
+
+class ImagePipeline:
+    """Stores uploaded images by content hash and generates resized WebP variants.
+
+    An upload is saved once under the SHA-256 of its bytes, so uploading the
+    same picture twice reuses the stored file and different pictures never
+    overwrite each other. Variants ``IMAGE_VARIANT_WIDTHS`` pixels wide (never
+    wider than the original) and a ``IMAGE_THUMBNAIL_SIZE`` thumbnail are
+    generated by a background job next to the original::
+
+        uploads/3f/3f9a...c2.jpg          original, as uploaded
+        uploads/3f/3f9a...c2-960w.webp    variant
+        uploads/3f/3f9a...c2-thumb.webp   thumbnail
+
+    Variant names only depend on the hash and the width of the original, so
+    the ``srcset`` for an upload is known before its variants exist.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.folder = None
+        self.url = None
+        self.widths = (480, 960, 1600)
+        self.thumbnail_size = 200
+        self.quality = 80
+        self.max_bytes = 10 * 1024 * 1024
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_UPLOAD_FOLDER', os.path.join(app.static_folder, 'uploads'))
+        app.config.setdefault('IMAGE_UPLOAD_URL', f'{app.static_url_path}/uploads')
+        app.config.setdefault('IMAGE_VARIANT_WIDTHS', (480, 960, 1600))
+        app.config.setdefault('IMAGE_THUMBNAIL_SIZE', 200)
+        app.config.setdefault('IMAGE_WEBP_QUALITY', 80)
+        app.config.setdefault('IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+        self.folder = app.config['IMAGE_UPLOAD_FOLDER']
+        self.url = app.config['IMAGE_UPLOAD_URL'].rstrip('/')
+        self.widths = tuple(sorted(int(width) for width in app.config['IMAGE_VARIANT_WIDTHS']))
+        self.thumbnail_size = int(app.config['IMAGE_THUMBNAIL_SIZE'])
+        self.quality = int(app.config['IMAGE_WEBP_QUALITY'])
+        self.max_bytes = int(app.config['IMAGE_MAX_BYTES'])
+        self.app = app
+        app.extensions['images'] = self
+
+    def store(self, stream):
+        """Save an uploaded image and queue its variants.
+
+        Returns a dict with the ``location`` of the original and its dimensions,
+        plus the ``srcset`` and ``sizes`` of its variants ready to be set on an
+        ``<img>`` (left out for animated images, which aren't resized). Raises
+        InvalidImage for anything that is not a supported image.
+        """
+        data = stream.read(self.max_bytes + 1)
+        metrics.upload_bytes.observe(len(data))
+        if len(data) > self.max_bytes:
+            raise InvalidImage(f'Images can be at most {self.max_bytes // (1024 * 1024)} MB')
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image_format = image.format
+                width, height = _oriented_size(image)
+                animated = getattr(image, 'is_animated', False)
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+            raise InvalidImage('Not a valid image') from e
+        if image_format not in IMAGE_FORMATS:
+            raise InvalidImage(f'Unsupported image format: {image_format}')
+
+        digest = hashlib.sha256(data).hexdigest()
+        extension = IMAGE_FORMATS[image_format]
+        path = self._path(digest, extension)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, data)
+
+        image = {'location': self._url(digest, extension), 'width': width, 'height': height}
+        if animated:
+            # Resizing would keep only the first frame, so these are served as uploaded
+            return image
+        if not self.has_variants(digest, width):
+            job_queue.submit('process-image', digest, extension)
+        image.update({
+            'srcset': self.srcset(digest, width),
+            'sizes': self.sizes(width),
+            'thumbnail': self._url(digest, 'thumb.webp', '-')
+        })
+        return image
+
+    def variant_widths(self, width):
+        """Widths of the variants made for an image ``width`` pixels wide"""
+        return sorted({w for w in self.widths if w < width} | {min(width, self.widths[-1])})
+
+    def srcset(self, digest, width):
+        return ', '.join(f'{self._url(digest, f"{w}w.webp", "-")} {w}w' for w in self.variant_widths(width))
+
+    def sizes(self, width):
+        largest = self.variant_widths(width)[-1]
+        return f'(max-width: {largest}px) 100vw, {largest}px'
+
+    def has_variants(self, digest, width):
+        return all(os.path.exists(self._path(digest, f'{w}w.webp', '-')) for w in self.variant_widths(width)) \
+            and os.path.exists(self._path(digest, 'thumb.webp', '-'))
+
+    def process(self, digest, extension):
+        """Write any missing variants and the thumbnail of a stored original"""
+        with Image.open(self._path(digest, extension)) as original:
+            if getattr(original, 'is_animated', False):
+                return
+            image = ImageOps.exif_transpose(original)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+            for width in self.variant_widths(image.width):
+                path = self._path(digest, f'{width}w.webp', '-')
+                if os.path.exists(path):
+                    continue
+                height = max(1, round(image.height * width / image.width))
+                variant = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                self._save_webp(variant, path)
+
+            path = self._path(digest, 'thumb.webp', '-')
+            if not os.path.exists(path):
+                thumbnail = image.copy()
+                thumbnail.thumbnail((self.thumbnail_size, self.thumbnail_size), Image.LANCZOS)
+                self._save_webp(thumbnail, path)
+
+    def process_all(self):
+        """Process every stored original that is missing variants. Returns how many were processed."""
+        processed = 0
+        for directory, _, filenames in os.walk(self.folder):
+            for filename in sorted(filenames):
+                digest, _, extension = filename.partition('.')
+                if len(digest) != 64 or extension not in IMAGE_FORMATS.values():
+                    continue
+                with Image.open(os.path.join(directory, filename)) as image:
+                    width, _ = _oriented_size(image)
+                    animated = getattr(image, 'is_animated', False)
+                if not animated and not self.has_variants(digest, width):
+                    self.process(digest, extension)
+                    processed += 1
+        return processed
+
+    def _save_webp(self, image, path):
+        buffer = io.BytesIO()
+        # Saved without the original's EXIF data, which can be larger than a small variant
+        image.save(buffer, 'WEBP', quality=self.quality, method=4)
+        _write_atomic(path, buffer.getvalue())
+
+    def _path(self, digest, suffix, separator='.'):
+        return os.path.join(self.folder, digest[:2], f'{digest}{separator}{suffix}')
+
+    def _url(self, digest, suffix, separator='.'):
+        return f'{self.url}/{digest[:2]}/{digest}{separator}{suffix}'
+
+
+def _oriented_size(image):
+    """Size of ``image`` as displayed, taking the EXIF orientation into account"""
+    width, height = image.size
+    if image.getexif().get(_EXIF_ORIENTATION) in _TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def _write_atomic(path, data):
+    # Readers never see a half-written file, and concurrent writers of the
+    # same content simply replace each other
+    temporary = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+image_pipeline = ImagePipeline()
+
+
+@job_queue.task('process-image')
+def process_image(digest, extension):
+    image_pipeline.process(digest, extension)
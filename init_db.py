@@ -1,14 +1,15 @@
-from app import app
+from app import create_app
+from commands import init_database
 from extensions import db
 from models import Category, Article
 from datetime import datetime
 import os
 
 def init_db():
+    app = create_app()
+    # Create all tables and the full-text index
+    init_database(app)
     with app.app_context():
-        # Create all tables
-        db.create_all()
-        
         # Add some initial categories if none exist
         if not Category.query.first():
             categories = [
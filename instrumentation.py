@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from extensions import db, REPLICA_EXTENSION
+
+logger = logging.getLogger(__name__)
+
+# Longest statement text kept in logs and reports
+STATEMENT_LENGTH = 500
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+class QueryInstrumentation:
+    """Per-request SQL statistics, enabled with ``SQL_INSTRUMENTATION``.
+
+    Every statement sent through the app's engines is timed. Each request
+    gets a ``Server-Timing`` header with its query count and database time,
+    and a JSON log line on the ``instrumentation`` logger that also lists its
+    ``SQL_SLOWEST_QUERIES`` slowest statements. Statements slower than
+    ``SQL_SLOW_QUERY_MS`` are logged as warnings, on SQLite together with
+    their ``EXPLAIN QUERY PLAN`` when ``SQL_EXPLAIN_SLOW_QUERIES`` is set.
+
+    Nothing is attached to the engines unless it is enabled, so it costs
+    nothing when switched off.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.slow_query_ms = 100.0
+        self.slowest = 3
+        self.explain = True
+
+    def init_app(self, app):
+        """Call after the database and any read replica are set up"""
+        app.config.setdefault('SQL_INSTRUMENTATION', _env_flag('SQL_INSTRUMENTATION'))
+        app.config.setdefault('SQL_SLOW_QUERY_MS', float(os.environ.get('SQL_SLOW_QUERY_MS', 100)))
+        app.config.setdefault('SQL_SLOWEST_QUERIES', 3)
+        app.config.setdefault('SQL_EXPLAIN_SLOW_QUERIES', True)
+        self.enabled = bool(app.config['SQL_INSTRUMENTATION'])
+        self.slow_query_ms = float(app.config['SQL_SLOW_QUERY_MS'])
+        self.slowest = int(app.config['SQL_SLOWEST_QUERIES'])
+        self.explain = bool(app.config['SQL_EXPLAIN_SLOW_QUERIES'])
+        self.app = app
+        app.extensions['instrumentation'] = self
+        if not self.enabled:
+            return
+
+        if 'sqlalchemy' in app.extensions:
+            with app.app_context():
+                for engine in db.engines.values():
+                    self.instrument(engine)
+        if REPLICA_EXTENSION in app.extensions:
+            self.instrument(app.extensions[REPLICA_EXTENSION])
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def instrument(self, engine):
+        """Time the statements of ``engine``"""
+        if not event.contains(engine, 'before_cursor_execute', self._before_execute):
+            event.listen(engine, 'before_cursor_execute', self._before_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+
+        if has_request_context():
+            stats = g.setdefault('sql_stats', {'count': 0, 'time_ms': 0.0, 'statements': []})
+            stats['count'] += 1
+            stats['time_ms'] += elapsed_ms
+            stats['statements'].append((elapsed_ms, statement))
+
+        if elapsed_ms >= self.slow_query_ms:
+            plan = self._explain(conn, statement, parameters) if self.explain and not executemany else None
+            logger.warning(json.dumps({
+                'event': 'slow_query',
+                'duration_ms': round(elapsed_ms, 2),
+                'statement': statement[:STATEMENT_LENGTH],
+                'endpoint': request.endpoint if has_request_context() else None,
+                'plan': plan
+            }))
+
+    def _explain(self, conn, statement, parameters):
+        # Other databases would abort the surrounding transaction if EXPLAIN failed
+        if conn.dialect.name != 'sqlite' or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        # A raw DBAPI cursor, so the EXPLAIN itself isn't timed or explained
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+            return [row[3] for row in cursor.fetchall()]
+        except Exception as e:
+            return [f'EXPLAIN QUERY PLAN failed: {e}']
+        finally:
+            cursor.close()
+
+    def _start_request(self):
+        g.request_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        stats = g.get('sql_stats', {'count': 0, 'time_ms': 0.0, 'statements': []})
+        duration_ms = (time.perf_counter() - g.get('request_start', time.perf_counter())) * 1000
+
+        response.headers.add('Server-Timing', f'db;dur={stats["time_ms"]:.2f};desc="{stats["count"]} queries"')
+        response.headers.add('Server-Timing', f'app;dur={duration_ms:.2f}')
+
+        slowest = sorted(stats['statements'], key=lambda item: item[0], reverse=True)[:self.slowest]
+        logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'queries': stats['count'],
+            'db_ms': round(stats['time_ms'], 2),
+            'slowest': [{'duration_ms': round(ms, 2), 'statement': statement[:STATEMENT_LENGTH]}
+                        for ms, statement in slowest]
+        }))
+        return response
+
+
+instrumentation = QueryInstrumentation()
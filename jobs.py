@@ -0,0 +1,303 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteJobStore:
+    """Keeps queued jobs in a local SQLite file so they survive restarts.
+
+    Each job is claimed by the process that queued it. On startup a process also
+    takes over the jobs of processes that are no longer running.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS job (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    owner INTEGER,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute('PRAGMA busy_timeout = 10000')
+        return connection
+
+    def add(self, job):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT INTO job (id, name, payload, attempts, owner, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job['id'], job['name'], json.dumps({'args': job['args'], 'kwargs': job['kwargs']}),
+                 job['attempts'], os.getpid(), time.time())
+            )
+
+    def retry(self, job, error):
+        with self._connect() as connection:
+            connection.execute('UPDATE job SET attempts = ?, error = ? WHERE id = ?',
+                               (job['attempts'], error, job['id']))
+
+    def complete(self, job):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM job WHERE id = ?', (job['id'],))
+
+    def fail(self, job, error):
+        with self._connect() as connection:
+            connection.execute("UPDATE job SET status = 'failed', attempts = ?, error = ? WHERE id = ?",
+                               (job['attempts'], error, job['id']))
+
+    def claim_pending(self):
+        """Take over pending jobs whose process is gone and return all of this process's jobs"""
+        pid = os.getpid()
+        with self._connect() as connection:
+            owners = [row[0] for row in connection.execute(
+                "SELECT DISTINCT owner FROM job WHERE status = 'pending' AND owner IS NOT NULL"
+            )]
+            orphaned = [owner for owner in owners if owner != pid and not _process_alive(owner)]
+            connection.executemany("UPDATE job SET owner = ? WHERE status = 'pending' AND owner = ?",
+                                   [(pid, owner) for owner in orphaned])
+            connection.execute("UPDATE job SET owner = ? WHERE status = 'pending' AND owner IS NULL", (pid,))
+            rows = connection.execute(
+                "SELECT id, name, payload, attempts FROM job WHERE status = 'pending' AND owner = ? "
+                "ORDER BY created_at", (pid,)
+            ).fetchall()
+        jobs = []
+        for job_id, name, payload, attempts in rows:
+            payload = json.loads(payload)
+            jobs.append({'id': job_id, 'name': name, 'args': payload['args'],
+                         'kwargs': payload['kwargs'], 'attempts': attempts})
+        return jobs
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """In-process queue of deferred work, run by a small pool of worker threads.
+
+    Work is registered with ``@job_queue.task('name')`` and queued with
+    ``job_queue.submit('name', *args)``. Arguments must be JSON-serializable so
+    jobs can be persisted. Jobs run inside an app context. Failed jobs are
+    retried ``JOBS_MAX_RETRIES`` times with exponential backoff starting at
+    ``JOBS_RETRY_DELAY`` seconds.
+
+    The queue holds at most ``JOBS_QUEUE_SIZE`` jobs. When it is full,
+    ``submit`` waits up to ``JOBS_SUBMIT_TIMEOUT`` seconds and then runs the job
+    in the caller's thread, which slows producers down rather than dropping
+    work. Queued jobs are drained at exit for up to ``JOBS_DRAIN_TIMEOUT``
+    seconds. With ``JOBS_STORE`` set to a file path, jobs are also kept in a
+    SQLite file until they finish. ``init_app`` picks up the jobs left by an
+    earlier run; those whose task isn't registered yet wait until it is.
+    ``JOBS_EAGER`` runs every job immediately in the caller's thread.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.workers = 2
+        self.max_retries = 3
+        self.retry_delay = 1.0
+        self.submit_timeout = 1.0
+        self.drain_timeout = 10.0
+        self.eager = False
+        self.store = None
+        self._tasks = {}
+        self._waiting = {}  # Stored jobs whose task isn't registered yet, by task name
+        self._queue = queue.Queue(1000)
+        self._threads = []
+        self._unfinished = 0
+        self._idle = threading.Condition()
+        self._lock = threading.Lock()
+        self._accepting = True
+        self._claimed_by = None
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_WORKERS', 2)
+        app.config.setdefault('JOBS_QUEUE_SIZE', 1000)
+        app.config.setdefault('JOBS_MAX_RETRIES', 3)
+        app.config.setdefault('JOBS_RETRY_DELAY', 1.0)
+        app.config.setdefault('JOBS_SUBMIT_TIMEOUT', 1.0)
+        app.config.setdefault('JOBS_DRAIN_TIMEOUT', 10.0)
+        app.config.setdefault('JOBS_STORE', None)
+        app.config.setdefault('JOBS_EAGER', False)
+        self.workers = int(app.config['JOBS_WORKERS'])
+        self.max_retries = int(app.config['JOBS_MAX_RETRIES'])
+        self.retry_delay = float(app.config['JOBS_RETRY_DELAY'])
+        self.submit_timeout = float(app.config['JOBS_SUBMIT_TIMEOUT'])
+        self.drain_timeout = float(app.config['JOBS_DRAIN_TIMEOUT'])
+        self.eager = bool(app.config['JOBS_EAGER'])
+        self.store = SQLiteJobStore(app.config['JOBS_STORE']) if app.config['JOBS_STORE'] else None
+        # Replaced only before the workers start so none are left waiting on the old one
+        if not self._threads:
+            self._queue = queue.Queue(int(app.config['JOBS_QUEUE_SIZE']))
+        self._accepting = True
+        self.app = app
+        app.extensions['jobs'] = self
+
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+        if self.store is not None and not self.eager:
+            # Run the jobs left over from the last run without waiting for a new one
+            self._ensure_workers()
+
+    def task(self, name):
+        """Register a function as the job ``name``"""
+        def decorator(func):
+            self._tasks[name] = func
+            with self._lock:
+                waiting = self._waiting.pop(name, [])
+            for job in waiting:
+                self._requeue(job)
+            return func
+        return decorator
+
+    def submit(self, name, *args, **kwargs):
+        """Queue the job ``name`` and return its id"""
+        if name not in self._tasks:
+            raise ValueError(f'Unknown job: {name}')
+        job = {'id': uuid.uuid4().hex, 'name': name, 'args': list(args), 'kwargs': kwargs, 'attempts': 0}
+
+        if self.eager or not self._accepting:
+            self._execute(job, retry=False)
+            return job['id']
+
+        self._ensure_workers()
+        if self.store is not None:
+            self.store.add(job)
+        with self._idle:
+            self._unfinished += 1
+        try:
+            self._queue.put(job, timeout=self.submit_timeout)
+        except queue.Full:
+            logger.warning('Job queue full, running %s in the request thread', name)
+            self._execute(job, retry=False)
+            self._task_done()
+        return job['id']
+
+    def join(self, timeout=None):
+        """Wait until every queued job (including pending retries) has finished"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=None):
+        """Stop taking new jobs, finish the queued ones and stop the workers"""
+        if not self._accepting:
+            return
+        self._accepting = False
+        if not self.join(self.drain_timeout if timeout is None else timeout):
+            logger.warning('Job queue shut down with %d jobs unfinished', self._unfinished)
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+
+    def _ensure_workers(self):
+        # Started lazily so that forked workers each get their own threads
+        if self._threads and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            if self.store is not None and self._claimed_by != os.getpid():
+                self._claimed_by = os.getpid()
+                self._requeue_stored()
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'job-worker-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _requeue_stored(self):
+        for job in self.store.claim_pending():
+            if job['name'] in self._tasks:
+                self._requeue(job)
+            else:
+                # Its task is registered later, e.g. by a module imported after init_app()
+                self._waiting.setdefault(job['name'], []).append(job)
+
+    def _requeue(self, job):
+        with self._idle:
+            self._unfinished += 1
+        self._queue.put(job)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._execute(job, retry=True)
+            finally:
+                self._task_done()
+
+    def _execute(self, job, retry):
+        try:
+            with self.app.app_context():
+                self._tasks[job['name']](*job['args'], **job['kwargs'])
+        except Exception as e:
+            job['attempts'] += 1
+            if retry and self._accepting and job['attempts'] <= self.max_retries:
+                delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+                logger.warning('Job %s failed (%s), retrying in %.1fs', job['name'], e, delay)
+                if self.store is not None:
+                    self.store.retry(job, str(e))
+                self._schedule_retry(job, delay)
+            else:
+                logger.error('Job %s failed after %d attempts: %s', job['name'], job['attempts'], e)
+                if self.store is not None:
+                    self.store.fail(job, str(e))
+        else:
+            if self.store is not None:
+                self.store.complete(job)
+
+    def _schedule_retry(self, job, delay):
+        with self._idle:
+            self._unfinished += 1
+
+        timer = threading.Timer(delay, self._queue.put, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+    def _task_done(self):
+        with self._idle:
+            self._unfinished -= 1
+            if not self._unfinished:
+                self._idle.notify_all()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,222 @@
+import bisect
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from extensions import db
+
+# Prometheus' default latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10_000, 50_000, 100_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000)
+
+
+def is_locked_error(error):
+    """Whether ``error`` is SQLite giving up on a lock held by another connection"""
+    return isinstance(error, OperationalError) and 'database is locked' in str(error.orig)
+
+
+class _ThreadToken:
+    """Lives in a thread's local storage, so it is collected when the thread ends"""
+
+
+class _Shards:
+    """Per-thread dicts of metric values.
+
+    Each thread only ever writes to its own dict, so recording a value is a
+    plain dict update without a lock. Scrapes add up every thread's values.
+    When a thread ends its values are folded into ``_retired`` and its dict is
+    dropped, so short-lived threads don't accumulate shards.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._all = []
+        self._retired = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def local(self):
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = self._local.values = defaultdict(float)
+            self._local.token = _ThreadToken()
+            weakref.finalize(self._local.token, self._retire, values)
+            with self._lock:
+                self._all.append(values)
+        return values
+
+    def _retire(self, values):
+        with self._lock:
+            self._all.remove(values)
+            for key, value in values.items():
+                self._retired[key] += value
+
+    def totals(self):
+        with self._lock:
+            totals = defaultdict(float, self._retired)
+            shards = list(self._all)
+        for shard in shards:
+            # dict.copy() is atomic, so a thread writing meanwhile can't break the iteration
+            for key, value in shard.copy().items():
+                totals[key] += value
+        return totals
+
+
+class Counter:
+    def __init__(self, shards, name, help, labels):
+        self.shards = shards
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def inc(self, *label_values, amount=1):
+        self.shards.local()[(self.name, label_values)] += amount
+
+    def render(self, totals):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        series = sorted((key[1], value) for key, value in totals.items() if len(key) == 2 and key[0] == self.name)
+        for label_values, value in series:
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, shards, name, help, labels, buckets):
+        self.shards = shards
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        values = self.shards.local()
+        # Only the matching bucket is counted here; render() makes the counts cumulative
+        values[(self.name, label_values, bisect.bisect_left(self.buckets, value))] += 1
+        values[(self.name, label_values, 'sum')] += value
+
+    def render(self, totals):
+        series = defaultdict(dict)
+        for key, value in totals.items():
+            if len(key) == 3 and key[0] == self.name:
+                series[key[1]][key[2]] = value
+
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, values in sorted(series.items()):
+            cumulative = 0
+            for index, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += values.get(index, 0)
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), label_values + (le,))} '
+                             f'{_number(cumulative)}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, label_values)} {_number(values.get("sum", 0))}')
+            lines.append(f'{self.name}_count{_labels(self.labels, label_values)} {_number(cumulative)}')
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Application metrics in the Prometheus text format.
+
+    Served on ``/admin/metrics`` to logged-in admins, or to scrapers sending
+    ``Authorization: Bearer <METRICS_TOKEN>``. ``METRICS_ENABLED`` turns off
+    the per-request recording.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.token = None
+        self.started = time.time()
+        self._shards = _Shards()
+        self._metrics = []
+
+        self.request_duration = self.histogram(
+            'kb_request_duration_seconds', 'Time spent handling requests.', ('endpoint', 'method'),
+            LATENCY_BUCKETS)
+        self.responses = self.counter(
+            'kb_responses_total', 'Responses sent, by status code.', ('endpoint', 'status'))
+        self.page_cache = self.counter(
+            'kb_page_cache_requests_total', 'Page cache lookups, by result.', ('endpoint', 'result'))
+        self.db_locked_errors = self.counter(
+            'kb_db_locked_errors_total', "Statements that failed with 'database is locked' after busy_timeout.")
+        self.db_locked_retries = self.counter(
+            'kb_db_locked_retries_total', "Writes retried after 'database is locked'.", ('operation',))
+        self.searches = self.counter(
+            'kb_searches_total', 'Searches, by whether they were submitted or typed and whether anything was found.',
+            ('submitted', 'results'))
+        self.upload_bytes = self.histogram(
+            'kb_upload_bytes', 'Size of uploaded images.', (), SIZE_BUCKETS)
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(self._shards, name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(self._shards, name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+        self.token = app.config['METRICS_TOKEN']
+        self.app = app
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        if 'sqlalchemy' in app.extensions:
+            with app.app_context():
+                for engine in db.engines.values():
+                    if not event.contains(engine, 'handle_error', self._handle_error):
+                        event.listen(engine, 'handle_error', self._handle_error)
+
+    def render(self):
+        totals = self._shards.totals()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(totals))
+        lines.append('# HELP kb_start_time_seconds Unix time the process started.')
+        lines.append('# TYPE kb_start_time_seconds gauge')
+        lines.append(f'kb_start_time_seconds {self.started:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        start = g.get('metrics_start')
+        endpoint = request.endpoint or 'unknown'
+        if start is not None:
+            self.request_duration.observe(time.perf_counter() - start, endpoint, request.method)
+        self.responses.inc(endpoint, response.status_code)
+        cache = response.headers.get('X-Page-Cache')
+        if cache:
+            self.page_cache.inc(endpoint, cache)
+        return response
+
+    def _handle_error(self, context):
+        if is_locked_error(context.sqlalchemy_exception):
+            self.db_locked_errors.inc()
+
+
+metrics = Metrics()
@@ -0,0 +1,62 @@
+"""create base tables
+
+Revision ID: 0c5a9e3f7b12
+Revises:
+Create Date: 2026-10-18 09:05:02.117842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c5a9e3f7b12'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The tables as they were before migrations were added. Databases created
+    # back then with db.create_all() already have them, so only missing ones are created.
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'category' not in existing:
+        op.create_table('category',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('description', sa.String(length=500), nullable=True),
+            sa.Column('order', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'article' not in existing:
+        op.create_table('article',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=200), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('keywords', sa.String(length=500), nullable=True),
+            sa.Column('category_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('views', sa.Integer(), nullable=True),
+            sa.Column('upvotes', sa.Integer(), nullable=False),
+            sa.Column('downvotes', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['category_id'], ['category.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'search_log' not in existing:
+        op.create_table('search_log',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('term', sa.String(length=100), nullable=False),
+            sa.Column('results_count', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('ip_address', sa.String(length=45), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('search_log')
+    op.drop_table('article')
+    op.drop_table('category')
@@ -0,0 +1,25 @@
+"""add article content_policy_version
+
+Revision ID: 2a7d4c9e1f35
+Revises: 9b3e6f0d2c41
+Create Date: 2026-10-18 15:27:40.861902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a7d4c9e1f35'
+down_revision = '9b3e6f0d2c41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows stay NULL and are re-sanitized the first time they are read
+    op.add_column('article', sa.Column('content_policy_version', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('article', 'content_policy_version')
@@ -0,0 +1,61 @@
+"""add article full-text index
+
+Revision ID: 3f1c2a9b7d10
+Revises: 0c5a9e3f7b12
+Create Date: 2026-10-18 09:12:41.204519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = '0c5a9e3f7b12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS article_fts USING fts5(
+            title, content, keywords,
+            content='article', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS article_fts_ai AFTER INSERT ON article BEGIN
+            INSERT INTO article_fts(rowid, title, content, keywords)
+            VALUES (new.id, new.title, new.content, new.keywords);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS article_fts_ad AFTER DELETE ON article BEGIN
+            INSERT INTO article_fts(article_fts, rowid, title, content, keywords)
+            VALUES ('delete', old.id, old.title, old.content, old.keywords);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS article_fts_au AFTER UPDATE OF title, content, keywords ON article BEGIN
+            INSERT INTO article_fts(article_fts, rowid, title, content, keywords)
+            VALUES ('delete', old.id, old.title, old.content, old.keywords);
+            INSERT INTO article_fts(rowid, title, content, keywords)
+            VALUES (new.id, new.title, new.content, new.keywords);
+        END
+    """)
+    # Backfill the index from existing articles
+    op.execute("INSERT INTO article_fts(article_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute('DROP TRIGGER IF EXISTS article_fts_au')
+    op.execute('DROP TRIGGER IF EXISTS article_fts_ad')
+    op.execute('DROP TRIGGER IF EXISTS article_fts_ai')
+    op.execute('DROP TABLE IF EXISTS article_fts')
@@ -0,0 +1,25 @@
+"""index article category listing
+
+Revision ID: 5d2b8e7c0a93
+Revises: c7e93b1f4a26
+Create Date: 2026-10-18 12:03:44.190271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2b8e7c0a93'
+down_revision = 'c7e93b1f4a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain CREATE INDEX: a batch (table copy) would drop the full-text triggers on article
+    op.create_index('ix_article_category_updated', 'article', ['category_id', 'updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_article_category_updated', table_name='article')
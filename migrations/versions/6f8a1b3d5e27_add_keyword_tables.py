@@ -0,0 +1,68 @@
+"""add keyword tables
+
+Revision ID: 6f8a1b3d5e27
+Revises: 2a7d4c9e1f35
+Create Date: 2026-10-18 16:05:13.447182
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f8a1b3d5e27'
+down_revision = '2a7d4c9e1f35'
+branch_labels = None
+depends_on = None
+
+
+def normalize(name):
+    # Same as Keyword.normalize() at the time of this migration
+    return ' '.join(name.split()).lower()[:100]
+
+
+def upgrade():
+    keyword = op.create_table('keyword',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    article_keyword = op.create_table('article_keyword',
+        sa.Column('article_id', sa.Integer(), nullable=False),
+        sa.Column('keyword_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['article_id'], ['article.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['keyword_id'], ['keyword.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('article_id', 'keyword_id')
+    )
+    op.create_index('ix_article_keyword_keyword_article', 'article_keyword',
+                    ['keyword_id', 'article_id'], unique=False)
+
+    # Split the existing comma-separated keyword strings into the new tables
+    connection = op.get_bind()
+    article = sa.table('article', sa.column('id', sa.Integer), sa.column('keywords', sa.String))
+    rows = connection.execute(
+        sa.select(article.c.id, article.c.keywords).where(article.c.keywords.isnot(None))
+    ).all()
+
+    names_by_article = {
+        article_id: {normalize(name) for name in keywords.split(',') if name.strip()}
+        for article_id, keywords in rows
+    }
+    names = sorted(set().union(*names_by_article.values()))
+    if names:
+        op.bulk_insert(keyword, [{'id': i, 'name': name} for i, name in enumerate(names, start=1)])
+        ids = {name: i for i, name in enumerate(names, start=1)}
+        op.bulk_insert(article_keyword, [
+            {'article_id': article_id, 'keyword_id': ids[name]}
+            for article_id, article_names in names_by_article.items()
+            for name in sorted(article_names)
+        ])
+
+
+def downgrade():
+    # The comma-separated article.keywords column is kept up to date, so nothing
+    # needs to be copied back
+    op.drop_index('ix_article_keyword_keyword_article', table_name='article_keyword')
+    op.drop_table('article_keyword')
+    op.drop_table('keyword')
@@ -0,0 +1,54 @@
+"""aggregate search log by normalized term
+
+Revision ID: 8a41d0c5e2f7
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 10:02:17.553190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41d0c5e2f7'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('search_log', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('normalized_term', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('search_count', sa.Integer(), nullable=True))
+
+    # results_count used to hold the number of times a term was searched
+    op.execute('UPDATE search_log SET normalized_term = lower(trim(term))')
+    op.execute("""
+        UPDATE search_log SET search_count = (
+            SELECT SUM(COALESCE(s.results_count, 1)) FROM search_log s
+            WHERE s.normalized_term = search_log.normalized_term
+        )
+    """)
+    # Keep only the most recent row for each term
+    op.execute("""
+        DELETE FROM search_log WHERE id NOT IN (
+            SELECT MAX(id) FROM search_log GROUP BY normalized_term
+        )
+    """)
+
+    with op.batch_alter_table('search_log', schema=None) as batch_op:
+        batch_op.alter_column('normalized_term', existing_type=sa.String(length=100), nullable=False)
+        batch_op.alter_column('search_count', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_unique_constraint('uq_search_log_normalized_term', ['normalized_term'])
+        batch_op.create_index('ix_search_log_search_count', ['search_count'], unique=False)
+
+
+def downgrade():
+    # Restore the old meaning of results_count as the per-term counter
+    op.execute('UPDATE search_log SET results_count = search_count')
+
+    with op.batch_alter_table('search_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_search_log_search_count')
+        batch_op.drop_constraint('uq_search_log_normalized_term', type_='unique')
+        batch_op.drop_column('search_count')
+        batch_op.drop_column('normalized_term')
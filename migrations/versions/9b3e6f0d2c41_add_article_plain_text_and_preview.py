@@ -0,0 +1,76 @@
+"""add article plain_text and preview
+
+Revision ID: 9b3e6f0d2c41
+Revises: e4f61a2d9b58
+Create Date: 2026-10-18 14:02:17.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3e6f0d2c41'
+down_revision = 'e4f61a2d9b58'
+branch_labels = None
+depends_on = None
+
+
+def create_fts(body_column):
+    op.execute(f"""
+        CREATE VIRTUAL TABLE article_fts USING fts5(
+            title, {body_column}, keywords,
+            content='article', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    op.execute(f"""
+        CREATE TRIGGER article_fts_ai AFTER INSERT ON article BEGIN
+            INSERT INTO article_fts(rowid, title, {body_column}, keywords)
+            VALUES (new.id, new.title, new.{body_column}, new.keywords);
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER article_fts_ad AFTER DELETE ON article BEGIN
+            INSERT INTO article_fts(article_fts, rowid, title, {body_column}, keywords)
+            VALUES ('delete', old.id, old.title, old.{body_column}, old.keywords);
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER article_fts_au AFTER UPDATE OF title, {body_column}, keywords ON article BEGIN
+            INSERT INTO article_fts(article_fts, rowid, title, {body_column}, keywords)
+            VALUES ('delete', old.id, old.title, old.{body_column}, old.keywords);
+            INSERT INTO article_fts(rowid, title, {body_column}, keywords)
+            VALUES (new.id, new.title, new.{body_column}, new.keywords);
+        END
+    """)
+    op.execute("INSERT INTO article_fts(article_fts) VALUES ('rebuild')")
+
+
+def drop_fts():
+    op.execute('DROP TRIGGER IF EXISTS article_fts_au')
+    op.execute('DROP TRIGGER IF EXISTS article_fts_ad')
+    op.execute('DROP TRIGGER IF EXISTS article_fts_ai')
+    op.execute('DROP TABLE IF EXISTS article_fts')
+
+
+def upgrade():
+    # Plain ADD COLUMN rather than batch mode, which would recreate the table and
+    # drop the full-text triggers
+    op.add_column('article', sa.Column('plain_text', sa.Text(), nullable=True))
+    op.add_column('article', sa.Column('preview', sa.String(length=200), nullable=True))
+
+    # Index the plain text instead of the HTML body. Existing rows are indexed as
+    # they are filled in by `flask backfill-article-text`.
+    if op.get_bind().dialect.name == 'sqlite':
+        drop_fts()
+        create_fts('plain_text')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        drop_fts()
+        create_fts('content')
+
+    op.drop_column('article', 'preview')
+    op.drop_column('article', 'plain_text')
@@ -0,0 +1,35 @@
+"""add related_article table
+
+Revision ID: b5e2d8f4a7c1
+Revises: 6f8a1b3d5e27
+Create Date: 2026-10-18 18:42:09.315774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e2d8f4a7c1'
+down_revision = '6f8a1b3d5e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `flask rebuild-related-articles`, or by the first article edit
+    op.create_table('related_article',
+        sa.Column('article_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('related_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['article_id'], ['article.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['related_id'], ['article.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('article_id', 'rank')
+    )
+    op.create_index('ix_related_article_related_id', 'related_article', ['related_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_related_article_related_id', table_name='related_article')
+    op.drop_table('related_article')
@@ -0,0 +1,26 @@
+"""index search log created_at
+
+Revision ID: c7e93b1f4a26
+Revises: 8a41d0c5e2f7
+Create Date: 2026-10-18 11:20:05.871342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e93b1f4a26'
+down_revision = '8a41d0c5e2f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('search_log', schema=None) as batch_op:
+        batch_op.create_index('ix_search_log_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('search_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_search_log_created_at')
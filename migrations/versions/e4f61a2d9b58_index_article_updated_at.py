@@ -0,0 +1,24 @@
+"""index article updated_at
+
+Revision ID: e4f61a2d9b58
+Revises: 5d2b8e7c0a93
+Create Date: 2026-10-18 13:11:52.006437
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f61a2d9b58'
+down_revision = '5d2b8e7c0a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_article_updated_at', 'article', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_article_updated_at', table_name='article')
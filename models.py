@@ -1,9 +1,27 @@
 from datetime import datetime
 from extensions import db
+from counters import view_counter, vote_counter
+from sanitize import POLICY_VERSION, sanitize_html, escape_text
 import bleach
 import re
 import html
-from sqlalchemy import func, desc
+from sqlalchemy import desc, event
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+def html_to_text(content):
+    """Plain text of an HTML fragment with entities decoded and whitespace collapsed"""
+    text = re.sub(r'<[^>]+>', ' ', content or '')
+    text = html.unescape(text)
+    return ' '.join(text.split())
+
+
+def truncate_text(text, length):
+    """Cut ``text`` at a word boundary before ``length`` and add an ellipsis"""
+    if len(text) > length:
+        return text[:length].rsplit(' ', 1)[0] + '...'
+    return text
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -13,40 +31,125 @@ class Category(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     articles = db.relationship('Article', backref='category', lazy=True)
+    # Populated by queries that load the count alongside the category (see queries.py)
+    article_count = db.query_expression()
 
     def to_dict(self):
         return {
             'id': self.id,
-            'name': bleach.clean(self.name),
+            'name': escape_text(self.name),
             'description': bleach.clean(self.description) if self.description else '',
             'order': self.order,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
+# Association between articles and their keywords. The reverse index serves
+# articles-by-keyword lookups and keyword facet counts.
+article_keyword = db.Table(
+    'article_keyword',
+    db.Column('article_id', db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('keyword_id', db.Integer, db.ForeignKey('keyword.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_article_keyword_keyword_article', 'keyword_id', 'article_id')
+)
+
+class Keyword(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)  # Normalized, see normalize()
+
+    articles = db.relationship('Article', secondary=article_keyword, back_populates='keyword_tags',
+                               lazy='dynamic')
+
+    @staticmethod
+    def normalize(name):
+        """Key used to treat 'Getting  Started' and 'getting started' as one keyword"""
+        return ' '.join(name.split()).lower()[:100]
+
+    @classmethod
+    def get_or_create_all(cls, names):
+        """Keyword rows for ``names``, adding any that don't exist yet to the session"""
+        names = sorted({cls.normalize(name) for name in names if name.strip()})
+        if not names:
+            return []
+        # Keywords added earlier in the same unit of work aren't in the database yet
+        existing = {obj.name: obj for obj in db.session.new if isinstance(obj, cls) and obj.name in names}
+        with db.session.no_autoflush:
+            existing.update((keyword.name, keyword) for keyword in cls.query.filter(cls.name.in_(names)))
+        for name in names:
+            if name not in existing:
+                existing[name] = cls(name=name)
+                db.session.add(existing[name])
+        return [existing[name] for name in names]
+
 class Article(db.Model):
+    __table_args__ = (
+        # Category listings are ordered by last update (see queries.category_articles)
+        db.Index('ix_article_category_updated', 'category_id', 'updated_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    keywords = db.Column(db.String(500))  # Store keywords as comma-separated string
+    keywords = db.Column(db.String(500))  # Comma-separated copy of keyword_tags for display and full-text search
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     views = db.Column(db.Integer, default=0)
     upvotes = db.Column(db.Integer, nullable=False, default=0)
     downvotes = db.Column(db.Integer, nullable=False, default=0)
+    # Sanitization policy the content was cleaned with (sanitize.POLICY_VERSION)
+    content_policy_version = db.Column(db.Integer)
+    # Derived from content whenever it is set, see _set_content()
+    plain_text = db.Column(db.Text)
+    preview = db.Column(db.String(200))
+
+    PREVIEW_LENGTH = 100
+
+    keyword_tags = db.relationship('Keyword', secondary=article_keyword, back_populates='articles')
     
-    def get_preview(self, length=100):
-        # Remove HTML tags for the preview
-        text = re.sub(r'<[^>]+>', '', self.content)
-        # Decode HTML entities
-        text = html.unescape(text)
-        # Remove extra whitespace
-        text = ' '.join(text.split())
-        # Truncate to length and add ellipsis if needed
-        if len(text) > length:
-            return text[:length].rsplit(' ', 1)[0] + '...'
-        return text
+    def get_preview(self, length=PREVIEW_LENGTH):
+        if length == self.PREVIEW_LENGTH and self.preview is not None:
+            return self.preview
+        text = self.plain_text if self.plain_text is not None else html_to_text(self.content)
+        return truncate_text(text, length)
+
+    @validates('content')
+    def _set_content(self, key, content):
+        # Sanitized and derived once per write instead of on every read
+        content = sanitize_html(content)
+        self.content_policy_version = POLICY_VERSION
+        self.plain_text = html_to_text(content)
+        self.preview = truncate_text(self.plain_text, self.PREVIEW_LENGTH)
+        return content
+
+    @property
+    def safe_content(self):
+        """Content sanitized with the current policy.
+
+        Content stored under an older policy is sanitized again and saved, without
+        touching ``updated_at``, so each article is only re-cleaned once.
+        """
+        if self.content_policy_version != POLICY_VERSION:
+            self.resanitize()
+        return self.content
+
+    def resanitize(self):
+        table = Article.__table__
+        self.content = self.content
+        values = {
+            'content': self.content,
+            'content_policy_version': self.content_policy_version,
+            'plain_text': self.plain_text,
+            'preview': self.preview
+        }
+        with db.engine.begin() as connection:
+            connection.execute(
+                table.update().where(table.c.id == self.id)
+                .values(updated_at=table.c.updated_at, **values)
+            )
+        # Already saved, so don't let the session write it again
+        for key, value in values.items():
+            set_committed_value(self, key, value)
     
     def get_keywords_list(self):
         """Get keywords as a list"""
@@ -62,61 +165,109 @@ class Article(db.Model):
             # Remove duplicates, strip whitespace, and join with commas
             cleaned_keywords = {k.strip() for k in keywords_list if k.strip()}
             self.keywords = ','.join(sorted(cleaned_keywords))
+
+    @validates('keywords')
+    def _set_keywords_string(self, key, keywords):
+        # Keyword rows are looked up when the article is flushed (see _resolve_keywords),
+        # so an article that is never added to a session doesn't add keywords either
+        self._keyword_names = (keywords or '').split(',')
+        return keywords
     
     def to_dict(self):
         return {
             'id': self.id,
-            'title': bleach.clean(self.title),
-            'content': bleach.clean(self.content),
+            'title': escape_text(self.title),
+            'content': self.safe_content,
             'keywords': self.get_keywords_list(),
-            'preview': self.get_preview(100),
+            'preview': self.get_preview(),
             'category_id': self.category_id,
-            'category_name': bleach.clean(self.category.name),
+            'category_name': escape_text(self.category.name),
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'views': self.views,
-            'upvotes': self.upvotes or 0,
-            'downvotes': self.downvotes or 0,
+            'views': self.view_count,
+            'upvotes': self.upvote_count,
+            'downvotes': self.downvote_count,
             'rating_percentage': self.get_rating_percentage()
         }
     
     def increment_views(self):
-        self.views += 1
-        db.session.commit()
+        # Buffered and written in batches so page views don't take the write lock
+        view_counter.increment(self.id, 'views')
+
+    @property
+    def view_count(self):
+        """Views including increments that have not been flushed yet"""
+        return (self.views or 0) + view_counter.pending(self.id, 'views')
+
+    def add_vote(self, vote):
+        """Record an 'up' or 'down' vote with an atomic increment"""
+        vote_counter.increment(self.id, 'upvotes' if vote == 'up' else 'downvotes')
+
+    @property
+    def upvote_count(self):
+        return (self.upvotes or 0) + vote_counter.pending(self.id, 'upvotes')
+
+    @property
+    def downvote_count(self):
+        return (self.downvotes or 0) + vote_counter.pending(self.id, 'downvotes')
         
     def get_rating_percentage(self):
-        total_votes = (self.upvotes or 0) + (self.downvotes or 0)
+        upvotes = self.upvote_count
+        total_votes = upvotes + self.downvote_count
         if total_votes == 0:
             return 0
-        return round(((self.upvotes or 0) * 100.0) / total_votes)
+        return round((upvotes * 100.0) / total_votes)
+
+@event.listens_for(db.session, 'before_flush')
+def _resolve_keywords(session, flush_context, instances):
+    """Keep keyword_tags in step with the keywords string, however it was assigned"""
+    for obj in list(session.new) + list(session.dirty):
+        names = vars(obj).pop('_keyword_names', None) if isinstance(obj, Article) else None
+        if names is not None:
+            obj.keyword_tags = Keyword.get_or_create_all(names)
+
+class RelatedArticle(db.Model):
+    # Precomputed most similar articles, maintained by related.py. The primary key
+    # makes an article's list a single ordered index range.
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 is the most similar
+    related_id = db.Column(db.Integer, db.ForeignKey('article.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)  # Cosine similarity of the TF-IDF vectors
 
 class SearchLog(db.Model):
+    # One row per distinct (normalized) search term, updated with an upsert
     id = db.Column(db.Integer, primary_key=True)
     term = db.Column(db.String(100), nullable=False)
-    results_count = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    normalized_term = db.Column(db.String(100), nullable=False, unique=True)
+    search_count = db.Column(db.Integer, nullable=False, default=1, index=True)
+    results_count = db.Column(db.Integer, default=0)  # Results returned by the latest search
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Time of the latest search
     ip_address = db.Column(db.String(45))  # To accommodate IPv6 addresses
     
+    @staticmethod
+    def normalize_term(term):
+        """Key used to group searches for the same term"""
+        return term.strip().lower()[:100]
+    
     def to_dict(self):
         return {
             'id': self.id,
             'term': bleach.clean(self.term),
+            'search_count': self.search_count,
             'results_count': self.results_count,
             'created_at': self.created_at.isoformat()
         }
     
     @staticmethod
     def get_popular_searches(limit=10):
-        # Get search counts with case-insensitive grouping
+        # Terms are already aggregated, so this is a single indexed ordered read
         search_counts = db.session.query(
             SearchLog.term,
-            func.count(SearchLog.id).label('count'),
-            func.max(SearchLog.created_at).label('last_searched')
-        ).group_by(
-            func.lower(SearchLog.term)
+            SearchLog.search_count.label('count'),
+            SearchLog.created_at.label('last_searched')
         ).order_by(
-            desc('count'),  # Order by count descending
-            desc('last_searched')  # Then by most recent search
+            desc(SearchLog.search_count),  # Order by count descending
+            desc(SearchLog.created_at)  # Then by most recent search
         ).limit(limit).all()
         
         return search_counts
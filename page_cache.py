@@ -0,0 +1,312 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_app_context, request, make_response
+from signals import article_changed, category_changed
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCacheBackend:
+    """Per-process LRU cache holding at most ``max_entries`` values"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get_tag(self, tag):
+        return self._tags.get(tag, 0)
+
+    def set_tag(self, tag, version):
+        self._tags[tag] = version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class FileCacheBackend:
+    """Cache stored as files in ``directory``, shared by every worker on the host.
+
+    Expired entries are deleted when read, and every ``max_entries // 10`` writes
+    the directory is pruned: expired entries are removed, then the least recently
+    written ones until at most ``max_entries`` are left.
+    """
+
+    def __init__(self, directory, max_entries=1000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.tag_directory = os.path.join(directory, 'tags')
+        os.makedirs(self.tag_directory, exist_ok=True)
+        self._prune_every = max(1, max_entries // 10)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _tag_path(self, tag):
+        return os.path.join(self.tag_directory, hashlib.sha1(tag.encode()).hexdigest())
+
+    def get_tag(self, tag):
+        try:
+            with open(self._tag_path(tag)) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def set_tag(self, tag, version):
+        self._write_atomic(self._tag_path(tag), str(version).encode())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires_at = pickle.load(f)
+                if self._expired(expires_at):
+                    self._unlink(path)
+                    return None
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value, ttl=None):
+        # The expiry time is pickled first so pruning can read it without the value
+        expires_at = time.time() + ttl if ttl else None
+        data = (pickle.dumps(expires_at, protocol=pickle.HIGHEST_PROTOCOL) +
+                pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        self._write_atomic(self._path(key), data)
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self._prune_every == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            # Entry files are named by their key's sha1; skip tags and temporary files
+            if len(entry.name) != 40 or not entry.is_file():
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    expires_at = pickle.load(f)
+                mtime = entry.stat().st_mtime
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if self._expired(expires_at, now):
+                self._unlink(entry.path)
+            else:
+                entries.append((mtime, entry.path))
+
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            self._unlink(path)
+
+    @staticmethod
+    def _expired(expires_at, now=None):
+        return expires_at is not None and expires_at < (now or time.time())
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _write_atomic(self, path, data):
+        # Write to a temporary file and rename so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning('Could not write page cache entry: %s', e)
+            self._unlink(tmp_path)
+
+    def clear(self):
+        for directory in (self.directory, self.tag_directory):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    self._unlink(path)
+
+
+@contextmanager
+def _from_primary():
+    """Read from the primary database while filling the cache.
+
+    An entry is stored under the tag versions read before rendering. A page
+    rendered from a lagging replica right after an invalidation would be stored
+    as current and served stale for the whole TTL.
+    """
+    if not has_app_context():
+        yield
+        return
+    use_read_replica = g.get('use_read_replica')
+    g.use_read_replica = False
+    try:
+        yield
+    finally:
+        g.use_read_replica = use_read_replica
+
+
+class PageCache:
+    """Cache for rendered public pages and fragments, invalidated by tags.
+
+    Every entry records the version of each of its tags when it was stored.
+    ``invalidate(tag)`` bumps the tag's version, which makes every entry carrying
+    that tag stale without having to find them. Tag versions are kept by the
+    backend, so with the file backend an invalidation in one worker is seen by
+    all of them.
+
+    Configured with ``PAGE_CACHE_BACKEND`` ('memory', 'file' or None to disable),
+    ``PAGE_CACHE_TTL``, ``PAGE_CACHE_MAX_ENTRIES`` and ``PAGE_CACHE_DIR``.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 300
+        self._connected = False
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('PAGE_CACHE_TTL', 300)
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 1000)
+        app.config.setdefault('PAGE_CACHE_DIR', os.path.join(app.instance_path, 'page_cache'))
+
+        backend = app.config['PAGE_CACHE_BACKEND']
+        if backend == 'memory':
+            self.backend = MemoryCacheBackend(app.config['PAGE_CACHE_MAX_ENTRIES'])
+        elif backend == 'file':
+            self.backend = FileCacheBackend(app.config['PAGE_CACHE_DIR'], app.config['PAGE_CACHE_MAX_ENTRIES'])
+        elif backend:
+            raise ValueError(f'Unknown page cache backend: {backend}')
+        else:
+            self.backend = None
+        self.ttl = app.config['PAGE_CACHE_TTL']
+        app.extensions['page_cache'] = self
+
+        if not self._connected:
+            article_changed.connect(self._on_article_changed)
+            category_changed.connect(self._on_category_changed)
+            self._connected = True
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        version = time.time_ns()
+        for tag in tags:
+            self.backend.set_tag(tag, version)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def fragment(self, key, tags, render):
+        """Return the cached output of ``render()`` for ``key``, rendering on a miss"""
+        if self.backend is None:
+            return render()
+
+        key = f'fragment:{key}'
+        entry = self.backend.get(key)
+        if entry is not None and self._is_fresh(entry):
+            return entry['value']
+
+        # Versions are read before rendering so a concurrent invalidation wins
+        versions = self._tag_versions(tags)
+        with _from_primary():
+            value = render()
+        self.backend.set(key, {'value': value, 'tags': versions}, ttl=self.ttl)
+        return value
+
+    def cached(self, tags, query_args=()):
+        """Cache a view's successful GET responses.
+
+        ``tags`` is called with the view arguments and returns the tags the page
+        depends on. The cache key includes the endpoint, view arguments and the
+        values of the ``query_args`` the view reads; any other query parameters
+        share the same entry, so they cannot be used to fill the cache.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if self.backend is None or request.method != 'GET':
+                    return view(**kwargs)
+
+                key = self._request_key(query_args)
+                entry = self.backend.get(key)
+                if entry is not None and self._is_fresh(entry):
+                    response = make_response(entry['body'])
+                    response.mimetype = entry['mimetype']
+                    response.headers['X-Page-Cache'] = 'hit'
+                    return response
+
+                versions = self._tag_versions(tags(**kwargs))
+                with _from_primary():
+                    response = make_response(view(**kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(key, {
+                        'body': response.get_data(),
+                        'mimetype': response.mimetype,
+                        'tags': versions
+                    }, ttl=self.ttl)
+                    response.headers['X-Page-Cache'] = 'miss'
+                return response
+            return wrapper
+        return decorator
+
+    def _request_key(self, query_args):
+        view_args = sorted((request.view_args or {}).items())
+        query = [(name, request.args.getlist(name)) for name in query_args]
+        return f'page:{request.endpoint}:{view_args}:{query}'
+
+    def _tag_versions(self, tags):
+        return {tag: self.backend.get_tag(tag) for tag in tags}
+
+    def _is_fresh(self, entry):
+        return all(self.backend.get_tag(tag) == version for tag, version in entry['tags'].items())
+
+    def _on_article_changed(self, sender, article_id=None, category_ids=(), **kwargs):
+        # Listings and sidebar counts change along with the article itself
+        self.invalidate(f'article:{article_id}', 'articles', 'category-counts',
+                        *(f'category:{category_id}' for category_id in category_ids))
+
+    def _on_category_changed(self, sender, category_id=None, **kwargs):
+        self.invalidate('categories', *([f'category:{category_id}'] if category_id else []))
+
+
+page_cache = PageCache()
@@ -0,0 +1,79 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row on a page as an opaque URL-safe token"""
+    def default(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+    payload = json.dumps(values, default=default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor produced by ``encode_cursor`` for the given sort columns.
+
+    Returns None for missing or malformed cursors so callers can start from the
+    first page instead of failing.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(columns):
+        return None
+
+    decoded = []
+    for column, value in zip(columns, values):
+        if value is not None and column.type.python_type is datetime:
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                return None
+        decoded.append(value)
+    return decoded
+
+
+def keyset_condition(columns, values, descending):
+    """Rows strictly after ``values`` in the (columns...) ordering"""
+    column, rest = columns[0], columns[1:]
+    value = values[0]
+    after = column < value if descending else column > value
+    if not rest:
+        return after
+    return or_(after, and_(column == value, keyset_condition(rest, values[1:], descending)))
+
+
+def paginate_keyset(query, columns, cursor=None, limit=50, descending=True, offset=0):
+    """Fetch one page of ``query`` ordered by ``columns`` using keyset pagination.
+
+    ``columns`` must end with a unique column (usually the primary key) so the
+    ordering is total. Unlike OFFSET, the cost of a page doesn't grow with how
+    deep it is. ``offset`` is only used when there is no cursor, for jumping
+    straight to a numbered page. Returns ``(rows, next_cursor)``;
+    ``next_cursor`` is None on the last page.
+    """
+    order = [column.desc() if descending else column.asc() for column in columns]
+    values = decode_cursor(cursor, columns)
+    if values is not None:
+        query = query.filter(keyset_condition(columns, values, descending)).order_by(*order)
+    else:
+        query = query.order_by(*order).offset(offset or None)
+
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+    return rows, next_cursor
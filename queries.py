@@ -0,0 +1,109 @@
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, load_only, with_expression
+from counters import view_counter
+from extensions import db
+from models import Category, Article, Keyword, RelatedArticle, article_keyword
+from pagination import paginate_keyset
+
+# Columns needed to render an article in a listing; excludes the article body
+LISTING_COLUMNS = (Article.id, Article.title, Article.category_id, Article.created_at, Article.updated_at)
+
+
+def article_counts_subquery():
+    """Number of articles per category as a grouped subquery"""
+    return db.session.query(
+        Article.category_id,
+        func.count(Article.id).label('article_count')
+    ).group_by(Article.category_id).subquery()
+
+
+def categories_with_article_counts():
+    """All categories in display order with ``article_count`` loaded in the same query"""
+    counts = article_counts_subquery()
+    return Category.query\
+        .outerjoin(counts, counts.c.category_id == Category.id)\
+        .options(with_expression(Category.article_count, func.coalesce(counts.c.article_count, 0)))\
+        .order_by(Category.order)\
+        .all()
+
+
+def category_articles(category_id, page=1, per_page=50, cursor=None):
+    """One page of a category's articles, most recently updated first.
+
+    Only the listing columns are loaded; the article body stays in the
+    database. ``cursor`` (from the previous page) takes precedence over
+    ``page``. Returns ``(articles, next_cursor)``.
+    """
+    query = Article.query\
+        .options(load_only(*LISTING_COLUMNS))\
+        .filter(Article.category_id == category_id)
+    return paginate_keyset(
+        query,
+        [Article.updated_at, Article.id],
+        cursor=cursor,
+        limit=per_page,
+        offset=(page - 1) * per_page
+    )
+
+
+def recent_articles(limit=5):
+    """Most recently created articles with their category name joined in"""
+    return Article.query\
+        .options(load_only(*LISTING_COLUMNS), joinedload(Article.category).load_only(Category.name))\
+        .order_by(Article.created_at.desc())\
+        .limit(limit)\
+        .all()
+
+
+def article_view_count(article_id):
+    """Views of ``article_id`` including the increments not flushed yet"""
+    views = db.session.scalar(db.select(Article.views).where(Article.id == article_id))
+    return (views or 0) + view_counter.pending(article_id, 'views')
+
+
+def related_articles(article_id):
+    """Articles precomputed as most similar to ``article_id`` (see related.py), best first.
+
+    A single range read of the ``related_article`` primary key joined to the
+    articles, so nothing is scored when the page is rendered.
+    """
+    return Article.query\
+        .join(RelatedArticle, RelatedArticle.related_id == Article.id)\
+        .options(load_only(*LISTING_COLUMNS))\
+        .filter(RelatedArticle.article_id == article_id)\
+        .order_by(RelatedArticle.rank)\
+        .all()
+
+
+def category_has_articles(category_id):
+    return db.session.query(
+        Article.query.filter(Article.category_id == category_id).exists()
+    ).scalar()
+
+
+def articles_by_keyword(name, limit=50, cursor=None):
+    """One page of the articles tagged with keyword ``name``, most recently updated first.
+
+    Resolved through the keyword index rather than scanning the keyword strings.
+    Returns ``(articles, next_cursor)``; no articles for unknown keywords.
+    """
+    query = Article.query\
+        .join(article_keyword, article_keyword.c.article_id == Article.id)\
+        .join(Keyword, Keyword.id == article_keyword.c.keyword_id)\
+        .options(load_only(*LISTING_COLUMNS), joinedload(Article.category).load_only(Category.name))\
+        .filter(Keyword.name == Keyword.normalize(name))
+    return paginate_keyset(query, [Article.updated_at, Article.id], cursor=cursor, limit=limit)
+
+
+def keyword_facets(category_id=None, limit=50):
+    """``(name, article_count)`` for the most used keywords, optionally within a category"""
+    count = func.count(article_keyword.c.article_id).label('article_count')
+    query = db.session.query(Keyword.name, count)\
+        .join(article_keyword, article_keyword.c.keyword_id == Keyword.id)
+    if category_id is not None:
+        query = query.join(Article, Article.id == article_keyword.c.article_id)\
+            .filter(Article.category_id == category_id)
+    return query.group_by(Keyword.id, Keyword.name)\
+        .order_by(count.desc(), Keyword.name)\
+        .limit(limit)\
+        .all()
@@ -0,0 +1,370 @@
+import heapq
+import logging
+import math
+import sys
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import delete, func, insert, select
+from extensions import db
+from models import Article, RelatedArticle
+from page_cache import page_cache
+from signals import article_changed
+from suggestions import tokenize
+from jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+# Term counts are weighted by where the term appears
+TITLE_WEIGHT = 3.0
+KEYWORD_WEIGHT = 2.0
+BODY_WEIGHT = 1.0
+
+# Common words carry no topic. Most get a low weight from their document
+# frequency anyway, but small knowledge bases don't have enough articles for that.
+STOP_WORDS = frozenset('''
+    about after all also and any are because been before being but can could did does each for from had has
+    have her here his how into its just more most not now only other our out over she should some such than
+    that the their them then there these they this those through too under very was were what when where
+    which while who why will with would you your
+'''.split())
+
+# Articles per IN (...) list, below SQLite's default limit on bound parameters
+CHUNK_SIZE = 500
+
+
+def term_counts(title, keywords, text):
+    """Weighted counts of the terms of an article.
+
+    Stop words, words of one or two letters and numbers say little about the
+    topic and are left out.
+    """
+    counts = defaultdict(float)
+    for weight, value in ((TITLE_WEIGHT, title), (KEYWORD_WEIGHT, keywords), (BODY_WEIGHT, text)):
+        for term in tokenize(value):
+            if len(term) > 2 and not term.isdigit() and term not in STOP_WORDS:
+                counts[term] += weight
+    return counts
+
+
+def _chunks(values):
+    values = sorted(values)
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+
+class _Index:
+    """Normalized TF-IDF vectors of every article, with postings to score them.
+
+    Document frequencies follow every change, but the vectors of other
+    articles aren't recomputed when the weights of their terms shift; a full
+    rebuild brings them back in line.
+    """
+
+    def __init__(self, terms_per_article):
+        self.terms_per_article = terms_per_article
+        self.document_count = 0
+        self.frequencies = defaultdict(int)
+        self.terms = {}  # article_id -> its distinct terms, to update the frequencies on edits
+        self.owners = {}  # term used by a single article -> that article
+        self.vectors = {}
+        self.postings = defaultdict(dict)  # term -> {article_id: weight}
+
+    def count_terms(self, article_id, terms):
+        """Count ``terms`` (None once deleted) as the terms of ``article_id``.
+
+        Returns the articles that had one of the terms to themselves. Such a
+        term was left out of their vectors and now counts, so the caller
+        should recompute them.
+        """
+        for term in self.terms.pop(article_id, ()):
+            self.frequencies[term] -= 1
+            if not self.frequencies[term]:
+                del self.frequencies[term]
+                self.owners.pop(term, None)
+        if terms is None:
+            self.document_count = len(self.terms)
+            return set()
+
+        shared = set()
+        self.terms[article_id] = tuple(sys.intern(term) for term in terms)
+        self.document_count = len(self.terms)
+        for term in self.terms[article_id]:
+            self.frequencies[term] += 1
+            if self.frequencies[term] == 1:
+                self.owners[term] = article_id
+            elif self.frequencies[term] == 2:
+                owner = self.owners.pop(term, None)
+                if owner not in (None, article_id):
+                    shared.add(owner)
+        return shared
+
+    def vector(self, counts):
+        weights = {}
+        for term, count in counts.items():
+            frequency = self.frequencies.get(term, 0)
+            # Terms no other article uses can't make two articles similar, and
+            # terms every article uses get no weight
+            if frequency < 2:
+                continue
+            idf = math.log((1 + self.document_count) / (1 + frequency))
+            if idf > 0:
+                weights[term] = (1 + math.log(count)) * idf
+        top = heapq.nlargest(self.terms_per_article, weights.items(), key=lambda item: (item[1], item[0]))
+        norm = math.sqrt(sum(weight * weight for _, weight in top))
+        return {term: weight / norm for term, weight in top} if norm else {}
+
+    def add(self, article_id, vector):
+        self.remove(article_id)
+        self.vectors[article_id] = vector
+        for term, weight in vector.items():
+            self.postings[term][article_id] = weight
+
+    def remove(self, article_id):
+        for term in self.vectors.pop(article_id, {}):
+            articles = self.postings[term]
+            articles.pop(article_id, None)
+            if not articles:
+                del self.postings[term]
+
+    def scores(self, vector, exclude):
+        """Cosine similarity of ``vector`` with every article sharing a term with it"""
+        scores = defaultdict(float)
+        for term, weight in vector.items():
+            for article_id, other_weight in self.postings.get(term, {}).items():
+                scores[article_id] += weight * other_weight
+        scores.pop(exclude, None)
+        return scores
+
+
+class RelatedArticleIndex:
+    """Most similar articles of each article, precomputed into ``related_article``.
+
+    Articles are compared by the cosine similarity of TF-IDF vectors over their
+    title, keywords and text, each cut down to its ``RELATED_TERMS_PER_ARTICLE``
+    heaviest terms. The ``RELATED_ARTICLES_COUNT`` best matches scoring at
+    least ``RELATED_ARTICLES_MIN_SCORE`` are stored, so article pages read
+    them with one indexed query and nothing is scored per request.
+
+    The vectors are kept in memory. When an article changes, a background job
+    recomputes its own list and the lists it enters or leaves, and invalidates
+    the cached pages showing them. The term weights of the other articles
+    drift as the corpus changes; ``flask rebuild-related-articles`` recomputes
+    everything.
+
+    Each process only sees its own edits in its vectors, so a refresh first
+    reloads them from the database when they are older than
+    ``RELATED_INDEX_MAX_AGE`` seconds (0 never reloads). A shorter age picks up
+    other workers' edits sooner, at the cost of reading every article again.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.count = 5
+        self.min_score = 0.05
+        self.terms_per_article = 25
+        self.max_age = 60
+        self._index = None
+        self._loaded_at = None
+        self._thresholds = {}  # article_id -> score a newcomer has to reach to enter its list
+        self._lock = threading.Lock()
+        self._rebuild_queued = False
+        self._connected = False
+
+    def init_app(self, app):
+        app.config.setdefault('RELATED_ARTICLES_COUNT', 5)
+        app.config.setdefault('RELATED_ARTICLES_MIN_SCORE', 0.05)
+        app.config.setdefault('RELATED_TERMS_PER_ARTICLE', 25)
+        app.config.setdefault('RELATED_INDEX_MAX_AGE', 60)
+        self.count = int(app.config['RELATED_ARTICLES_COUNT'])
+        self.min_score = float(app.config['RELATED_ARTICLES_MIN_SCORE'])
+        self.terms_per_article = int(app.config['RELATED_TERMS_PER_ARTICLE'])
+        self.max_age = float(app.config['RELATED_INDEX_MAX_AGE'])
+        self.app = app
+        app.extensions['related_index'] = self
+
+        if not self._connected:
+            article_changed.connect(self._on_article_changed)
+            self._connected = True
+
+    def reset(self):
+        """Forget the loaded vectors; they are loaded again on the next change"""
+        with self._lock:
+            self._index = None
+            self._loaded_at = None
+            self._thresholds = {}
+
+    def rebuild(self):
+        """Recompute the related articles of every article and return how many lists changed"""
+        # Covers any rebuild queued before this one started
+        self._rebuild_queued = False
+        with self._lock:
+            self._load()
+            return len(self._save_all())
+
+    def refresh(self, article_id):
+        """Bring the stored lists up to date after ``article_id`` was added, edited or deleted"""
+        with self._lock:
+            if self._index is None or (self.max_age > 0 and time.monotonic() - self._loaded_at > self.max_age):
+                self._load()
+                if not self._thresholds:
+                    # Nothing stored yet, e.g. right after upgrading
+                    self._save_all()
+                    return
+
+            affected = set()
+            shared = self._update(article_id, self._fetch([article_id]).get(article_id), affected)
+            for other_id, row in self._fetch(shared).items():
+                self._update(other_id, row, affected)
+            # Pages listing the article show its title, so they change even if the lists don't
+            referencing = set(db.session.scalars(
+                select(RelatedArticle.article_id).where(RelatedArticle.related_id == article_id)
+            ))
+            affected.update(referencing)
+
+            lists = {other: self._neighbors(other) for other in affected if other in self._index.vectors}
+            changed = self._save(lists, deleted=() if article_id in lists else (article_id,))
+            page_cache.invalidate(*(f'article:{other}' for other in sorted(changed | referencing)))
+
+    def _load(self):
+        # Every vector depends on the document frequencies, so they are counted
+        # in a first pass rather than holding every article's term counts
+        statement = select(Article.id, Article.title, Article.keywords, Article.plain_text)\
+            .execution_options(yield_per=CHUNK_SIZE)
+        index = _Index(self.terms_per_article)
+        for row in db.session.execute(statement):
+            index.count_terms(row.id, term_counts(row.title, row.keywords, row.plain_text))
+        for row in db.session.execute(statement):
+            index.add(row.id, index.vector(term_counts(row.title, row.keywords, row.plain_text)))
+
+        table = RelatedArticle.__table__
+        stored = db.session.execute(
+            select(table.c.article_id, func.count(), func.min(table.c.score)).group_by(table.c.article_id)
+        ).all()
+        self._index = index
+        self._thresholds = {article_id: lowest if count >= self.count else self.min_score
+                            for article_id, count, lowest in stored}
+        self._loaded_at = time.monotonic()
+        logger.info('Loaded related-article vectors for %d articles', index.document_count)
+
+    def _fetch(self, article_ids):
+        """``{article_id: (title, keywords, plain_text)}`` for the articles that still exist"""
+        rows = {}
+        for chunk in _chunks(article_ids):
+            for row in db.session.execute(
+                select(Article.id, Article.title, Article.keywords, Article.plain_text).where(Article.id.in_(chunk))
+            ):
+                rows[row.id] = (row.title, row.keywords, row.plain_text)
+        return rows
+
+    def _update(self, article_id, row, affected):
+        """Recompute the vector of ``article_id`` from ``row``, or drop it when
+        ``row`` is None, and add the lists it may have been in or may now
+        belong in to ``affected``. Returns the articles to recompute next (see
+        ``_Index.count_terms``)."""
+        index = self._index
+        if article_id in index.vectors:
+            affected.update(self._candidates(index.scores(index.vectors[article_id], article_id)))
+        if row is None:
+            index.count_terms(article_id, None)
+            index.remove(article_id)
+            return set()
+
+        counts = term_counts(*row)
+        shared = index.count_terms(article_id, counts)
+        index.add(article_id, index.vector(counts))
+        affected.update(self._candidates(index.scores(index.vectors[article_id], article_id)))
+        affected.add(article_id)
+        return shared
+
+    def _neighbors(self, article_id):
+        """``(related_id, score)`` for the best matches of ``article_id``, best first"""
+        scores = self._index.scores(self._index.vectors[article_id], article_id)
+        return heapq.nsmallest(
+            self.count,
+            ((other, score) for other, score in scores.items() if score >= self.min_score),
+            key=lambda item: (-item[1], item[0])
+        )
+
+    def _candidates(self, scores):
+        """Articles whose lists a match with these scores would belong in"""
+        return {article_id for article_id, score in scores.items()
+                if score >= self._thresholds.get(article_id, self.min_score)}
+
+    def _threshold(self, neighbors):
+        return neighbors[-1][1] if len(neighbors) >= self.count else self.min_score
+
+    def _save(self, lists, deleted=()):
+        """Replace the stored lists of the articles in ``lists`` and drop those of
+        ``deleted``. Returns the articles whose related articles changed."""
+        table = RelatedArticle.__table__
+        ids = set(lists) | set(deleted)
+        old = defaultdict(list)
+        for chunk in _chunks(ids):
+            for article_id, related_id in db.session.execute(
+                select(table.c.article_id, table.c.related_id)
+                .where(table.c.article_id.in_(chunk))
+                .order_by(table.c.article_id, table.c.rank)
+            ):
+                old[article_id].append(related_id)
+            db.session.execute(delete(table).where(table.c.article_id.in_(chunk)))
+        self._insert(lists)
+        db.session.commit()
+
+        for article_id in deleted:
+            self._thresholds.pop(article_id, None)
+        self._thresholds.update((article_id, self._threshold(neighbors)) for article_id, neighbors in lists.items())
+        return {article_id for article_id in ids
+                if old[article_id] != [related_id for related_id, _ in lists.get(article_id, ())]}
+
+    def _save_all(self):
+        """Recompute and store every list. Returns the articles whose related articles changed."""
+        table = RelatedArticle.__table__
+        old = defaultdict(list)
+        for article_id, related_id in db.session.execute(
+            select(table.c.article_id, table.c.related_id).order_by(table.c.article_id, table.c.rank)
+        ):
+            old[article_id].append(related_id)
+
+        lists = {article_id: self._neighbors(article_id) for article_id in self._index.vectors}
+        db.session.execute(delete(table))
+        self._insert(lists)
+        db.session.commit()
+
+        self._thresholds = {article_id: self._threshold(neighbors) for article_id, neighbors in lists.items()}
+        changed = {article_id for article_id in set(lists) | set(old)
+                   if old[article_id] != [related_id for related_id, _ in lists.get(article_id, ())]}
+        page_cache.invalidate(*(f'article:{article_id}' for article_id in sorted(changed)))
+        logger.info('Rebuilt related articles, %d lists changed', len(changed))
+        return changed
+
+    def _insert(self, lists):
+        rows = [
+            {'article_id': article_id, 'rank': rank, 'related_id': related_id, 'score': score}
+            for article_id, neighbors in sorted(lists.items())
+            for rank, (related_id, score) in enumerate(neighbors)
+        ]
+        for start in range(0, len(rows), CHUNK_SIZE):
+            db.session.execute(insert(RelatedArticle.__table__), rows[start:start + CHUNK_SIZE])
+
+    def _on_article_changed(self, sender, article_id=None, **kwargs):
+        if article_id is not None:
+            job_queue.submit('refresh-related-articles', article_id)
+        elif not self._rebuild_queued:
+            # Many articles changed at once, e.g. a bulk import: one rebuild covers
+            # every batch sent before it starts
+            self._rebuild_queued = True
+            job_queue.submit('rebuild-related-articles')
+
+
+related_index = RelatedArticleIndex()
+
+
+@job_queue.task('refresh-related-articles')
+def refresh_related_articles(article_id):
+    related_index.refresh(article_id)
+
+
+@job_queue.task('rebuild-related-articles')
+def rebuild_related_articles():
+    related_index.rebuild()
@@ -0,0 +1,98 @@
+import threading
+from functools import lru_cache
+from bleach.css_sanitizer import CSSSanitizer
+from bleach.sanitizer import Cleaner
+
+# Bump whenever the policy below changes. Articles record the version their
+# content was sanitized with and are re-sanitized lazily when it is out of date.
+POLICY_VERSION = 2
+
+# Configure bleach to allow specific HTML tags and attributes
+ALLOWED_TAGS = [
+    'p', 'br', 'strong', 'em', 'u', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'ul', 'ol', 'li', 'blockquote', 'code', 'pre', 'hr', 'table', 'thead',
+    'tbody', 'tr', 'th', 'td', 'a', 'img', 'div', 'span'
+]
+
+ALLOWED_ATTRIBUTES = {
+    '*': ['class', 'style'],
+    'a': ['href', 'title', 'target'],
+    'img': lambda tag, name, value: _allow_image_attribute(name, value),
+    'td': ['colspan', 'rowspan'],
+    'th': ['colspan', 'rowspan', 'scope']
+}
+
+IMAGE_ATTRIBUTES = ['src', 'alt', 'title', 'width', 'height', 'class', 'style', 'sizes']
+
+ALLOWED_STYLES = [
+    'text-align', 'margin', 'padding', 'width', 'height',
+    'font-weight', 'font-style', 'text-decoration',
+    'color', 'background-color'
+]
+
+ALLOWED_PROTOCOLS = ['http', 'https', 'mailto']
+
+css_sanitizer = CSSSanitizer(allowed_css_properties=ALLOWED_STYLES)
+
+# Cleaners hold parser state, so each thread gets its own. Building one is
+# expensive, which is why they are reused instead of calling bleach.clean().
+_local = threading.local()
+
+
+def _cleaner(name, **options):
+    cleaner = getattr(_local, name, None)
+    if cleaner is None:
+        cleaner = Cleaner(**{'strip': True, 'strip_comments': True, **options})
+        setattr(_local, name, cleaner)
+    return cleaner
+
+
+def _allow_image_attribute(name, value):
+    if name == 'srcset':
+        # Responsive variants of uploads (see images.ImagePipeline); bleach
+        # doesn't check the URLs in srcset against ALLOWED_PROTOCOLS itself
+        return all(_is_image_url(candidate.split()[0]) for candidate in value.split(',') if candidate.strip())
+    return name in IMAGE_ATTRIBUTES
+
+
+def _is_image_url(url):
+    return (url.startswith('/') and not url.startswith('//')) or url.startswith(('http://', 'https://'))
+
+
+def sanitize_html(content):
+    """Article HTML reduced to the allowed tags, attributes, protocols and styles"""
+    return _cleaner(
+        'html',
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        protocols=ALLOWED_PROTOCOLS,
+        css_sanitizer=css_sanitizer
+    ).clean(content or '')
+
+
+def strip_tags(value):
+    """Plain text input (titles, names, keywords) with any markup removed"""
+    return _cleaner('text', tags=[]).clean(value or '')
+
+
+def _escape(value):
+    return _cleaner('escape', strip=False).clean(value)
+
+
+_escape_cached = lru_cache(maxsize=4096)(_escape)
+
+
+def set_escape_cache_size(size):
+    """Keep the last ``size`` results of ``escape_text`` (``ESCAPE_TEXT_CACHE_SIZE``)"""
+    global _escape_cached
+    _escape_cached = lru_cache(maxsize=size)(_escape)
+
+
+def escape_text(value):
+    """A title or name escaped for JSON responses, like ``bleach.clean(value)``.
+
+    Markup is escaped rather than stripped, so the text reads as it was typed.
+    Parsing costs far more than the lookup and search results repeat the same
+    titles and category names, so recent results are memoized.
+    """
+    return _escape_cached(value or '')
@@ -0,0 +1,242 @@
+import logging
+import re
+from sqlalchemy import text, or_
+from sqlalchemy.exc import OperationalError
+from flask import current_app
+from extensions import db
+from models import Article, Category, Keyword
+from counters import view_counter, vote_counter
+from sanitize import escape_text
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'article_fts'
+
+# Column weights used by bm25(): title matches count most, then keywords, then body
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+# Article columns in the index. The body is indexed from the derived plain text so
+# markup and attribute values don't produce matches.
+FTS_COLUMNS = ('title', 'plain_text', 'keywords')
+
+# External-content FTS5 table over the article table. The triggers keep it in sync
+# with every insert, update and delete, so no application code has to remember to.
+SCHEMA_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, plain_text, keywords,
+        content='article', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON article BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, plain_text, keywords)
+        VALUES (new.id, new.title, new.plain_text, new.keywords);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON article BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, plain_text, keywords)
+        VALUES ('delete', old.id, old.title, old.plain_text, old.keywords);
+    END""",
+    # Only fire on indexed columns so view/vote counter updates don't touch the index
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, plain_text, keywords ON article BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, plain_text, keywords)
+        VALUES ('delete', old.id, old.title, old.plain_text, old.keywords);
+        INSERT INTO {FTS_TABLE}(rowid, title, plain_text, keywords)
+        VALUES (new.id, new.title, new.plain_text, new.keywords);
+    END""",
+]
+
+DROP_STATEMENTS = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+REBUILD_STATEMENT = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def create_search_index(connection):
+    """Create the FTS table and sync triggers, then backfill from existing articles"""
+    for statement in SCHEMA_STATEMENTS:
+        connection.execute(text(statement))
+    connection.execute(text(REBUILD_STATEMENT))
+
+
+def drop_search_index(connection):
+    for statement in DROP_STATEMENTS:
+        connection.execute(text(statement))
+
+
+def _index_is_current(connection):
+    # The triggers disappear whenever the article table is recreated, in which
+    # case the index has to be rebuilt as well. So does an index created before
+    # the indexed columns last changed.
+    trigger = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = :name"
+    ), {'name': f'{FTS_TABLE}_ai'}).first()
+    columns = tuple(row[0] for row in connection.execute(text(
+        'SELECT name FROM pragma_table_info(:table)'
+    ), {'table': FTS_TABLE}))
+    return trigger is not None and columns == FTS_COLUMNS
+
+
+def ensure_search_index(app):
+    """Make sure the FTS index exists for the app's database, building it if needed.
+
+    Run by ``flask init-db``. Records whether full-text search is available in
+    ``app.extensions`` so searches can fall back to LIKE matching on other
+    engines or on SQLite builds without FTS5.
+    """
+    enabled = False
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            try:
+                with db.engine.begin() as connection:
+                    if not _index_is_current(connection):
+                        drop_search_index(connection)
+                        create_search_index(connection)
+                        logger.info('Built full-text search index')
+                enabled = True
+            except OperationalError as e:
+                logger.warning(f'Full-text search unavailable, falling back to LIKE: {e}')
+    app.extensions['search_index'] = enabled
+    return enabled
+
+
+def search_index_enabled():
+    """Whether the full-text index can be used, checked on first use rather than at startup"""
+    enabled = current_app.extensions.get('search_index')
+    if enabled is None:
+        enabled = False
+        if db.engine.dialect.name == 'sqlite':
+            try:
+                with db.engine.connect() as connection:
+                    enabled = _index_is_current(connection)
+            except OperationalError:
+                pass
+            if not enabled:
+                logger.warning('Full-text search index missing or out of date, falling back to LIKE. '
+                               'Run `flask init-db` to build it.')
+        current_app.extensions['search_index'] = enabled
+    return enabled
+
+
+def build_match_expression(query):
+    """Turn free-form user input into a safe FTS5 MATCH expression.
+
+    Every token is quoted so FTS5 operators in user input are treated as plain
+    text. The last token is a prefix match so results update as the user types.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _apply_search(statement, query, limit):
+    """Restrict an article query to matches for ``query``, best matches first"""
+    if not search_index_enabled():
+        return statement.filter(
+            or_(
+                Article.title.ilike(f'%{query}%'),
+                Article.plain_text.ilike(f'%{query}%'),
+                Article.keyword_tags.any(Keyword.name == Keyword.normalize(query))
+            )
+        ).limit(limit)
+
+    match = build_match_expression(query)
+    if match is None:
+        return None
+
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    ranked = text(
+        f'SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS rank '
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match'
+    ).bindparams(match=match).columns(id=db.Integer, rank=db.Float).subquery()
+
+    return statement.join(ranked, Article.id == ranked.c.id)\
+        .order_by(ranked.c.rank)\
+        .limit(limit)
+
+
+def search_articles(query, limit=10):
+    """Return up to ``limit`` articles matching ``query``, best matches first"""
+    statement = _apply_search(Article.query, query, limit)
+    return statement.all() if statement is not None else []
+
+
+# Fields that can be requested from /search with ``fields=``. The body is left
+# out on purpose: results only ever show the title, preview and category.
+SEARCH_RESULT_COLUMNS = {
+    'id': Article.id,
+    'title': Article.title,
+    'preview': Article.preview,
+    'keywords': Article.keywords,
+    'category_id': Article.category_id,
+    'category_name': Category.name,
+    'created_at': Article.created_at,
+    'updated_at': Article.updated_at,
+    'views': Article.views,
+    'upvotes': Article.upvotes,
+    'downvotes': Article.downvotes
+}
+
+DEFAULT_SEARCH_RESULT_FIELDS = ('id', 'title', 'preview', 'category_name', 'updated_at')
+
+
+def parse_fields(value):
+    """Requested result fields from a comma-separated list, ignoring unknown names"""
+    if not value:
+        return DEFAULT_SEARCH_RESULT_FIELDS
+    fields = tuple(dict.fromkeys(
+        name.strip() for name in value.split(',') if name.strip() in SEARCH_RESULT_COLUMNS
+    ))
+    return fields or DEFAULT_SEARCH_RESULT_FIELDS
+
+
+def _result_query(fields):
+    # The id is always needed for the pending counter lookups
+    names = tuple(dict.fromkeys(('id',) + tuple(fields)))
+    return db.session.query(*(SEARCH_RESULT_COLUMNS[name].label(name) for name in names))\
+        .select_from(Article)\
+        .join(Category, Article.category_id == Category.id)
+
+
+def search_results(query, fields=DEFAULT_SEARCH_RESULT_FIELDS, limit=10):
+    """Search results as dicts with only ``fields``, fetched in a single query"""
+    statement = _apply_search(_result_query(fields), query, limit)
+    if statement is None:
+        return []
+    return [serialize_search_result(row, fields) for row in statement.all()]
+
+
+def results_for_ids(article_ids, fields=DEFAULT_SEARCH_RESULT_FIELDS):
+    """Search results for articles found elsewhere, in the order of ``article_ids``"""
+    if not article_ids:
+        return []
+    rows = {row.id: row for row in _result_query(fields).filter(Article.id.in_(article_ids))}
+    return [serialize_search_result(rows[article_id], fields)
+            for article_id in article_ids if article_id in rows]
+
+
+def serialize_search_result(row, fields):
+    result = {}
+    for name in fields:
+        value = getattr(row, name)
+        if name in ('title', 'category_name'):
+            value = escape_text(value)
+        elif name == 'preview':
+            value = value or ''
+        elif name == 'keywords':
+            value = [k.strip() for k in value.split(',') if k.strip()] if value else []
+        elif name in ('created_at', 'updated_at'):
+            value = value.isoformat() if value else None
+        elif name == 'views':
+            value = (value or 0) + view_counter.pending(row.id, 'views')
+        elif name in ('upvotes', 'downvotes'):
+            value = (value or 0) + vote_counter.pending(row.id, name)
+        result[name] = value
+    return result
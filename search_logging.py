@@ -0,0 +1,176 @@
+import atexit
+import logging
+import queue
+import threading
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from extensions import db
+from models import SearchLog
+from signals import searches_logged
+
+logger = logging.getLogger(__name__)
+
+
+def upsert_search_logs(connection, entries):
+    """Add a batch of searches to the per-term counters.
+
+    ``entries`` are dicts with ``term``, ``results_count``, ``created_at`` and
+    ``ip_address``. Searches for the same term within the batch are coalesced
+    first, then each term is written with a single upsert on ``normalized_term``.
+    """
+    rows = {}
+    for entry in entries:
+        key = SearchLog.normalize_term(entry['term'])
+        if not key:
+            continue
+        row = rows.get(key)
+        if row is None:
+            rows[key] = dict(entry, term=entry['term'][:100], normalized_term=key, search_count=1)
+        else:
+            # Later searches win for everything except the count
+            row.update(entry, term=entry['term'][:100], search_count=row['search_count'] + 1)
+    if not rows:
+        return
+
+    table = SearchLog.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.normalized_term],
+            set_={
+                'term': stmt.excluded.term,
+                'search_count': table.c.search_count + stmt.excluded.search_count,
+                'results_count': stmt.excluded.results_count,
+                'created_at': stmt.excluded.created_at,
+                'ip_address': stmt.excluded.ip_address,
+            }
+        )
+        connection.execute(stmt, list(rows.values()))
+        return
+
+    # Engines without ON CONFLICT: update in place, insert the terms that were missing
+    for row in rows.values():
+        result = connection.execute(
+            table.update()
+            .where(table.c.normalized_term == row['normalized_term'])
+            .values(
+                term=row['term'],
+                search_count=table.c.search_count + row['search_count'],
+                results_count=row['results_count'],
+                created_at=row['created_at'],
+                ip_address=row['ip_address'],
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+class SearchLogQueue:
+    """Writes search log entries off the request path.
+
+    Entries are queued and a background thread upserts them in batches every
+    ``SEARCH_LOG_FLUSH_INTERVAL`` seconds, or sooner once ``SEARCH_LOG_BATCH_SIZE``
+    entries are waiting. If the queue is full, entries are dropped rather than slowing down
+    searches. With ``SEARCH_LOG_ASYNC`` disabled every entry is written inline.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.async_enabled = True
+        self.batch_size = 100
+        self.flush_interval = 2.0
+        self._queue = queue.Queue()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_LOG_ASYNC', True)
+        app.config.setdefault('SEARCH_LOG_BATCH_SIZE', 100)
+        app.config.setdefault('SEARCH_LOG_FLUSH_INTERVAL', 2.0)
+        app.config.setdefault('SEARCH_LOG_QUEUE_SIZE', 10000)
+        self.async_enabled = app.config['SEARCH_LOG_ASYNC']
+        self.batch_size = int(app.config['SEARCH_LOG_BATCH_SIZE'])
+        self.flush_interval = float(app.config['SEARCH_LOG_FLUSH_INTERVAL'])
+        self._queue = queue.Queue(maxsize=int(app.config['SEARCH_LOG_QUEUE_SIZE']))
+        self.app = app
+        app.extensions['search_log_queue'] = self
+
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    def log(self, term, results_count, ip_address=None):
+        entry = {
+            'term': term,
+            'results_count': results_count,
+            'created_at': datetime.utcnow(),
+            'ip_address': ip_address,
+        }
+
+        if not self.async_enabled:
+            self._write([entry])
+            return
+
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            logger.warning(f"Search log queue full, dropping entry for '{term}'")
+            return
+
+        self._ensure_worker()
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write everything that is currently queued"""
+        with self._flush_lock:
+            while True:
+                batch = self._take(self.batch_size)
+                if not batch:
+                    return
+                self._write_batch(batch)
+
+    def _take(self, limit):
+        batch = []
+        try:
+            while len(batch) < limit:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write_batch(self, batch):
+        try:
+            self._write(batch)
+        except Exception as e:
+            logger.error(f'Error logging {len(batch)} searches: {e}')
+
+    def _write(self, entries):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                upsert_search_logs(connection, entries)
+        searches_logged.send(self.app, count=len(entries))
+
+    def _ensure_worker(self):
+        # Started lazily so that forked workers each get their own writer thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='search-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+search_log_queue = SearchLogQueue()
@@ -0,0 +1,19 @@
+from blinker import Namespace
+
+# Content signals, sent with the Flask app as the sender after the write has been
+# committed. Caches and derived data subscribe to these instead of being called
+# from every handler that changes content.
+_signals = Namespace()
+
+# article_id=<int or None when several articles changed>, category_ids=<set of affected category ids>
+article_changed = _signals.signal('article-changed')
+
+# category_id=<int or None when several categories changed>
+category_changed = _signals.signal('category-changed')
+
+# table=<str>, totals={column: amount} and rows={(row id, column): amount} for each
+# batch of counter increments written
+counters_flushed = _signals.signal('counters-flushed')
+
+# count=<int> searches written to the search log
+searches_logged = _signals.signal('searches-logged')
@@ -1,4 +1,7 @@
 $(document).ready(function() {
+    // srcset and sizes of uploaded images, by location, added to the <img> once inserted
+    const responsiveImages = {};
+
     // Initialize TinyMCE for all rich editors
     tinymce.init({
         selector: '.rich-editor',
@@ -21,8 +24,25 @@ $(document).ready(function() {
         relative_urls: false,
         remove_script_host: false,
         image_advtab: true,
-        images_upload_url: '/admin/upload',
-        images_upload_credentials: true,
+        images_upload_handler: function(blobInfo) {
+            const formData = new FormData();
+            formData.append('file', blobInfo.blob(), blobInfo.filename());
+            return fetch('/admin/upload', {
+                method: 'POST',
+                body: formData,
+                credentials: 'same-origin'
+            }).then(function(response) {
+                return response.json().then(function(image) {
+                    if (!response.ok) {
+                        throw { message: image.error || 'Image upload failed', remove: true };
+                    }
+                    if (image.srcset) {
+                        responsiveImages[image.location] = image;
+                    }
+                    return image.location;
+                });
+            });
+        },
         automatic_uploads: true,
         content_style: `
             @import url("/static/css/article.css");
@@ -50,6 +70,14 @@ $(document).ready(function() {
             editor.on('change', function() {
                 editor.save();
             });
+            editor.on('SetContent NodeChange BeforeGetContent', function() {
+                editor.dom.select('img:not([srcset])').forEach(function(img) {
+                    const image = responsiveImages[img.getAttribute('src')];
+                    if (image) {
+                        editor.dom.setAttribs(img, { srcset: image.srcset, sizes: image.sizes });
+                    }
+                });
+            });
         }
     });
 
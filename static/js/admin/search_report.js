@@ -1,105 +1,141 @@
 $(document).ready(function() {
-    // Initialize variables
-    let currentData = [];
+    const FILTER_DELAY = 300;
+
+    // Current filters; pages are fetched from the server with these applied
+    const filters = {
+        since: '',
+        q: '',
+        no_results: false,
+        sort: 'created_at',
+        order: 'desc'
+    };
+    let nextCursor = null;
+    let filterTimeout;
+    let requestId = 0;
     
     // Function to format date
     function formatDate(date) {
         return new Date(date).toLocaleString();
     }
+
+    function queryParams(extra) {
+        const params = $.extend({}, filters, extra);
+        Object.keys(params).forEach(function(key) {
+            if (params[key] === '' || params[key] === false || params[key] === null) {
+                delete params[key];
+            }
+        });
+        return params;
+    }
     
-    // Function to update table with filtered data
-    function updateTable(data) {
+    // Function to append a page of rows to the table
+    function appendRows(searches) {
         const $tbody = $('#searchTable tbody');
-        $tbody.empty();
         
-        data.forEach(function(search) {
+        searches.forEach(function(search) {
             $tbody.append(`
                 <tr>
                     <td>${$('<div>').text(search.term).html()}</td>
+                    <td>${search.search_count}</td>
                     <td>${search.results_count}</td>
                     <td>${formatDate(search.created_at)}</td>
-                    <td>${$('<div>').text(search.ip_address).html()}</td>
+                    <td>${$('<div>').text(search.ip_address || '').html()}</td>
                 </tr>
             `);
         });
-        
-        // Update statistics
-        const totalSearches = data.length;
-        const totalResults = data.reduce((sum, search) => sum + search.results_count, 0);
-        const avgResults = totalSearches > 0 ? (totalResults / totalSearches).toFixed(1) : '0.0';
-        const noResults = data.filter(search => search.results_count === 0).length;
-        const noResultsRate = totalSearches > 0 ? ((noResults / totalSearches) * 100).toFixed(1) : '0.0';
-        
-        $('#totalSearches').text(totalSearches);
-        $('#avgResults').text(avgResults);
-        $('#noResultsRate').text(noResultsRate + '%');
+    }
+
+    function updateSummary(summary) {
+        $('#totalSearches').text(summary.total_searches);
+        $('#avgResults').text(summary.avg_results.toFixed(1));
+        $('#noResultsRate').text(summary.no_results_rate.toFixed(1) + '%');
+    }
+
+    // Load the first page for the current filters, or the next page
+    function loadPage(append) {
+        const currentRequest = ++requestId;
+        const params = queryParams(append ? { cursor: nextCursor } : {});
+
+        $.get('/admin/api/search-logs', params, function(data) {
+            // Ignore responses for filters that have since changed
+            if (currentRequest !== requestId) {
+                return;
+            }
+            if (!append) {
+                $('#searchTable tbody').empty();
+            }
+            if (data.summary) {
+                updateSummary(data.summary);
+            }
+            appendRows(data.items);
+            nextCursor = data.next_cursor;
+            $('#loadMore').toggleClass('d-none', !nextCursor);
+        });
     }
     
     // Filter searches based on search term
     $('#searchFilter').on('input', function() {
-        const searchTerm = $(this).val().toLowerCase();
-        const filteredData = currentData.filter(search => 
-            search.term.toLowerCase().includes(searchTerm)
-        );
-        updateTable(filteredData);
+        clearTimeout(filterTimeout);
+        const term = $(this).val().trim();
+        filterTimeout = setTimeout(function() {
+            filters.q = term;
+            loadPage(false);
+        }, FILTER_DELAY);
+    });
+
+    $('#noResultsOnly').on('change', function() {
+        filters.no_results = $(this).is(':checked');
+        loadPage(false);
     });
     
     // Time period filters
-    function filterByDays(days) {
-        const now = new Date();
-        const cutoff = new Date(now - (days * 24 * 60 * 60 * 1000));
-        
-        return currentData.filter(search => 
-            new Date(search.created_at) > cutoff
-        );
+    function sinceDays(days) {
+        return new Date(Date.now() - (days * 24 * 60 * 60 * 1000)).toISOString().slice(0, 19);
     }
     
     $('#last7Days').click(function() {
         $(this).addClass('active').siblings().removeClass('active');
-        updateTable(filterByDays(7));
+        filters.since = sinceDays(7);
+        loadPage(false);
     });
     
     $('#last30Days').click(function() {
         $(this).addClass('active').siblings().removeClass('active');
-        updateTable(filterByDays(30));
+        filters.since = sinceDays(30);
+        loadPage(false);
     });
     
     $('#allTime').click(function() {
         $(this).addClass('active').siblings().removeClass('active');
-        updateTable(currentData);
+        filters.since = '';
+        loadPage(false);
+    });
+
+    // Sort by clicking a column header; clicking again flips the direction
+    $('#searchTable th.sortable').css('cursor', 'pointer').click(function() {
+        const sort = $(this).data('sort');
+        if (filters.sort === sort) {
+            filters.order = filters.order === 'desc' ? 'asc' : 'desc';
+        } else {
+            filters.sort = sort;
+            filters.order = 'desc';
+        }
+        loadPage(false);
+    });
+
+    $('#loadMore').click(function() {
+        loadPage(true);
     });
     
-    // Export to CSV
+    // Export to CSV; the server streams every row matching the current filters
     $('#exportCsv').click(function() {
-        const rows = [
-            ['Search Term', 'Results', 'Date', 'IP Address']
-        ];
-        
-        currentData.forEach(function(search) {
-            rows.push([
-                search.term,
-                search.results_count,
-                formatDate(search.created_at),
-                search.ip_address
-            ]);
-        });
-        
-        let csvContent = "data:text/csv;charset=utf-8," + 
-            rows.map(row => row.map(cell => `"${cell}"`).join(",")).join("\n");
-            
-        const encodedUri = encodeURI(csvContent);
-        const link = document.createElement("a");
-        link.setAttribute("href", encodedUri);
-        link.setAttribute("download", "search_report.csv");
-        document.body.appendChild(link);
-        link.click();
-        document.body.removeChild(link);
+        const params = queryParams({});
+        delete params.sort;
+        delete params.order;
+        window.location = '/admin/api/search-logs/export.csv?' + $.param(params);
     });
     
     // Load initial data
-    $.get('/admin/api/search-logs', function(data) {
-        currentData = data;
-        updateTable(currentData);
-        $('#allTime').addClass('active');
-    });
+    $('#allTime').addClass('active');
+    loadPage(false);
 });
@@ -1,6 +1,7 @@
 $(document).ready(function() {
     // Constants
     const SEARCH_DELAY = 300;
+    const SUGGEST_DELAY = 100;
     const MAX_QUERY_LENGTH = 100;
     const MIN_QUERY_LENGTH = 2;
     
@@ -9,8 +10,11 @@ $(document).ready(function() {
     const $searchInput = $('#search-input');
     const $searchResults = $('#search-results');
     const $resultsList = $('#results-list');
+    const $suggestions = $('#search-suggestions');
     
     let searchTimeout;
+    let suggestTimeout;
+    let suggestRequest;
     let lastLoggedSearch = '';
 
     // Function to sanitize user input
@@ -102,6 +106,20 @@ $(document).ready(function() {
         });
     }
 
+    // Function to fill the autocomplete list with matching article titles
+    function updateSuggestions(query) {
+        if (suggestRequest) {
+            suggestRequest.abort();
+        }
+        suggestRequest = $.getJSON('/search/suggest', { q: query }, function(suggestions) {
+            $suggestions.empty();
+            suggestions.forEach(function(suggestion) {
+                // .val() sets the value as text, so titles are never parsed as HTML
+                $suggestions.append($('<option>').val(suggestion.title));
+            });
+        });
+    }
+
     // Handle search form submission
     $searchForm.on('submit', function(e) {
         e.preventDefault();
@@ -113,9 +131,14 @@ $(document).ready(function() {
     // Handle search input with debouncing
     $searchInput.on('input', function() {
         clearTimeout(searchTimeout);
+        clearTimeout(suggestTimeout);
         const query = $(this).val().trim();
         
         if (query.length >= MIN_QUERY_LENGTH) {
+            // Suggestions are cheap on the server, so they only wait for a short pause
+            suggestTimeout = setTimeout(function() {
+                updateSuggestions(query);
+            }, SUGGEST_DELAY);
             searchTimeout = setTimeout(function() {
                 performSearch(query, false);  // Don't log during typing
             }, SEARCH_DELAY);
@@ -0,0 +1,140 @@
+import threading
+import time
+from sqlalchemy import case, func
+from sqlalchemy.orm import joinedload, load_only
+from extensions import db
+from models import Category, Article, SearchLog
+from counters import view_counter
+from signals import article_changed, category_changed, counters_flushed, searches_logged
+
+
+def _add_views(articles, views):
+    """Copies of the recent article dicts with ``views(article_id)`` more views"""
+    return [dict(article, views=article['views'] + views(article['id'])) for article in articles]
+
+
+class DashboardStats:
+    """Admin dashboard statistics computed with SQL aggregates and cached.
+
+    Results are cached for ``STATS_CACHE_TTL`` seconds and dropped as soon as
+    articles, categories, votes or search logs change. Flushed page views are
+    added to the cached total and recent articles instead, so a busy site doesn't
+    keep throwing the cache away.
+    """
+
+    def __init__(self):
+        self.ttl = 60
+        self._stats = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self._connected = False
+
+    def init_app(self, app):
+        app.config.setdefault('STATS_CACHE_TTL', 60)
+        self.ttl = float(app.config['STATS_CACHE_TTL'])
+        app.extensions['dashboard_stats'] = self
+
+        if not self._connected:
+            article_changed.connect(self.invalidate)
+            category_changed.connect(self.invalidate)
+            searches_logged.connect(self.invalidate)
+            counters_flushed.connect(self._on_counters_flushed)
+            self._connected = True
+
+    def get(self):
+        with self._lock:
+            stats = self._stats if time.monotonic() < self._expires_at else None
+
+        if stats is None:
+            stats = self.compute()
+            with self._lock:
+                self._stats = stats
+                self._expires_at = time.monotonic() + self.ttl
+
+        # Views that haven't been flushed yet are cheap to add on every read
+        return dict(stats,
+                    total_views=stats['total_views'] + view_counter.pending_total('views'),
+                    recent_articles=_add_views(stats['recent_articles'],
+                                               lambda article_id: view_counter.pending(article_id, 'views')))
+
+    def invalidate(self, *args, **kwargs):
+        with self._lock:
+            self._stats = None
+            self._expires_at = 0
+
+    def _on_counters_flushed(self, sender, table=None, totals=None, rows=None, **kwargs):
+        totals = totals or {}
+        rows = rows or {}
+        if 'upvotes' in totals or 'downvotes' in totals:
+            self.invalidate()
+        elif 'views' in totals:
+            with self._lock:
+                if self._stats is not None:
+                    self._stats = dict(
+                        self._stats,
+                        total_views=self._stats['total_views'] + totals['views'],
+                        recent_articles=_add_views(self._stats['recent_articles'],
+                                                   lambda article_id: rows.get((article_id, 'views'), 0))
+                    )
+
+    def compute(self):
+        total_votes = func.coalesce(Article.upvotes, 0) + func.coalesce(Article.downvotes, 0)
+        # Same as Article.get_rating_percentage(), whose round() takes halves to the
+        # even number; SQL round() doesn't, so it is done with integer arithmetic
+        quotient = func.coalesce(Article.upvotes, 0) * 100 // total_votes
+        remainder = func.coalesce(Article.upvotes, 0) * 100 % total_votes
+        rating = case(
+            (total_votes == 0, 0),
+            (remainder * 2 > total_votes, quotient + 1),
+            (remainder * 2 == total_votes, quotient + quotient % 2),
+            else_=quotient
+        )
+        total_articles, total_views, average_rating = db.session.query(
+            func.count(Article.id),
+            func.coalesce(func.sum(Article.views), 0),
+            func.coalesce(func.avg(rating), 0)
+        ).one()
+
+        total_categories = db.session.query(func.count(Category.id)).scalar() or 0
+
+        total_searches, searches_with_results = db.session.query(
+            func.coalesce(func.sum(SearchLog.search_count), 0),
+            func.coalesce(func.sum(case((SearchLog.results_count > 0, SearchLog.search_count), else_=0)), 0)
+        ).one()
+
+        recent_articles = Article.query.options(
+            load_only(Article.id, Article.title, Article.views, Article.upvotes,
+                      Article.downvotes, Article.created_at, Article.updated_at),
+            joinedload(Article.category).load_only(Category.name)
+        ).order_by(Article.created_at.desc()).limit(5).all()
+
+        return {
+            'total_articles': total_articles,
+            'total_views': int(total_views),
+            'total_categories': total_categories,
+            'average_rating': float(average_rating),
+            'total_searches': int(total_searches),
+            'search_metrics': {
+                'with_results': int(searches_with_results),
+                'no_results': int(total_searches - searches_with_results)
+            },
+            'recent_articles': [{
+                'id': article.id,
+                'title': article.title,
+                'category_name': article.category.name,
+                'views': article.views or 0,
+                'upvotes': article.upvotes or 0,
+                'downvotes': article.downvotes or 0,
+                'rating_percentage': article.get_rating_percentage(),
+                'created_at': article.created_at,
+                'updated_at': article.updated_at
+            } for article in recent_articles],
+            'popular_searches': [{
+                'term': search.term,
+                'count': search.count,
+                'last_searched': search.last_searched
+            } for search in SearchLog.get_popular_searches(10)]
+        }
+
+
+dashboard_stats = DashboardStats()
@@ -0,0 +1,274 @@
+import bisect
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from sqlalchemy import select
+from extensions import db
+from models import Article
+from signals import article_changed
+from jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Title words rank above keywords
+TITLE_WEIGHT = 2.0
+KEYWORD_WEIGHT = 1.0
+
+
+def normalize(text):
+    """Lowercase ``text`` and strip diacritics so 'Café' matches 'cafe'"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text or ''))
+
+
+def trigrams(term):
+    # Padded like pg_trgm so short words and word starts still produce trigrams
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(term_trigrams, other_trigrams, shared):
+    return shared / (len(term_trigrams) + len(other_trigrams) - shared)
+
+
+class _Index:
+    """Terms of every article, with trigram and sorted-term lookups over them"""
+
+    def __init__(self):
+        self.titles = {}
+        self.article_terms = {}
+        self.postings = defaultdict(dict)  # term -> {article_id: weight}
+        self.term_trigrams = {}
+        self.trigram_terms = defaultdict(set)
+        self.sorted_terms = []
+
+    def add(self, article_id, title, keywords):
+        self.remove(article_id)
+        terms = {}
+        for keyword in (keywords or '').split(','):
+            for term in tokenize(keyword):
+                terms[term] = KEYWORD_WEIGHT
+        for term in tokenize(title):
+            terms[term] = TITLE_WEIGHT
+
+        self.titles[article_id] = title
+        self.article_terms[article_id] = terms
+        for term, weight in terms.items():
+            if term not in self.postings:
+                grams = trigrams(term)
+                self.term_trigrams[term] = grams
+                for gram in grams:
+                    self.trigram_terms[gram].add(term)
+                bisect.insort(self.sorted_terms, term)
+            self.postings[term][article_id] = weight
+
+    def remove(self, article_id):
+        self.titles.pop(article_id, None)
+        for term in self.article_terms.pop(article_id, {}):
+            articles = self.postings[term]
+            articles.pop(article_id, None)
+            if articles:
+                continue
+            del self.postings[term]
+            for gram in self.term_trigrams.pop(term):
+                self.trigram_terms[gram].discard(term)
+                if not self.trigram_terms[gram]:
+                    del self.trigram_terms[gram]
+            del self.sorted_terms[bisect.bisect_left(self.sorted_terms, term)]
+
+    def terms_with_prefix(self, prefix):
+        start = bisect.bisect_left(self.sorted_terms, prefix)
+        for term in self.sorted_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def similar_terms(self, token, threshold):
+        grams = trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for term in self.trigram_terms.get(gram, ()):
+                shared[term] += 1
+        for term, count in shared.items():
+            score = similarity(grams, self.term_trigrams[term], count)
+            if score >= threshold:
+                yield term, score
+
+
+class SuggestionIndex:
+    """In-memory prefix and trigram index over article titles and keywords.
+
+    Serves autocomplete suggestions and typo-tolerant matches without touching
+    the database. The index is built on first use and updated by a background
+    job on ``article_changed``. Each process keeps its own copy. Once it is
+    older than ``SUGGESTION_INDEX_MAX_AGE`` seconds, a background job rebuilds
+    it to pick up writes handled by other workers, while requests keep using
+    the old copy (0 disables rebuilding).
+    """
+
+    def __init__(self):
+        self.app = None
+        self.max_age = 300
+        self.threshold = 0.3
+        self._index = _Index()
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.RLock()
+        self._changed_during_build = None  # Articles refreshed while a build is running
+        self._rebuild_queued = False
+        self._connected = False
+
+    def init_app(self, app):
+        app.config.setdefault('SUGGESTION_INDEX_MAX_AGE', 300)
+        app.config.setdefault('SUGGESTION_SIMILARITY_THRESHOLD', 0.3)
+        self.max_age = float(app.config['SUGGESTION_INDEX_MAX_AGE'])
+        self.threshold = float(app.config['SUGGESTION_SIMILARITY_THRESHOLD'])
+        self.app = app
+        app.extensions['suggestion_index'] = self
+
+        if not self._connected:
+            article_changed.connect(self._on_article_changed)
+            self._connected = True
+
+    def build(self):
+        """Rebuild the index from every article.
+
+        The current index keeps serving until the new one is swapped in.
+        Articles refreshed in the meantime are read again before the swap, so
+        their changes aren't lost with the old index.
+        """
+        with self._build_lock:
+            with self._lock:
+                self._changed_during_build = set()
+            index = _Index()
+            with self.app.app_context():
+                rows = db.session.execute(select(Article.id, Article.title, Article.keywords)).all()
+                for article_id, title, keywords in rows:
+                    index.add(article_id, title, keywords)
+                with self._lock:
+                    changed, self._changed_during_build = self._changed_during_build, None
+                    for article_id in changed:
+                        self._apply(index, article_id, self._article_row(article_id))
+                    self._index = index
+                    self._built_at = time.monotonic()
+        logger.info('Built suggestion index for %d articles', len(rows))
+
+    def refresh_article(self, article_id):
+        row = self._article_row(article_id)
+        with self._lock:
+            self._apply(self._index, article_id, row)
+            if self._changed_during_build is not None:
+                self._changed_during_build.add(article_id)
+
+    def _article_row(self, article_id):
+        return db.session.execute(
+            select(Article.title, Article.keywords).where(Article.id == article_id)
+        ).first()
+
+    @staticmethod
+    def _apply(index, article_id, row):
+        if row is None:
+            index.remove(article_id)
+        else:
+            index.add(article_id, row.title, row.keywords)
+
+    def suggest(self, query, limit=8):
+        """Articles whose title or keywords complete ``query``, as (id, title) pairs.
+
+        Every word but the last has to match a whole word; the last one may be a
+        prefix.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        *words, prefix = tokens
+        self._check_age()
+
+        with self._lock:
+            index = self._index
+            scores = defaultdict(float)
+            for term in index.terms_with_prefix(prefix):
+                exact = 0.5 if term == prefix else 0.0
+                for article_id, weight in index.postings[term].items():
+                    scores[article_id] = max(scores[article_id], weight + exact)
+            for word in words:
+                matching = index.postings.get(word, {})
+                scores = {article_id: score + matching[article_id]
+                          for article_id, score in scores.items() if article_id in matching}
+            return self._ranked(index, scores, limit)
+
+    def fuzzy(self, query, limit=10):
+        """Articles whose terms are similar to the words of ``query``, as (id, title) pairs"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self._check_age()
+
+        with self._lock:
+            index = self._index
+            scores = defaultdict(float)
+            for token in tokens:
+                best = {}
+                for term, score in index.similar_terms(token, self.threshold):
+                    for article_id, weight in index.postings[term].items():
+                        best[article_id] = max(best.get(article_id, 0.0), score * weight)
+                for article_id, score in best.items():
+                    scores[article_id] += score
+            return self._ranked(index, scores, limit)
+
+    def _ranked(self, index, scores, limit):
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], len(index.titles[item[0]]), item[0]))
+        return [(article_id, index.titles[article_id]) for article_id, _ in ranked[:limit]]
+
+    def _check_age(self):
+        if self._built_at is None:
+            # Nothing to serve yet, so the first request builds it; concurrent ones wait for it
+            with self._build_lock:
+                if self._built_at is None:
+                    self.build()
+        elif self.max_age > 0 and time.monotonic() - self._built_at > self.max_age:
+            self.queue_rebuild()
+
+    def queue_rebuild(self):
+        """Rebuild the index in the background unless a rebuild is already queued"""
+        with self._lock:
+            if self._rebuild_queued:
+                return
+            self._rebuild_queued = True
+        job_queue.submit('rebuild-suggestions')
+
+    def _run_queued_rebuild(self):
+        # Cleared first, so changes made while this rebuild runs queue another one
+        self._rebuild_queued = False
+        self.build()
+
+    def _on_article_changed(self, sender, article_id=None, **kwargs):
+        if self._built_at is None:
+            return
+        if article_id is None:
+            # Many articles changed at once, e.g. a bulk import
+            self.queue_rebuild()
+        else:
+            job_queue.submit('refresh-suggestions', article_id)
+
+
+suggestion_index = SuggestionIndex()
+
+
+@job_queue.task('refresh-suggestions')
+def refresh_suggestions(article_id):
+    suggestion_index.refresh_article(article_id)
+
+
+@job_queue.task('rebuild-suggestions')
+def rebuild_suggestions():
+    suggestion_index._run_queued_rebuild()
@@ -12,7 +12,7 @@ logger = logging.getLogger(__name__)
 @pytest.fixture(scope='session')
 def app():
     """Create and configure a new app instance for each test."""
-    from app import app  # Import the actual app instance
+    from app import create_app
     
     # Create a temporary file to use as the test database
     db_fd, db_path = tempfile.mkstemp()
@@ -21,13 +21,17 @@ def app():
     # Generate a real password hash for 'admin123'
     password_hash = generate_password_hash('admin123')
     
-    app.config.update({
+    # Configuration has to be in place before the database engine is created
+    app = create_app({
         'TESTING': True,
         'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
         'WTF_CSRF_ENABLED': False,
         'ADMIN_USERNAME': 'admin',
         'ADMIN_PASSWORD_HASH': password_hash,
-        'SERVER_NAME': 'localhost:5000'  # Required for url_for to work
+        'SERVER_NAME': 'localhost:5000',  # Required for url_for to work
+        'VIEW_COUNTER_FLUSH_INTERVAL': 3600,  # Tests flush counters explicitly
+        'SEARCH_LOG_FLUSH_INTERVAL': 3600,
+        'JOBS_EAGER': True  # Background jobs run inline so tests can check their effects
     })
     
     yield app
@@ -42,12 +46,21 @@ def client(app):
     """Create a test client for the app."""
     return app.test_client()
 
+@pytest.fixture
+def admin_client(client):
+    """A test client with an admin session."""
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    return client
+
 @pytest.fixture(autouse=True)
 def setup_db(app):
     """Setup test database before each test"""
     with app.app_context():
         from extensions import db
+        from search_index import ensure_search_index
         db.create_all()
+        ensure_search_index(app)
         
         # Create a test category for tests that need it
         from models import Category, Article
@@ -63,9 +76,26 @@ def setup_db(app):
         db.session.add(article)
         
         db.session.commit()
+        from suggestions import suggestion_index
+        suggestion_index.build()
+        from related import related_index
+        related_index.reset()
         logger.info('Test database initialized with sample data')
         
         yield
         
+        # Write out anything still buffered before the tables go away
+        from counters import view_counter, vote_counter
+        from search_logging import search_log_queue
+        view_counter.flush()
+        vote_counter.flush()
+        search_log_queue.flush()
+        
         db.drop_all()
+        
+        # Cached statistics and pages would otherwise leak between tests
+        from stats import dashboard_stats
+        from page_cache import page_cache
+        dashboard_stats.invalidate()
+        page_cache.clear()
         logger.info('Test database cleaned up')
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from extensions import db
+from models import SearchLog
+from counters import view_counter
+
+
+def test_dashboard_data_uses_cached_stats(admin_client):
+    data = admin_client.get('/admin/dashboard-data').get_json()
+    assert data['articles_count'] >= 1
+    assert 'Test Article' in [article['title'] for article in data['recent_articles']]
+
+
+def test_dashboard_stats_invalidated_by_article_writes(admin_client):
+    before = admin_client.get('/admin/dashboard-data').get_json()['articles_count']
+    admin_client.post('/admin/articles/add', data={
+        'title': 'Another article', 'content': '<p>Body</p>', 'category_id': 1
+    })
+
+    assert admin_client.get('/admin/dashboard-data').get_json()['articles_count'] == before + 1
+
+
+def test_dashboard_views_include_pending_and_flushed_views(admin_client):
+    before = admin_client.get('/admin/dashboard-data').get_json()['total_views']
+    admin_client.get('/article/1')
+    data = admin_client.get('/admin/dashboard-data').get_json()
+    assert data['total_views'] == before + 1
+    assert data['recent_articles'][0]['views'] == 1
+
+    view_counter.flush()
+    data = admin_client.get('/admin/dashboard-data').get_json()
+    assert data['total_views'] == before + 1
+    assert data['recent_articles'][0]['views'] == 1
+
+
+def add_search_logs(app, count):
+    with app.app_context():
+        for i in range(count):
+            db.session.add(SearchLog(
+                term=f'Term {i}', normalized_term=f'term {i}', search_count=i + 1,
+                results_count=i % 2, created_at=datetime(2024, 1, 1) + timedelta(days=i)
+            ))
+        db.session.commit()
+
+
+def test_search_logs_are_paginated_with_a_cursor(app, admin_client):
+    add_search_logs(app, 5)
+
+    first = admin_client.get('/admin/api/search-logs?limit=2').get_json()
+    assert [s['term'] for s in first['items']] == ['Term 4', 'Term 3']
+    assert first['summary']['total_searches'] == 15
+
+    second = admin_client.get(f"/admin/api/search-logs?limit=2&cursor={first['next_cursor']}").get_json()
+    assert [s['term'] for s in second['items']] == ['Term 2', 'Term 1']
+    assert 'summary' not in second
+
+    third = admin_client.get(f"/admin/api/search-logs?limit=2&cursor={second['next_cursor']}").get_json()
+    assert [s['term'] for s in third['items']] == ['Term 0']
+    assert third['next_cursor'] is None
+
+
+def test_search_logs_filters_and_sorting(app, admin_client):
+    add_search_logs(app, 5)
+
+    data = admin_client.get('/admin/api/search-logs?no_results=true&since=2024-01-02&sort=search_count&order=asc').get_json()
+    assert [s['term'] for s in data['items']] == ['Term 2', 'Term 4']
+    assert data['summary']['no_results_rate'] == 100
+
+    assert admin_client.get('/admin/api/search-logs?since=yesterday').status_code == 400
+
+
+def test_search_log_export_streams_csv(app, admin_client):
+    add_search_logs(app, 3)
+
+    response = admin_client.get('/admin/api/search-logs/export.csv?q=term 1')
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.mimetype == 'text/csv'
+    assert lines[0] == 'Search Term,Searches,Results,Last Searched,IP Address'
+    assert lines[1:] == ['Term 1,2,1,2024-01-02T00:00:00,']
+
+
+def test_importing_app_module_does_not_create_app():
+    import app as app_module
+    assert 'app' not in vars(app_module)
+
+
+def test_init_and_seed_commands(app):
+    runner = app.test_cli_runner()
+    # The test database already has its tables and a category
+    assert 'run `flask db upgrade`' in runner.invoke(args=['init-db']).output
+    assert 'not adding sample data' in runner.invoke(args=['seed-db']).output
+
+
+def test_average_rating_rounds_like_the_articles(app):
+    from models import Article
+    from stats import dashboard_stats
+    with app.app_context():
+        # 12.5, 37.5, 62.5 and 66.67 percent
+        for upvotes, downvotes in [(1, 7), (3, 5), (5, 3), (2, 1)]:
+            db.session.add(Article(title='Rated', content='<p>Body</p>', category_id=1,
+                                   upvotes=upvotes, downvotes=downvotes))
+        db.session.commit()
+
+        ratings = [article.get_rating_percentage() for article in Article.query.all()]
+        assert ratings[1:] == [12, 38, 62, 67]
+        assert dashboard_stats.compute()['average_rating'] == sum(ratings) / len(ratings)
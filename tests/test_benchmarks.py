@@ -0,0 +1,44 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from benchmarks.run import compare, percentile
+
+
+def result(p95, queries, errors=0):
+    return {'latency_ms': {'p95': p95}, 'queries_per_request': {'mean': queries}, 'errors': errors}
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 95) == 7
+
+
+def test_compare_reports_slower_routes_and_extra_queries():
+    baseline = {'results': {'index': {'1': result(10.0, 2)}, 'search': {'1': result(10.0, 2)}}}
+    current = {'results': {'index': {'1': result(11.0, 3)}, 'search': {'1': result(20.0, 2, errors=1)},
+                           'article': {'1': result(50.0, 9)}}}
+
+    assert compare(baseline, current, threshold=1.25) == [
+        'index (concurrency 1): queries per request 2 -> 3',
+        'search (concurrency 1): p95 10.00 ms -> 20.00 ms',
+        'search (concurrency 1): errors 0 -> 1'
+    ]
+
+
+def test_benchmark_writes_json_report(tmp_path):
+    output = tmp_path / 'bench.json'
+    # Its own process: the benchmark creates an app, which would rebind the shared extensions
+    subprocess.run([sys.executable, '-m', 'benchmarks.run', '--articles', '20', '--search-logs', '20',
+                    '--requests', '4', '--warmup', '1', '--concurrency', '1,2', '--output', str(output)],
+                   cwd=Path(__file__).parent.parent, check=True, capture_output=True)
+
+    report = json.loads(output.read_text())
+    assert report['meta']['corpus']['articles'] == 20
+    for name in ('index', 'category', 'article', 'search', 'rate_article', 'admin.index', 'get_search_logs'):
+        assert set(report['results'][name]) == {'1', '2'}
+        assert report['results'][name]['2']['requests'] == 4
+        assert report['results'][name]['2']['errors'] == 0
+    assert report['results']['article']['1']['queries_per_request']['mean'] > 0
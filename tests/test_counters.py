@@ -0,0 +1,84 @@
+from extensions import db
+from models import Article
+from counters import view_counter, vote_counter
+from page_cache import page_cache
+from sanitize import POLICY_VERSION
+
+
+def get_views(app, article_id):
+    with app.app_context():
+        return db.session.get(Article, article_id).views
+
+
+def test_page_views_are_buffered(app, client):
+    """Viewing an article doesn't write until the counter is flushed"""
+    client.get('/article/1')
+    client.get('/article/1')
+
+    assert get_views(app, 1) == 0
+    assert view_counter.pending(1, 'views') == 2
+
+    view_counter.flush()
+
+    assert get_views(app, 1) == 2
+    assert view_counter.pending(1, 'views') == 0
+
+
+def test_view_count_includes_pending_views(app, client):
+    client.get('/article/1')
+
+    with app.app_context():
+        assert db.session.get(Article, 1).view_count == 1
+    # The second request is served from the page cache, with the current count
+    assert page_cache.backend.get(f'fragment:article:1:{POLICY_VERSION}') is not None
+    assert b'<span class="view-count">2</span>' in client.get('/article/1').data
+
+    view_counter.flush()
+
+
+def test_votes_are_written_atomically(app, client):
+    client.post('/article/1/rate', json={'vote': 'up'})
+    response = client.post('/article/1/rate', json={'vote': 'down'})
+
+    assert response.get_json() == {'upvotes': 1, 'downvotes': 1, 'rating_percentage': 50}
+    with app.app_context():
+        article = db.session.get(Article, 1)
+        assert (article.upvotes, article.downvotes) == (1, 1)
+
+
+def test_buffered_votes_are_reported_before_flush(app, client, monkeypatch):
+    monkeypatch.setattr(vote_counter, 'flush_interval', 3600)
+
+    client.post('/article/1/rate', json={'vote': 'up'})
+    response = client.post('/article/1/rate', json={'vote': 'up'})
+
+    assert response.get_json()['upvotes'] == 2
+    with app.app_context():
+        assert db.session.get(Article, 1).upvotes == 0
+
+    vote_counter.flush()
+
+    with app.app_context():
+        assert db.session.get(Article, 1).upvotes == 2
+
+
+def test_flushed_views_are_not_counted_twice(app, client, monkeypatch):
+    from signals import counters_flushed
+    client.get('/article/1')
+    client.get('/article/1')
+
+    seen = []
+
+    def record(sender, **kwargs):
+        seen.append(get_views(app, 1) + view_counter.pending(1, 'views'))
+
+    with counters_flushed.connected_to(record):
+        view_counter.flush()
+    assert seen == [2]
+
+    # A failed write puts the views back without counting them twice
+    client.get('/article/1')
+    monkeypatch.setattr('counters.retry_if_locked', lambda *args: 1 / 0)
+    view_counter.flush()
+    assert view_counter.pending(1, 'views') == 1
+    assert view_counter.pending_total('views') == 1
@@ -0,0 +1,99 @@
+from flask import Flask, jsonify, request
+from sqlalchemy import text
+from extensions import db
+from database import configure_database, database_url_from_env, init_engines, init_read_replica
+
+
+def test_sqlite_pragmas_applied_on_connect(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+            assert connection.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+
+
+def test_pool_settings_for_server_databases(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'postgres://kb@db.internal/kb')
+    monkeypatch.setenv('DATABASE_POOL_SIZE', '4')
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url_from_env()
+    configure_database(app)
+
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == 'postgresql://kb@db.internal/kb'
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert options['pool_size'] == 4
+    assert options['pool_pre_ping'] is True
+
+
+def test_public_reads_use_replica_until_client_writes(tmp_path):
+    from models import Category
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "primary.db"}',
+        DATABASE_REPLICA_URL=f'sqlite:///{tmp_path / "replica.db"}',
+        READ_REPLICA_ENDPOINTS={'names'}
+    )
+    configure_database(app)
+    db.init_app(app)
+    init_engines(app)
+    init_read_replica(app)
+
+    @app.route('/names', methods=['GET', 'POST'])
+    def names():
+        if request.method == 'POST':
+            db.session.add(Category(name='Added'))
+            db.session.commit()
+        return jsonify(sorted(c.name for c in Category.query.all()))
+
+    @app.route('/admin-names')
+    def admin_names():
+        return jsonify(sorted(c.name for c in Category.query.all()))
+
+    with app.app_context():
+        for engine, name in [(db.engine, 'Primary'), (app.extensions['read_replica'], 'Replica')]:
+            db.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(Category.__table__.insert().values(name=name))
+
+    client = app.test_client()
+    assert client.get('/names').get_json() == ['Replica']
+    assert client.get('/admin-names').get_json() == ['Primary']
+
+    # Writes go to the primary, and the client then reads its own writes
+    assert client.post('/names').get_json() == ['Added', 'Primary']
+    assert client.get('/names').get_json() == ['Added', 'Primary']
+
+
+def test_page_cache_is_filled_from_the_primary(tmp_path):
+    from models import Category
+    from page_cache import MemoryCacheBackend, PageCache
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "primary.db"}',
+        DATABASE_REPLICA_URL=f'sqlite:///{tmp_path / "replica.db"}',
+        READ_REPLICA_ENDPOINTS={'names'}
+    )
+    configure_database(app)
+    db.init_app(app)
+    init_engines(app)
+    init_read_replica(app)
+    cache = PageCache()
+    cache.backend = MemoryCacheBackend()
+
+    @app.route('/names')
+    @cache.cached(tags=lambda: ['names'])
+    def names():
+        return jsonify(sorted(c.name for c in Category.query.all()))
+
+    with app.app_context():
+        for engine, name in [(db.engine, 'Primary'), (app.extensions['read_replica'], 'Replica')]:
+            db.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(Category.__table__.insert().values(name=name))
+
+    client = app.test_client()
+    assert client.get('/names').get_json() == ['Primary']
+    assert client.get('/names').headers['X-Page-Cache'] == 'hit'
@@ -0,0 +1,80 @@
+import io
+import os
+import pytest
+from PIL import Image
+from images import image_pipeline
+from sanitize import sanitize_html
+
+
+@pytest.fixture(autouse=True)
+def image_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_pipeline, 'folder', str(tmp_path))
+
+
+def image_file(width, height, color='blue', image_format='JPEG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color=color).save(buffer, image_format)
+    buffer.seek(0)
+    return buffer
+
+
+def upload(client, data, filename='photo.jpg'):
+    return client.post('/admin/upload', data={'file': (data, filename)}, content_type='multipart/form-data')
+
+
+def test_upload_is_stored_by_content_hash_with_webp_variants(admin_client, tmp_path):
+    response = upload(admin_client, image_file(2000, 1000))
+    assert response.status_code == 200
+    image = response.get_json()
+
+    digest = image['location'].rsplit('/', 1)[1].split('.')[0]
+    assert image['location'] == f'/static/uploads/{digest[:2]}/{digest}.jpg'
+    assert image['width'] == 2000 and image['height'] == 1000
+    assert image['srcset'] == ', '.join(
+        f'/static/uploads/{digest[:2]}/{digest}-{width}w.webp {width}w' for width in (480, 960, 1600)
+    )
+    assert image['sizes'] == '(max-width: 1600px) 100vw, 1600px'
+
+    # Variants are made by a background job, which runs inline in tests
+    folder = tmp_path / digest[:2]
+    with Image.open(folder / f'{digest}-960w.webp') as variant:
+        assert variant.format == 'WEBP' and variant.size == (960, 480)
+    with Image.open(folder / f'{digest}-1600w.webp') as variant:
+        assert variant.size == (1600, 800)
+    with Image.open(folder / f'{digest}-thumb.webp') as thumbnail:
+        assert thumbnail.size == (200, 100)
+
+
+def test_duplicate_uploads_share_a_file_and_names_do_not_collide(admin_client, tmp_path):
+    first = upload(admin_client, image_file(300, 200), 'photo.jpg').get_json()
+    again = upload(admin_client, image_file(300, 200), 'copy.jpg').get_json()
+    other = upload(admin_client, image_file(300, 200, color='red'), 'photo.jpg').get_json()
+
+    assert first['location'] == again['location'] != other['location']
+    # Small images get a single full-size variant
+    assert first['srcset'].endswith('-300w.webp 300w') and ',' not in first['srcset']
+    originals = [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith('.jpg')]
+    assert len(originals) == 2
+
+
+def test_upload_rejects_files_that_are_not_images(admin_client, tmp_path):
+    response = upload(admin_client, io.BytesIO(b'<script>alert(1)</script>'), 'evil.jpg')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Not a valid image'
+    assert not os.listdir(tmp_path)
+
+
+def test_process_all_fills_in_missing_variants(admin_client, tmp_path):
+    image = upload(admin_client, image_file(600, 600)).get_json()
+    variant = tmp_path / image['srcset'].split()[0].split('/', 3)[3]
+    os.remove(variant)
+
+    assert image_pipeline.process_all() == 1
+    assert variant.exists()
+    assert image_pipeline.process_all() == 0
+
+
+def test_sanitizer_keeps_srcset_of_local_and_http_images():
+    kept = '<img src="/a.jpg" srcset="/a-480w.webp 480w, https://cdn.example.com/a.webp 960w" sizes="100vw">'
+    assert sanitize_html(kept) == kept
+    assert sanitize_html('<img src="/a.jpg" srcset="javascript:alert(1) 1x">') == '<img src="/a.jpg">'
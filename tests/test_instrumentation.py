@@ -0,0 +1,63 @@
+import json
+import logging
+from flask import Flask
+from sqlalchemy import create_engine, text
+from instrumentation import QueryInstrumentation
+
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update({'SQL_INSTRUMENTATION': True, **config})
+    instrumentation = QueryInstrumentation()
+    instrumentation.init_app(app)
+
+    engine = create_engine('sqlite://')
+    instrumentation.instrument(engine)
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE item (id INTEGER PRIMARY KEY, name TEXT)'))
+        connection.execute(text("INSERT INTO item (name) VALUES ('a'), ('b')"))
+
+    @app.route('/items')
+    def items():
+        with engine.connect() as connection:
+            names = [connection.execute(text('SELECT name FROM item WHERE id = :id'), {'id': i}).scalar()
+                     for i in (1, 2)]
+        return {'names': names}
+
+    return app
+
+
+def test_requests_report_query_count_and_time(caplog):
+    app = make_app()
+    with caplog.at_level(logging.INFO, logger='instrumentation'):
+        response = app.test_client().get('/items')
+
+    timings = response.headers.getlist('Server-Timing')
+    assert timings[0].startswith('db;dur=') and timings[0].endswith(';desc="2 queries"')
+    assert timings[1].startswith('app;dur=')
+
+    line = json.loads([r.message for r in caplog.records if r.levelno == logging.INFO][-1])
+    assert line['event'] == 'request'
+    assert line['endpoint'] == 'items' and line['status'] == 200
+    assert line['queries'] == 2
+    assert [query['statement'] for query in line['slowest']] == ['SELECT name FROM item WHERE id = ?'] * 2
+
+
+def test_slow_queries_are_logged_with_their_plan(caplog):
+    app = make_app(SQL_SLOW_QUERY_MS=0, SQL_SLOWEST_QUERIES=1)
+    with caplog.at_level(logging.INFO, logger='instrumentation'):
+        app.test_client().get('/items')
+
+    slow = [json.loads(r.message) for r in caplog.records if r.levelno == logging.WARNING]
+    slow = [query for query in slow if query['endpoint'] == 'items']
+    assert len(slow) == 2
+    assert slow[0]['plan'] == ['SEARCH item USING INTEGER PRIMARY KEY (rowid=?)']
+    request_line = json.loads([r.message for r in caplog.records if r.levelno == logging.INFO][-1])
+    assert len(request_line['slowest']) == 1
+
+
+def test_disabled_by_default():
+    app = Flask(__name__)
+    QueryInstrumentation().init_app(app)
+    app.add_url_rule('/', 'index', lambda: 'ok')
+    assert 'Server-Timing' not in app.test_client().get('/').headers
@@ -0,0 +1,78 @@
+import threading
+from flask import Flask
+from jobs import JobQueue
+
+
+def make_queue(**config):
+    app = Flask(__name__)
+    app.config.update({'JOBS_RETRY_DELAY': 0.01, **config})
+    jobs = JobQueue()
+    jobs.init_app(app)
+    return jobs
+
+
+def test_jobs_run_in_background_and_retry():
+    jobs = make_queue()
+    attempts = []
+
+    @jobs.task('flaky')
+    def flaky(value):
+        attempts.append(value)
+        if len(attempts) < 3:
+            raise RuntimeError('try again')
+
+    jobs.submit('flaky', 'x')
+    assert jobs.join(timeout=5)
+    assert attempts == ['x', 'x', 'x']
+    jobs.shutdown()
+
+
+def test_full_queue_runs_job_in_caller_thread():
+    jobs = make_queue(JOBS_WORKERS=1, JOBS_QUEUE_SIZE=1, JOBS_SUBMIT_TIMEOUT=0.01)
+    release = threading.Event()
+    threads = []
+
+    @jobs.task('record')
+    def record():
+        threads.append(threading.current_thread())
+        if threading.current_thread() is not threading.main_thread():
+            release.wait(5)
+
+    jobs.submit('record')  # Taken by the only worker
+    while not threads:
+        pass
+    jobs.submit('record')  # Fills the queue
+    jobs.submit('record')  # Runs here: no room left
+    assert threads[-1] is threading.main_thread()
+
+    release.set()
+    jobs.shutdown()
+    assert len(threads) == 3
+
+
+def test_stored_jobs_survive_restart(tmp_path):
+    store = str(tmp_path / 'jobs.db')
+    jobs = make_queue(JOBS_STORE=store, JOBS_DRAIN_TIMEOUT=0)
+    never = threading.Event()
+
+    @jobs.task('blocked')
+    def blocked(value):
+        never.wait(10)  # Stands in for a process that is killed mid-job
+
+    try:
+        jobs.submit('blocked', 1)
+        jobs.submit('blocked', 2)
+        jobs.shutdown(timeout=0)  # Exits with both jobs unfinished
+        assert {job['args'][0] for job in jobs.store.claim_pending()} == {1, 2}
+
+        # Nothing new is submitted after the restart
+        restarted = make_queue(JOBS_STORE=store)
+        ran = []
+        restarted.task('blocked')(lambda value: ran.append(value))
+        assert restarted.join(timeout=5)
+        assert sorted(ran) == [1, 2]
+        assert restarted.store.claim_pending() == []
+        restarted.shutdown()
+    finally:
+        # Lets the first queue's workers finish instead of waiting out the timeout
+        never.set()
@@ -0,0 +1,93 @@
+import gc
+import sqlite3
+import threading
+import pytest
+from sqlalchemy.exc import OperationalError
+from database import retry_if_locked
+from metrics import Metrics, metrics
+
+
+def test_counters_and_histograms_add_up_across_threads():
+    registry = Metrics()
+    hits = registry.counter('test_hits_total', 'Hits.', ('route',))
+    sizes = registry.histogram('test_size', 'Sizes.', (), buckets=(10, 100))
+
+    def record():
+        for _ in range(1000):
+            hits.inc('a"b')
+        sizes.observe(5)
+        sizes.observe(50)
+        sizes.observe(500)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lines = registry.render().splitlines()
+    assert 'test_hits_total{route="a\\"b"} 4000' in lines
+    assert 'test_size_bucket{le="10"} 4' in lines
+    assert 'test_size_bucket{le="100"} 8' in lines
+    assert 'test_size_bucket{le="+Inf"} 12' in lines
+    assert 'test_size_sum 2220' in lines
+    assert 'test_size_count 12' in lines
+
+
+def test_values_from_finished_threads_are_kept_without_their_shards():
+    registry = Metrics()
+    hits = registry.counter('test_hits_total', 'Hits.')
+
+    for _ in range(5):
+        thread = threading.Thread(target=hits.inc)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert registry._shards._all == []
+    assert 'test_hits_total 5' in registry.render().splitlines()
+
+
+def test_metrics_endpoint_requires_admin_or_token(client, monkeypatch):
+    assert client.get('/admin/metrics').status_code == 401
+    monkeypatch.setattr(metrics, 'token', 'secret')
+    assert client.get('/admin/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = client.get('/admin/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+
+def test_requests_searches_and_cache_hits_are_recorded(admin_client):
+    admin_client.get('/')
+    admin_client.get('/')
+    admin_client.get('/search?q=nothingmatchesthis&log=true')
+
+    text = admin_client.get('/admin/metrics').get_data(as_text=True)
+    assert 'kb_request_duration_seconds_bucket{endpoint="index",method="GET",le="+Inf"}' in text
+    assert 'kb_responses_total{endpoint="index",status="200"}' in text
+    assert 'kb_page_cache_requests_total{endpoint="index",result="hit"}' in text
+    assert 'kb_searches_total{submitted="true",results="none"}' in text
+
+
+def locked():
+    return OperationalError('UPDATE article', {}, sqlite3.OperationalError('database is locked'))
+
+
+def test_retry_if_locked_retries_then_gives_up():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise locked()
+        return 'done'
+
+    assert retry_if_locked(flaky, 'test', delay=0) == 'done'
+    assert len(attempts) == 3
+
+    def always_locked():
+        raise locked()
+
+    with pytest.raises(OperationalError):
+        retry_if_locked(always_locked, 'test', retries=2, delay=0)
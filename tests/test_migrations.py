@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+HEAD = 'b5e2d8f4a7c1'
+
+
+def flask(database, *args):
+    # Its own process: creating another app would rebind the shared extensions
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', FLASK_APP='app')
+    return subprocess.run([sys.executable, '-m', 'flask', *args], cwd=ROOT, env=env,
+                          check=True, capture_output=True, text=True)
+
+
+def schema(database):
+    with sqlite3.connect(database) as connection:
+        version = connection.execute('SELECT version_num FROM alembic_version').fetchone()[0]
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return version, tables
+
+
+def test_upgrade_creates_an_empty_database(tmp_path):
+    database = tmp_path / 'kb.db'
+    flask(database, 'db', 'upgrade')
+
+    version, tables = schema(database)
+    assert version == HEAD
+    assert {'category', 'article', 'search_log', 'keyword', 'article_keyword', 'related_article',
+            'article_fts'} <= tables
+    assert 'Added sample data' in flask(database, 'seed-db').stdout
+
+
+def test_models_match_the_migrations(tmp_path):
+    # The search index isn't part of the models, so it mustn't show up as removed
+    database = tmp_path / 'kb.db'
+    flask(database, 'db', 'upgrade')
+    flask(database, 'db', 'check')
+
+
+def test_init_db_stamps_the_latest_revision(tmp_path):
+    database = tmp_path / 'kb.db'
+    assert 'Initialized the database' in flask(database, 'init-db', '--seed').stdout
+    assert schema(database)[0] == HEAD
+
+    # Nothing left to upgrade, and a second init leaves the tables alone
+    flask(database, 'db', 'upgrade')
+    assert 'run `flask db upgrade`' in flask(database, 'init-db').stdout
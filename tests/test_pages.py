@@ -0,0 +1,204 @@
+import os
+
+from extensions import db
+from models import Category, Article, Keyword
+from queries import categories_with_article_counts, category_articles
+
+
+def test_categories_with_article_counts(app):
+    with app.app_context():
+        db.session.add(Category(name='Empty Category'))
+        db.session.commit()
+
+        counts = {category.name: category.article_count for category in categories_with_article_counts()}
+        assert counts['Test Category'] >= 1
+        assert counts['Empty Category'] == 0
+
+
+def test_category_listing_does_not_load_content(app):
+    with app.app_context():
+        articles, _ = category_articles(1)
+        assert articles
+        assert 'content' not in articles[0].__dict__
+
+
+def test_category_page_lists_articles_and_sidebar(app, client):
+    with app.app_context():
+        other = Category(name='Other Category')
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+
+    page = client.get(f'/category/{other_id}').get_data(as_text=True)
+    assert 'No Articles Yet' in page
+    assert 'Test Category' in page
+
+
+def test_category_page_is_paginated(app, client):
+    app.config['CATEGORY_PAGE_SIZE'] = 2
+    try:
+        with app.app_context():
+            for i in range(3):
+                db.session.add(Article(title=f'Paged article {i}', content='<p>Body</p>', category_id=1))
+            db.session.commit()
+
+        first = client.get('/category/1').get_data(as_text=True)
+        assert 'Page 1 of 2' in first
+        assert first.count('class="article-card"') == 2
+
+        second = client.get('/category/1?page=2').get_data(as_text=True)
+        assert 'Page 2 of 2' in second
+        assert second.count('class="article-card"') == 2
+
+        # Following the cursor from page 1 gives the same rows as page 2
+        with app.app_context():
+            _, cursor = category_articles(1, per_page=2)
+            by_cursor, _ = category_articles(1, per_page=2, cursor=cursor)
+            by_page, _ = category_articles(1, page=2, per_page=2)
+            assert [a.id for a in by_cursor] == [a.id for a in by_page]
+    finally:
+        app.config['CATEGORY_PAGE_SIZE'] = 50
+
+
+def test_public_pages_are_cached(client):
+    assert client.get('/').headers['X-Page-Cache'] == 'miss'
+    assert client.get('/').headers['X-Page-Cache'] == 'hit'
+    assert client.get('/category/1?page=1').headers['X-Page-Cache'] == 'miss'
+    assert client.get('/category/1?page=1').headers['X-Page-Cache'] == 'hit'
+
+
+def test_article_edit_invalidates_cached_pages(admin_client):
+    assert 'Test Article' in admin_client.get('/article/1').get_data(as_text=True)
+    admin_client.get('/category/1')
+
+    admin_client.post('/admin/articles/1/edit', data={
+        'title': 'Edited Article', 'content': '<p>New body</p>', 'category_id': 1
+    })
+
+    assert 'Edited Article' in admin_client.get('/article/1').get_data(as_text=True)
+    assert 'Edited Article' in admin_client.get('/category/1').get_data(as_text=True)
+
+
+def test_category_rename_invalidates_article_pages(admin_client):
+    admin_client.get('/article/1')
+    admin_client.post('/admin/categories/1/edit', data={'name': 'Renamed Category', 'description': ''})
+
+    assert 'Renamed Category' in admin_client.get('/article/1').get_data(as_text=True)
+
+
+def test_file_cache_backend(tmp_path):
+    from page_cache import FileCacheBackend
+
+    backend = FileCacheBackend(str(tmp_path))
+    backend.set('page:index', {'body': b'cached'}, ttl=60)
+    backend.set_tag('articles', 42)
+
+    other_worker = FileCacheBackend(str(tmp_path))
+    assert other_worker.get('page:index') == {'body': b'cached'}
+    assert other_worker.get_tag('articles') == 42
+    assert other_worker.get_tag('categories') == 0
+
+
+def test_file_cache_backend_expires_and_caps_entries(tmp_path, monkeypatch):
+    from page_cache import FileCacheBackend
+
+    backend = FileCacheBackend(str(tmp_path), max_entries=20)
+    backend.set('page:old', {'body': b'old'}, ttl=60)
+    monkeypatch.setattr('page_cache.time.time', lambda: 10 ** 10)
+    assert backend.get('page:old') is None
+    assert not os.path.exists(backend._path('page:old'))
+
+    for i in range(50):
+        backend.set(f'page:{i}', {'body': b'x'}, ttl=60)
+    # Pruned every few writes, so the cap can be exceeded by at most that many
+    assert len(os.listdir(tmp_path)) - 1 < 20 + backend._prune_every
+    backend.prune()
+    assert len(os.listdir(tmp_path)) - 1 == 20
+    assert backend.get('page:49') == {'body': b'x'}
+
+
+def test_unused_query_args_share_a_cache_entry(client):
+    assert client.get('/category/1?page=1').headers['X-Page-Cache'] == 'miss'
+    assert client.get('/category/1?page=1&utm=a').headers['X-Page-Cache'] == 'hit'
+    assert client.get('/category/1?utm=b&page=1').headers['X-Page-Cache'] == 'hit'
+    assert client.get('/category/1?page=2').headers['X-Page-Cache'] == 'miss'
+
+
+def test_conditional_get_for_listing_pages(client):
+    for url in ['/', '/category/1', '/search?q=test']:
+        response = client.get(url)
+        assert response.headers['Cache-Control'] == 'public, no-cache'
+        assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+        assert client.get(url, headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code == 304
+
+
+def test_article_etag_changes_with_content(app, client, monkeypatch):
+    # Keep the vote buffered so the ETag has to account for pending votes
+    from counters import vote_counter
+    from http_caching import article_validators
+    monkeypatch.setattr(vote_counter, 'flush_interval', 3600)
+    with app.test_request_context():
+        etag = article_validators(1).etag
+        assert article_validators(1).etag == etag
+
+        client.post('/article/1/rate', json={'vote': 'up'})
+        assert article_validators(1).etag != etag
+
+
+def test_article_revalidation_shows_the_new_view_count(client):
+    etag = client.get('/article/1').headers['ETag']
+    response = client.get('/article/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert '<span class="view-count">2</span>' in response.get_data(as_text=True)
+
+
+def test_logged_searches_are_never_answered_with_304(client):
+    etag = client.get('/search?q=test&log=true').headers.get('ETag')
+    assert etag is None
+
+
+def test_keywords_are_stored_in_keyword_table(app):
+    with app.app_context():
+        article = Article(title='Tagged', content='<p>Body</p>', category_id=1)
+        article.set_keywords(['Getting  Started', 'getting started', 'Setup'])
+        db.session.add(article)
+        db.session.commit()
+
+        assert sorted(keyword.name for keyword in article.keyword_tags) == ['getting started', 'setup']
+        assert Keyword.query.filter_by(name='setup').one().articles.count() == 1
+
+
+def test_keywords_are_only_added_with_their_article(app):
+    with app.app_context():
+        article = Article(title='Draft', content='<p>Body</p>', category_id=1, keywords='draft')
+        assert not db.session.new
+        db.session.add(article)
+        db.session.commit()
+        assert [keyword.name for keyword in article.keyword_tags] == ['draft']
+
+
+def test_keyword_facets_and_articles_by_keyword(app, client):
+    with app.app_context():
+        other = Category(name='Keyword Category')
+        db.session.add(other)
+        db.session.commit()
+        for title, category_id, keywords in [('First', 1, 'printing,network'),
+                                             ('Second', other.id, 'printing'),
+                                             ('Third', other.id, 'wifi')]:
+            db.session.add(Article(title=title, content='<p>Body</p>', category_id=category_id,
+                                   keywords=keywords))
+        db.session.commit()
+        other_id = other.id
+
+    facets = client.get('/keywords').get_json()
+    assert facets[0] == {'name': 'printing', 'count': 2}
+    assert {'name': 'wifi', 'count': 1} in facets
+    assert client.get(f'/keywords?category_id={other_id}').get_json() == [
+        {'name': 'printing', 'count': 1}, {'name': 'wifi', 'count': 1}
+    ]
+
+    listing = client.get('/keywords/Printing').get_json()
+    assert sorted(item['title'] for item in listing['items']) == ['First', 'Second']
+    assert listing['next_cursor'] is None
+    assert client.get('/keywords/unknown').get_json()['items'] == []
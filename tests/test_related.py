@@ -0,0 +1,137 @@
+from extensions import db
+from models import Article, RelatedArticle
+from queries import related_articles
+from related import related_index, term_counts
+from signals import article_changed
+
+GARDENING = '<p>Prune tomato plants, water the seedlings and compost the garden beds every spring.</p>'
+NETWORKING = '<p>Configure the router firewall, assign static addresses and restart the network switch.</p>'
+
+
+def add_article(app, title, content, keywords=None):
+    article = Article(title=title, content=content, keywords=keywords, category_id=1)
+    db.session.add(article)
+    db.session.commit()
+    article_changed.send(app, article_id=article.id, category_ids={1})
+    return article.id
+
+
+def related_ids(article_id):
+    return [article.id for article in related_articles(article_id)]
+
+
+def test_term_counts_weight_titles_and_keywords():
+    counts = term_counts('Router setup', 'router, vpn', '<p>The router in room 42</p>')
+    assert counts['router'] == 3.0 + 2.0 + 1.0
+    assert counts['vpn'] == 2.0
+    assert 'room' in counts and 'the' not in counts and 'in' not in counts and '42' not in counts
+
+
+def test_similar_articles_are_ranked_and_rendered(app, client):
+    with app.app_context():
+        tomatoes = add_article(app, 'Growing tomatoes', GARDENING, 'garden, tomato')
+        seedlings = add_article(app, 'Watering seedlings', GARDENING.replace('spring', 'summer'), 'garden')
+        router = add_article(app, 'Router firewall', NETWORKING, 'network')
+        add_article(app, 'Network switches', NETWORKING.replace('router', 'modem'), 'network')
+
+        assert related_ids(tomatoes)[0] == seedlings
+        assert router not in related_ids(tomatoes)
+        ranks = db.session.scalars(
+            db.select(RelatedArticle.rank).filter_by(article_id=tomatoes).order_by(RelatedArticle.rank)
+        ).all()
+        assert ranks == list(range(len(ranks)))
+
+    html = client.get(f'/article/{tomatoes}').get_data(as_text=True)
+    assert 'Related articles' in html
+    assert f'href="/article/{seedlings}"' in html
+    assert f'href="/article/{router}"' not in html
+
+
+def test_edits_update_the_lists_they_affect(app, client):
+    with app.app_context():
+        tomatoes = add_article(app, 'Growing tomatoes', GARDENING, 'garden')
+        router = add_article(app, 'Router firewall', NETWORKING, 'network')
+        switches = add_article(app, 'Network switches', NETWORKING.replace('router', 'modem'), 'network')
+        assert related_ids(router) == [switches]
+        # Cache the page with the current list
+        assert 'Network switches' in client.get(f'/article/{router}').get_data(as_text=True)
+
+        # Renaming the article changes the pages listing it
+        article = db.session.get(Article, switches)
+        article.title = 'Managed switches'
+        db.session.commit()
+        article_changed.send(app, article_id=switches, category_ids={1})
+        assert 'Managed switches' in client.get(f'/article/{router}').get_data(as_text=True)
+
+        # Rewriting it about gardening moves it from one list to the other
+        article.content = GARDENING.replace('spring', 'autumn')
+        article.keywords = 'garden'
+        db.session.commit()
+        article_changed.send(app, article_id=switches, category_ids={1})
+        assert related_ids(router) == []
+        assert related_ids(tomatoes) == [switches]
+        assert 'Managed switches' not in client.get(f'/article/{router}').get_data(as_text=True)
+
+        db.session.delete(article)
+        db.session.commit()
+        article_changed.send(app, article_id=switches, category_ids={1})
+        assert related_ids(tomatoes) == []
+        assert db.session.query(RelatedArticle).filter_by(article_id=switches).count() == 0
+
+
+def test_incremental_updates_find_the_same_neighbors_as_a_rebuild(app):
+    with app.app_context():
+        # Fewer articles per topic than RELATED_ARTICLES_COUNT, so every list is
+        # the rest of its topic; only the order may differ before a rebuild
+        gardening = [add_article(app, f'Garden guide {i}', GARDENING.replace('spring', word), 'garden')
+                     for i, word in enumerate(['spring', 'summer', 'autumn', 'winter', 'morning'])]
+        networking = [add_article(app, f'Network guide {i}', NETWORKING.replace('router', word), 'network')
+                      for i, word in enumerate(['router', 'modem', 'gateway'])]
+        incremental = {article_id: sorted(related_ids(article_id)) for article_id in gardening + networking}
+        for topic in (gardening, networking):
+            for article_id in topic:
+                assert incremental[article_id] == [other for other in topic if other != article_id]
+
+        related_index.rebuild()
+        assert {article_id: sorted(related_ids(article_id)) for article_id in incremental} == incremental
+
+
+def test_bulk_changes_rebuild_every_list(app):
+    with app.app_context():
+        for title, content in [('Growing tomatoes', GARDENING), ('Watering seedlings', GARDENING),
+                               ('Router firewall', NETWORKING)]:
+            db.session.add(Article(title=title, content=content, category_id=1))
+        db.session.commit()
+        article_changed.send(app, article_id=None, category_ids={1})
+
+        tomatoes, seedlings, router = db.session.scalars(
+            db.select(Article.id).where(Article.title != 'Test Article').order_by(Article.id)
+        ).all()
+        assert related_ids(tomatoes) == [seedlings]
+        assert related_ids(router) == []
+
+
+def test_stale_vectors_are_reloaded_before_a_refresh(app, monkeypatch):
+    with app.app_context():
+        tomatoes = add_article(app, 'Growing tomatoes', GARDENING, 'garden')
+        # Saved by another worker: this process never sees the signal
+        seedlings = Article(title='Watering seedlings', content=GARDENING.replace('spring', 'summer'),
+                            keywords='garden', category_id=1)
+        db.session.add(seedlings)
+        db.session.commit()
+
+        monkeypatch.setattr(related_index, '_loaded_at', related_index._loaded_at - related_index.max_age - 1)
+        router = add_article(app, 'Router firewall', NETWORKING, 'network')
+        assert related_ids(router) == []
+        assert related_ids(seedlings.id) == [tomatoes]
+
+
+def test_article_etag_follows_the_related_list(app, client):
+    from http_caching import article_validators
+    with app.app_context():
+        tomatoes = add_article(app, 'Growing tomatoes', GARDENING, 'garden')
+        with app.test_request_context():
+            etag = article_validators(tomatoes).etag
+        add_article(app, 'Watering seedlings', GARDENING.replace('spring', 'summer'), 'garden')
+        with app.test_request_context():
+            assert article_validators(tomatoes).etag != etag
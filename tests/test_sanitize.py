@@ -0,0 +1,46 @@
+from extensions import db
+from models import Article
+import bleach
+import sanitize
+from sanitize import POLICY_VERSION, escape_text
+
+
+def test_content_is_sanitized_when_assigned(app):
+    with app.app_context():
+        article = Article(title='Unsafe', category_id=1,
+                          content='<p onclick="steal()">Hi <a href="javascript:x()">there</a></p><script></script>')
+        assert article.content == '<p>Hi <a>there</a></p>'
+        assert article.content_policy_version == POLICY_VERSION
+
+
+def test_content_from_older_policy_is_resanitized_once(app, client):
+    with app.app_context():
+        table = Article.__table__
+        db.session.execute(table.update().where(table.c.id == 1).values(
+            content='<p>Old <iframe src="https://example.com"></iframe>policy</p>',
+            content_policy_version=None,
+            updated_at=table.c.updated_at
+        ))
+        db.session.commit()
+        updated_at = db.session.get(Article, 1).updated_at
+
+    page = client.get('/article/1').get_data(as_text=True)
+    assert '<p>Old policy</p>' in page
+    assert 'iframe' not in page
+
+    with app.app_context():
+        article = db.session.get(Article, 1)
+        assert article.content == '<p>Old policy</p>'
+        assert article.content_policy_version == POLICY_VERSION
+        assert article.updated_at == updated_at
+
+
+def test_escape_text_matches_bleach_and_is_memoized(monkeypatch):
+    monkeypatch.setattr(sanitize, '_escape_cached', sanitize._escape_cached)
+    sanitize.set_escape_cache_size(2)
+    for value in ['Tom & Jerry', 'VPN &amp; you', 'a <b>b</b> <script>c()</script>', 'Tom & Jerry']:
+        assert escape_text(value) == bleach.clean(value)
+    info = sanitize._escape_cached.cache_info()
+    assert (info.hits, info.maxsize, info.currsize) == (0, 2, 2)
+    assert escape_text('Tom & Jerry') == 'Tom &amp; Jerry'
+    assert sanitize._escape_cached.cache_info().hits == 1
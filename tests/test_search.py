@@ -0,0 +1,99 @@
+from extensions import db
+from models import Article
+from search_index import build_match_expression
+
+
+def add_article(title, content, keywords=None):
+    article = Article(title=title, content=content, keywords=keywords, category_id=1)
+    db.session.add(article)
+    db.session.commit()
+    return article
+
+
+def test_match_expression_quotes_tokens():
+    """User input is quoted so FTS5 operators are treated as text"""
+    assert build_match_expression('install OR "guide') == '"install" "OR" "guide"*'
+    assert build_match_expression('  ***  ') is None
+
+
+def test_search_ranks_title_matches_first(app, client):
+    with app.app_context():
+        add_article('Unrelated', '<p>Mentions printers once.</p>')
+        add_article('Printers', '<p>All about setting up hardware.</p>')
+
+    results = client.get('/search?q=printers').get_json()
+    assert [r['title'] for r in results][:2] == ['Printers', 'Unrelated']
+
+
+def test_search_prefix_match(app, client):
+    with app.app_context():
+        add_article('Configuring backups', '<p>Nightly jobs.</p>', 'storage')
+
+    results = client.get('/search?q=config').get_json()
+    assert [r['title'] for r in results] == ['Configuring backups']
+
+
+def test_search_index_follows_updates_and_deletes(app, client):
+    with app.app_context():
+        article = add_article('Old title', '<p>Body</p>')
+        article.title = 'Renamed article'
+        db.session.commit()
+        article_id = article.id
+
+    assert client.get('/search?q=old').get_json() == []
+    assert len(client.get('/search?q=renamed').get_json()) == 1
+
+    with app.app_context():
+        db.session.delete(db.session.get(Article, article_id))
+        db.session.commit()
+
+    assert client.get('/search?q=renamed').get_json() == []
+
+
+def test_search_ignores_markup_and_returns_stored_preview(app, client):
+    with app.app_context():
+        add_article('Styled', '<p class="highlight">Plain &amp; simple <strong>words</strong></p>')
+
+    assert client.get('/search?q=highlight').get_json() == []
+    results = client.get('/search?q=simple').get_json()
+    assert [r['preview'] for r in results] == ['Plain & simple words']
+
+
+def test_backfill_article_text(app):
+    with app.app_context():
+        article = add_article('Legacy', '<p>Written before previews were stored</p>')
+        updated_at = article.updated_at
+        db.session.execute(Article.__table__.update().values(
+            plain_text=None, preview=None, updated_at=Article.updated_at
+        ))
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['backfill-article-text'])
+        assert 'Updated 2 articles' in result.output
+
+        db.session.expire_all()
+        article = db.session.get(Article, article.id)
+        assert article.preview == 'Written before previews were stored'
+        assert article.updated_at == updated_at
+
+
+def test_search_results_are_compact(app, client):
+    with app.app_context():
+        add_article('Compact <script>results</script>', '<p>Long body</p>', 'speed')
+
+    results = client.get('/search?q=compact').get_json()
+    assert results == [{
+        'id': results[0]['id'],
+        'title': 'Compact &lt;script&gt;results&lt;/script&gt;',
+        'preview': 'Long body',
+        'category_name': 'Test Category',
+        'updated_at': results[0]['updated_at']
+    }]
+
+
+def test_search_fields_parameter(app, client):
+    with app.app_context():
+        add_article('Selected fields', '<p>Body</p>', 'alpha, beta')
+
+    results = client.get('/search?q=selected&fields=title,keywords,content,views').get_json()
+    assert results == [{'title': 'Selected fields', 'keywords': ['alpha', 'beta'], 'views': 0}]
@@ -0,0 +1,24 @@
+from models import SearchLog
+from search_logging import search_log_queue
+
+
+def test_searches_are_aggregated_per_term(app, client):
+    client.get('/search?q=Printer&log=true')
+    client.get('/search?q=printer &log=true')
+    client.get('/search?q=test&log=true')
+    search_log_queue.flush()
+
+    with app.app_context():
+        logs = {log.normalized_term: log for log in SearchLog.query.all()}
+        assert set(logs) == {'printer', 'test'}
+        assert logs['printer'].search_count == 2
+        assert logs['printer'].results_count == 0
+        assert logs['test'].results_count == 1
+
+
+def test_searches_are_not_logged_while_typing(app, client):
+    client.get('/search?q=printer')
+    search_log_queue.flush()
+
+    with app.app_context():
+        assert SearchLog.query.count() == 0
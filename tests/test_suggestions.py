@@ -0,0 +1,86 @@
+import time
+from extensions import db
+from models import Article
+from signals import article_changed
+from suggestions import _Index, suggestion_index, trigrams
+
+
+def add_article(app, title, keywords=None):
+    article = Article(title=title, content='<p>Body</p>', keywords=keywords, category_id=1)
+    db.session.add(article)
+    db.session.commit()
+    article_changed.send(app, article_id=article.id, category_ids={1})
+    return article.id
+
+
+def test_trigrams_are_padded():
+    assert trigrams('ab') == {'  a', ' ab', 'ab '}
+
+
+def test_suggest_completes_title_and_keyword_prefixes(app, client):
+    with app.app_context():
+        printers = add_article(app, 'Configuring printers', 'hardware')
+        add_article(app, 'Network setup', 'printers, wifi')
+
+    assert [s['title'] for s in client.get('/search/suggest?q=prin').get_json()] == \
+        ['Configuring printers', 'Network setup']
+    assert client.get('/search/suggest?q=configuring+pr').get_json() == \
+        [{'id': printers, 'title': 'Configuring printers'}]
+
+
+def test_index_follows_edits_and_deletes(app):
+    with app.app_context():
+        article_id = add_article(app, 'Original title')
+        article = db.session.get(Article, article_id)
+        article.title = 'Replacement title'
+        db.session.commit()
+        article_changed.send(app, article_id=article_id, category_ids={1})
+        assert suggestion_index.suggest('orig') == []
+        assert suggestion_index.suggest('repl') == [(article_id, 'Replacement title')]
+
+        db.session.delete(article)
+        db.session.commit()
+        article_changed.send(app, article_id=article_id, category_ids={1})
+        assert suggestion_index.suggest('repl') == []
+
+
+def test_search_falls_back_to_fuzzy_matches(app, client):
+    with app.app_context():
+        add_article(app, 'Password reset', 'account')
+
+    results = client.get('/search?q=pasword').get_json()
+    assert [r['title'] for r in results] == ['Password reset']
+
+
+def test_stale_index_is_rebuilt_once_in_the_background(app, monkeypatch):
+    with app.app_context():
+        add_article(app, 'Printer drivers')
+        submitted = []
+        monkeypatch.setattr(suggestion_index, 'max_age', 0.001)
+        monkeypatch.setattr(suggestion_index, '_rebuild_queued', False)  # Restored afterwards
+        monkeypatch.setattr('suggestions.job_queue.submit', lambda name, *args: submitted.append(name))
+        time.sleep(0.01)
+
+        # Served from the old index, with a single rebuild queued
+        assert suggestion_index.suggest('prin')
+        assert suggestion_index.suggest('driv')
+        assert submitted == ['rebuild-suggestions']
+
+
+def test_refresh_during_a_rebuild_is_kept(app, monkeypatch):
+    with app.app_context():
+        article_id = add_article(app, 'Original title')
+        add = _Index.add
+
+        def add_then_rename(index, added_id, title, keywords):
+            add(index, added_id, title, keywords)
+            if added_id == article_id and title == 'Original title':
+                # An edit is refreshed after the rebuild has read the old title
+                db.session.get(Article, article_id).title = 'Renamed title'
+                db.session.commit()
+                suggestion_index.refresh_article(article_id)
+
+        monkeypatch.setattr(_Index, 'add', add_then_rename)
+        suggestion_index.build()
+        assert suggestion_index.suggest('renamed') == [(article_id, 'Renamed title')]
+        assert suggestion_index.suggest('original') == []
@@ -0,0 +1,8 @@
+"""WSGI entry point, e.g. ``gunicorn wsgi:app``.
+
+Schema setup and seeding are not part of startup; run ``flask init-db`` (and
+``flask seed-db`` for sample data) once before starting the workers.
+"""
+from app import create_app
+
+app = create_app()